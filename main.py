@@ -2,13 +2,20 @@ import time
 import json
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Body, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 import asyncio
+import threading
 from src.agent import CdpAgent, CdpAgentClassifier
 from src.wallet import AgentWallet
+from src.admission import Overloaded
+from src.jobs import JobManager
+from src.indexer import get_indexer
+from src.simulation import TransactionRejected, get_simulator
+from src.rpc import get_rpc_pool
+from src.metrics import get_metrics
 from models.schemas import *
 load_dotenv()
 
@@ -31,31 +38,100 @@ URL_KNOWLEDGE = "https://opti-backend.vercel.app/staking"
 cdp_agent_classifier = CdpAgentClassifier()
 cdp_agent = CdpAgent(url=URL_KNOWLEDGE)
 agent_wallet = AgentWallet()
+jobs = JobManager(agent_wallet)
+approval_watcher = None
+
+metrics = get_metrics()
+HTTP_SECONDS = metrics.histogram("opti_http_request_seconds", "API latency per route (streams: until headers are sent)", ("method", "route", "status"))
+for name, agent in (("query", cdp_agent), ("risk_profile", cdp_agent_classifier)):
+    metrics.register_stats("opti_admission", agent.admission.stats, pool=name)
+metrics.register_stats("opti_response_cache", cdp_agent.cache.stats, cache="query")
+metrics.register_stats("opti_query_router", cdp_agent.router.stats)
+metrics.register_stats("opti_faucet", agent_wallet.faucet.stats)
+metrics.register_stats("opti_approvals", agent_wallet.approvals.stats)
+metrics.register_stats("opti_simulation", get_simulator().stats)
+metrics.register_stats("opti_receipts", agent_wallet.receipts.stats)
+metrics.register_stats("opti_embedding_cache", lambda: cdp_agent.knowledge.embeddings.stats() if cdp_agent.knowledge else None)
+metrics.register_stats("opti_indexer", lambda: get_indexer().cursor() if get_indexer() is not None else None)
+for index, endpoint in enumerate(get_rpc_pool().endpoints):
+    metrics.register_stats("opti_rpc_endpoint", lambda index=index: get_rpc_pool().stats()[index], endpoint=endpoint.url)
+
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # The route template, not the path, so /jobs/{job_id} stays one series.
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(time.perf_counter() - started, request.method, getattr(route, "path", "unmatched"), str(status))
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize agent when the API starts."""
+    await agent_wallet.connect()
+    await jobs.start()
+    global approval_watcher
+    approval_watcher = asyncio.create_task(agent_wallet.approvals.watch(agent_wallet.w3))
     await cdp_agent_classifier.initialize()
     await cdp_agent.initialize()
+    cdp_agent.start_refresher()
+    indexer = get_indexer()
+    if indexer is not None:
+        threading.Thread(target=indexer.run_forever, daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await cdp_agent.stop_refresher()
+    await jobs.stop()
+    if approval_watcher is not None:
+        approval_watcher.cancel()
+    await agent_wallet.close()
+
+
+@app.exception_handler(TransactionRejected)
+async def transaction_rejected(request: Request, e: TransactionRejected):
+    """Simulation caught a revert before anything was sent: answer with the decoded contract error."""
+    return JSONResponse(
+        status_code=e.status_code,
+        content={"detail": str(e), "error": e.error, "args": {key: str(value) for key, value in e.details.items()}},
+    )
+
+
+def client_id(http_request: Request):
+    return http_request.headers.get("X-Client-Id") or (http_request.client.host if http_request.client else None)
+
+
+def overloaded(e: Overloaded):
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
 
 @app.post("/generate-risk-profile")
-async def assess_risk(request: QueryRequestClassifier):
+async def assess_risk(request: QueryRequestClassifier, http_request: Request):
     """
     Endpoint to assess risk profile based on user responses.
     Returns a JSON with risk assessment level.
     """
     try:
-        response = await cdp_agent_classifier.process_query(query=request.data, user_address=request.user_address)
+        response = await cdp_agent_classifier.process_query(
+            query=request.data, user_address=request.user_address, client_id=client_id(http_request)
+        )
         parsed_response = json.loads(response)
         
         return JSONResponse(content=parsed_response)
+    except Overloaded as e:
+        raise overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/query")
-async def query_agent_sync(request: QueryRequest):
+async def query_agent_sync(request: QueryRequest, http_request: Request):
     """
     Synchronous endpoint to query the CDP agent
     """
@@ -63,7 +139,8 @@ async def query_agent_sync(request: QueryRequest):
         start_time = time.time()
         
         response = await asyncio.wait_for(
-            cdp_agent.process_query(query=request.query, thread_id=request.thread_id
+            cdp_agent.process_query(query=request.query, thread_id=request.thread_id,
+                                    client_id=client_id(http_request)
             ), timeout=30.0)
 
         parsed_response = json.loads(response) if isinstance(response, str) else response
@@ -79,19 +156,102 @@ async def query_agent_sync(request: QueryRequest):
         }
 
         return JSONResponse(content=response_json)
-        
+
+    except Overloaded as e:
+        raise overloaded(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Query processing failed: {str(e)}"
         )
         
+@app.post("/query/stream")
+async def query_agent_stream(request: QueryRequest, http_request: Request):
+    """
+    Streaming endpoint to query the CDP agent. Sends Server-Sent Events:
+    "token" and "tool_call"/"tool_result" while the agent works, then a
+    "final" event with the parsed id_project (or "error").
+    """
+    start_time = time.time()
+    events = cdp_agent.stream_query(
+        query=request.query, thread_id=request.thread_id, client_id=client_id(http_request)
+    )
+    try:
+        first = await events.__anext__()
+    except Overloaded as e:
+        raise overloaded(e)
+    except StopAsyncIteration:
+        first = None
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query processing failed: {str(e)}")
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    async def body():
+        pending = [first] if first is not None else []
+        try:
+            while True:
+                if pending:
+                    event, data = pending.pop()
+                else:
+                    event, data = await events.__anext__()
+
+                if event != "answer":
+                    yield sse(event, data)
+                    continue
+
+                parsed_response = json.loads(data) if isinstance(data, str) else data
+                yield sse("final", {
+                    "response": [{"id_project": str(parsed_response.get("id_project", ""))}],
+                    "thread_id": request.thread_id or "CDP Agent API",
+                    "processing_time": time.time() - start_time
+                })
+                return
+        except StopAsyncIteration:
+            yield sse("error", {"detail": "Agent returned no answer"})
+        except Exception as e:
+            yield sse("error", {"detail": f"Query processing failed: {str(e)}"})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def submit_job(action, request):
+    """Run the action as a background job and answer 202 with its id; poll /jobs/{id} or pass webhook_url."""
+    params = request.model_dump(exclude={"wait", "async_job", "webhook_url"})
+    try:
+        job = await jobs.submit(action, params, webhook_url=request.webhook_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(status_code=202, content={"job_id": job["id"], "status": job["status"]})
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JSONResponse(content=job)
+
+
 @app.post("/action/create-wallet")
 async def create_wallet(request: QueryUserWallet):
+    if request.async_job:
+        return await submit_job("create-wallet", request)
     await agent_wallet.create_wallet(
             user_address=request.user_address
         )
-    txhash = await agent_wallet._fund_wallet(request.user_address)
+    try:
+        txhash = await agent_wallet._fund_wallet(request.user_address, wait=request.wait)
+    except Overloaded as e:
+        # Existing wallet funded moments ago: the wallet itself is still returned.
+        txhash = str(e)
     print(txhash)
     response = {"address": await agent_wallet._check_address(request.user_address)}
     
@@ -106,39 +266,76 @@ async def get_wallet(request: QueryUserWallet):
 
 @app.post("/action/get-eth-faucet")
 async def get_eth_faucet(request: QueryUserWallet):
-    response = {"txhash": await agent_wallet._fund_wallet(request.user_address)}
+    if request.async_job:
+        return await submit_job("get-eth-faucet", request)
+    try:
+        response = {"txhash": await agent_wallet._fund_wallet(request.user_address, wait=request.wait)}
+    except Overloaded as e:
+        raise overloaded(e)
     return JSONResponse(content=response)
 
 
 @app.post("/action/mint")
 async def mint(request: QueryMint):
-    response = {"txhash": await agent_wallet.mint(request.user_address, request.asset_id, request.amount)}
+    if request.async_job:
+        return await submit_job("mint", request)
+    response = {"txhash": await agent_wallet.mint(request.user_address, request.asset_id, request.amount, wait=request.wait)}
     return JSONResponse(content=response)
 
 
 @app.post("/action/transfer")
 async def transfer(request: QueryTransfer):
-    response = {"txhash": await agent_wallet.transfer(request.user_address, request.contract_address, request.to, request.amount)}
+    if request.async_job:
+        return await submit_job("transfer", request)
+    response = {"txhash": await agent_wallet.transfer(request.user_address, request.contract_address, request.to, request.amount, wait=request.wait)}
     return JSONResponse(content=response)
 
 
 @app.post("/action/swap")
 async def swap(request: QuerySwap):
-    response = {"txhash": await agent_wallet.swap(request.user_address, request.spender, request.token_in, request.token_out, request.amount)}
+    if request.async_job:
+        return await submit_job("swap", request)
+    response = {"txhash": await agent_wallet.swap(request.user_address, request.spender, request.token_in, request.token_out, request.amount, wait=request.wait)}
     return JSONResponse(content=response)
 
 
 @app.post("/action/stake")
 async def stake(request: QueryStake):
-    response = {"txhash": await agent_wallet.stake(request.user_address, request.asset_id, request.protocol, request.spender, request.amount)}
+    if request.async_job:
+        return await submit_job("stake", request)
+    response = {"txhash": await agent_wallet.stake(request.user_address, request.asset_id, request.protocol, request.spender, request.amount, wait=request.wait)}
     return JSONResponse(content=response)
 
 @app.post("/action/unstake")
 async def unstake(request: QueryUnstake):
-    response = {"txhash": await agent_wallet.unstake(request.user_address, request.protocol)}
+    if request.async_job:
+        return await submit_job("unstake", request)
+    response = {"txhash": await agent_wallet.unstake(request.user_address, request.protocol, wait=request.wait)}
     return JSONResponse(content=response)
 
 
+@app.get("/portfolio/{user_address}")
+async def portfolio(user_address: str):
+    """Staked positions, token balances and recent activity of the user's agent wallet, from the log index."""
+    indexer = get_indexer()
+    if indexer is None:
+        raise HTTPException(status_code=503, detail="Log indexer is disabled (INDEXER_ENABLED=false)")
+    address = await agent_wallet._check_address(user_address)
+    return JSONResponse(content={
+        "address": address,
+        "positions": {protocol: str(amount) for protocol, amount in indexer.positions(address).items()},
+        "balances": {token: str(amount) for token, amount in indexer.balances(address).items()},
+        "activity": indexer.activity(address),
+        "cursor": indexer.cursor(),
+    })
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text exposition of the API, agent and chain metrics."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health_check():
     """
@@ -147,8 +344,18 @@ async def health_check():
     return {
         "status": "healthy",
         "thread_pool_info": {
-            "max_workers": cdp_agent.thread_pool._max_workers,
-            "active_threads": cdp_agent.thread_pool._work_queue.qsize()
+            "query": cdp_agent.admission.stats(),
+            "risk_profile": cdp_agent_classifier.admission.stats()
+        },
+        "query_router": cdp_agent.router.stats(),
+        "faucet": agent_wallet.faucet.stats(),
+        "approvals": agent_wallet.approvals.stats(),
+        "simulation": get_simulator().stats(),
+        "receipts": agent_wallet.receipts.stats(),
+        "rpc": get_rpc_pool().stats(),
+        "indexer": get_indexer().cursor() if get_indexer() is not None else None,
+        "response_cache": {
+            "query": cdp_agent.cache.stats()
         }
     }
     
@@ -16,17 +16,26 @@ class QueryResponse(BaseModel):
     
 class QueryUserWallet(BaseModel):
     user_address: str
+    wait: bool = True
+    async_job: bool = False
+    webhook_url: Optional[str] = None
     
 class QueryMint(BaseModel):
     user_address: str
     asset_id: str
     amount: str
+    wait: bool = True
+    async_job: bool = False
+    webhook_url: Optional[str] = None
     
 class QueryTransfer(BaseModel):
     user_address: str
     contract_address: str
     to: str
     amount: str
+    wait: bool = True
+    async_job: bool = False
+    webhook_url: Optional[str] = None
     
 class QuerySwap(BaseModel):
     user_address: str
@@ -34,6 +43,9 @@ class QuerySwap(BaseModel):
     token_in: str
     token_out: str
     amount: str
+    wait: bool = True
+    async_job: bool = False
+    webhook_url: Optional[str] = None
     
 class QueryStake(BaseModel):
     user_address: str
@@ -41,7 +53,13 @@ class QueryStake(BaseModel):
     protocol: str
     spender: str
     amount: str
+    wait: bool = True
+    async_job: bool = False
+    webhook_url: Optional[str] = None
     
 class QueryUnstake(BaseModel):
     user_address: str
-    protocol: str
\ No newline at end of file
+    protocol: str
+    wait: bool = True
+    async_job: bool = False
+    webhook_url: Optional[str] = None
\ No newline at end of file
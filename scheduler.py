@@ -1,13 +1,18 @@
 import schedule
 import time
 import pytz
-from src.rules import runner
+from src.runner import RebalanceRunner, pending_cycle
 
 utc = pytz.utc
 
 def task_periodicly():
     print("Running...")
-    runner()
+    RebalanceRunner().run()
+
+interrupted_cycle = pending_cycle()
+if interrupted_cycle is not None:
+    print(f"Resuming interrupted cycle {interrupted_cycle}...")
+    RebalanceRunner(cycle=interrupted_cycle).run()
 
 schedule.every().day.at("07:00").do(task_periodicly)
 
@@ -0,0 +1,153 @@
+import os
+import math
+import time
+import asyncio
+
+from dotenv import load_dotenv
+from src.metrics import STAGE_SECONDS
+
+load_dotenv()
+
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_PER_CLIENT = int(os.getenv("ADMISSION_PER_CLIENT", "4"))
+ADMISSION_RETRY_AFTER = float(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing: 429 when one client has too much in flight, 503 when the queue is full."""
+
+    def __init__(self, status_code, retry_after, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+        self.queued = True
+        self.started = False
+
+
+class AdmissionController:
+    """
+    Runs blocking agent calls on `executor` with at most max_concurrency at
+    a time and max_queue waiting; anything beyond that is rejected at once.
+    Calls with the same key share one execution. When every caller of a
+    queued call has gone away (timeout or disconnect) the call is dropped
+    before it starts; a call already on a worker thread runs to completion
+    and keeps its slot until then, so the pool is never oversubscribed.
+    """
+
+    def __init__(self, executor, max_concurrency, max_queue=ADMISSION_MAX_QUEUE,
+                 per_client=ADMISSION_PER_CLIENT, retry_after=ADMISSION_RETRY_AFTER):
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.per_client = per_client
+        self.retry_after = retry_after
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.rejected = {429: 0, 503: 0}
+        self.service_time = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._clients = {}
+        self._inflight = {}
+
+    async def run(self, fn, *args, key=None, client_id=None):
+        self._enter(client_id)
+        try:
+            flight = self._inflight.get(key) if key is not None else None
+            if flight is None:
+                if self.running + self.waiting >= self.max_concurrency + self.max_queue:
+                    self._reject(503, "Agent queue is full")
+                flight = _Flight(None)
+                self.waiting += 1
+                flight.task = asyncio.ensure_future(self._execute(flight, fn, args))
+                # A task cancelled before its first step never runs _execute, so dequeue on completion too.
+                flight.task.add_done_callback(lambda _: self._dequeue(flight))
+                if key is not None:
+                    self._inflight[key] = flight
+                    flight.task.add_done_callback(lambda _: self._forget(key, flight))
+                self.admitted += 1
+            else:
+                self.coalesced += 1
+
+            flight.waiters += 1
+            try:
+                return await asyncio.shield(flight.task)
+            except asyncio.CancelledError:
+                if flight.waiters == 1 and not flight.started and not flight.task.done():
+                    flight.task.cancel()
+                    self.cancelled += 1
+                raise
+            finally:
+                flight.waiters -= 1
+        finally:
+            self._leave(client_id)
+
+    def stats(self):
+        return {
+            "max_workers": self.max_concurrency,
+            "active_threads": self.running,
+            "queued": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+            "rejected_429": self.rejected[429],
+            "rejected_503": self.rejected[503],
+            "avg_service_time": self.service_time,
+        }
+
+    async def _execute(self, flight, fn, args):
+        queued_at = time.monotonic()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._dequeue(flight)
+        STAGE_SECONDS.observe(time.monotonic() - queued_at, "admission_wait")
+
+        flight.started = True
+        self.running += 1
+        started_at = time.monotonic()
+        try:
+            return await asyncio.get_event_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            elapsed = time.monotonic() - started_at
+            self.service_time = elapsed if self.service_time is None else 0.8 * self.service_time + 0.2 * elapsed
+            self.running -= 1
+            self._semaphore.release()
+
+    def _enter(self, client_id):
+        if client_id is None:
+            return
+        if self._clients.get(client_id, 0) >= self.per_client:
+            self._reject(429, f"Too many concurrent requests for client {client_id}")
+        self._clients[client_id] = self._clients.get(client_id, 0) + 1
+
+    def _leave(self, client_id):
+        if client_id is None:
+            return
+        self._clients[client_id] -= 1
+        if self._clients[client_id] == 0:
+            del self._clients[client_id]
+
+    def _dequeue(self, flight):
+        if flight.queued:
+            flight.queued = False
+            self.waiting -= 1
+
+    def _forget(self, key, flight):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    def _reject(self, status_code, detail):
+        self.rejected[status_code] += 1
+        # Rough time until a slot frees up: the queue ahead of us drained at the observed service time.
+        estimate = (self.service_time or 0) * (self.waiting + 1) / self.max_concurrency
+        raise Overloaded(status_code, math.ceil(max(self.retry_after, estimate)), detail)
@@ -1,33 +1,96 @@
+import os
+import time
+import uuid
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from typing import Optional
 import aiohttp
-import pandas as pd
 import orjson
 from fastapi import HTTPException
 from langchain.chains import RetrievalQA
-from langchain.docstore.document import Document
 from langchain.tools import Tool
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_community.embeddings import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_core.messages import HumanMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
 from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import create_react_agent
 
 from cdp_langchain.agent_toolkits import CdpToolkit
 from cdp_langchain.utils import CdpAgentkitWrapper
+from dotenv import load_dotenv
 
+from src.store import get_wallet_store
+from src.knowledge import KnowledgeBase
+from src.embeddings import CachedEmbeddings
+from src.router import QueryRouter
+from src.cache import ResponseCache, normalize
+from src.admission import AdmissionController
+from src.memory import create_checkpointer, bounded_prompt, compact_thread
+from src.metrics import get_metrics, stage
 
+load_dotenv()
+
+KNOWLEDGE_REFRESH_INTERVAL = float(os.getenv("KNOWLEDGE_REFRESH_INTERVAL", "300"))
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "64"))
+
+LLM_SECONDS = get_metrics().histogram("opti_llm_seconds", "Latency of one LLM call", ("model",))
+LLM_CALLS = get_metrics().counter("opti_llm_calls_total", "LLM calls by outcome", ("model", "outcome"))
+LLM_TOKENS = get_metrics().counter("opti_llm_tokens_total", "LLM tokens used", ("model", "kind"))
+
+
+class LLMMetrics(BaseCallbackHandler):
+    """LangChain callback that records the latency, outcome and token usage of every chat model call."""
+
+    def __init__(self):
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        self._started[run_id] = (time.perf_counter(), params.get("model_name") or params.get("model") or "unknown")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        model = self._finish(run_id, "ok")
+        if model is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if not usage and response.generations and response.generations[0]:
+            message = getattr(response.generations[0][0], "message", None)
+            metadata = getattr(message, "usage_metadata", None) or {}
+            usage = {"prompt_tokens": metadata.get("input_tokens", 0), "completion_tokens": metadata.get("output_tokens", 0)}
+        LLM_TOKENS.inc(model, "prompt", amount=usage.get("prompt_tokens") or 0)
+        LLM_TOKENS.inc(model, "completion", amount=usage.get("completion_tokens") or 0)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, "error")
+
+    def _finish(self, run_id, outcome):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return None
+        started_at, model = started
+        LLM_SECONDS.observe(time.perf_counter() - started_at, model)
+        LLM_CALLS.inc(model, outcome)
+        return model
+
+
+llm_metrics = LLMMetrics()
 
 
 class CdpAgent:
-    def __init__(self, url: str, max_workers: int = 3):
+    def __init__(self, url: str, max_workers: int = 3, refresh_interval: float = KNOWLEDGE_REFRESH_INTERVAL):
         self.url = url
         self.thread_pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.admission = AdmissionController(self.thread_pool, max_workers)
         self.agent_executor = None
         self._lock = asyncio.Lock()
         self.knowledge_data = []
+        self.knowledge = None
+        self.router = QueryRouter()
+        self.cache = ResponseCache(entities=self.router.entities)
+        self.memory = create_checkpointer()
+        self.refresh_interval = refresh_interval
+        self._refresh_task = None
     
     async def fetch_knowledge(self):
         async with aiohttp.ClientSession() as session:
@@ -38,32 +101,66 @@ class CdpAgent:
                     raise HTTPException(status_code=response.status, detail=f"Failed to fetch {self.url}")
 
     async def initialize(self):
+        """Build the knowledge base and the agent once; later updates go through refresh()."""
         async with self._lock:
-            await self.fetch_knowledge()
-            retriever = await self.create_retriever()
-            self.agent_executor = await asyncio.get_event_loop().run_in_executor(
-                self.thread_pool,
-                self._sync_initialize_agent,
-                retriever
-            )
+            if self.agent_executor is not None:
+                return
+            with stage("agent_initialize"):
+                await self.fetch_knowledge()
+                retriever = await self.create_retriever()
+                self.agent_executor = await asyncio.get_event_loop().run_in_executor(
+                    self.thread_pool,
+                    self._sync_initialize_agent,
+                    retriever
+                )
 
     async def create_retriever(self):
-        df = pd.DataFrame(self.knowledge_data)
-        docs = [
-            Document(
-                page_content=f"IdProject: {row['idProtocol']}, Chain: {row['chain']}, Symbol: {row['nameToken']}, TVL: {row['tvl']}, APY: {row['apy']}, Stablecoin: {row['stablecoin']}",
-                metadata={"symbol": row["nameToken"], "protocol": row["idProtocol"]}
-            )
-            for _, row in df.iterrows()
-        ]
+        self.router.update(self.knowledge_data)
+        if self.knowledge is None:
+            self.knowledge = KnowledgeBase(CachedEmbeddings(OpenAIEmbeddings()))
+            self.cache.embeddings = self.knowledge.embeddings
 
-        return await asyncio.get_event_loop().run_in_executor(
-            self.thread_pool,
-            lambda: FAISS.from_documents(docs, OpenAIEmbeddings()).as_retriever()
+        await asyncio.get_event_loop().run_in_executor(
+            None,
+            self.knowledge.update,
+            self.knowledge_data
         )
+        return self.knowledge.as_retriever()
+
+    async def refresh(self):
+        """Re-fetch the backend and embed only new or changed protocols. Queries never wait on this."""
+        async with self._lock:
+            await self.fetch_knowledge()
+            self.router.update(self.knowledge_data)
+            return await asyncio.get_event_loop().run_in_executor(
+                None,
+                self.knowledge.update,
+                self.knowledge_data
+            )
+
+    def start_refresher(self):
+        if self._refresh_task is None and self.refresh_interval > 0:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop_refresher(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Knowledge refresh failed: {e}")
 
     def _sync_initialize_agent(self, retriever):
-        llm = ChatOpenAI(model="gpt-4o-mini-2024-07-18")
+        llm = ChatOpenAI(model="gpt-4o-mini-2024-07-18", callbacks=[llm_metrics])
         qa_chain = RetrievalQA.from_chain_type(llm=llm, retriever=retriever)
         qa_tool = Tool(
             name="KnowledgeBaseQA",
@@ -77,28 +174,146 @@ class CdpAgent:
         tools = cdp_toolkit.get_tools()
         tools.append(qa_tool)
         
-        return create_react_agent(llm, tools=tools)
-
-    async def process_query(self, query: str, thread_id: Optional[str] = None):
-        await self.initialize()
-        config = {"configurable": {"thread_id": thread_id or "CDP Agent API"}}
-        return await asyncio.get_event_loop().run_in_executor(
-            self.thread_pool,
-            lambda: self.agent_executor.invoke(
-                {"messages": [HumanMessage(content=query)]},
-                config=config
-            )["messages"][-1].content
+        return create_react_agent(llm, tools=tools, checkpointer=self.memory, state_modifier=bounded_prompt())
+
+    async def process_query(self, query: str, thread_id: Optional[str] = None, client_id: Optional[str] = None):
+        if self.agent_executor is None:
+            await self.initialize()
+
+        with stage("router"):
+            answer = self.router.route(query)
+        if answer is not None:
+            return answer
+
+        # Conversations with their own thread_id depend on history, so only stateless queries are cached.
+        loop = asyncio.get_event_loop()
+        version = self.knowledge.version
+        if thread_id is None:
+            with stage("response_cache"):
+                cached = await loop.run_in_executor(None, self.cache.get, query, version)
+            if cached is not None:
+                return cached
+
+        # Identical stateless queries in flight share one LLM call.
+        key = ("query", normalize(query)) if thread_id is None else None
+        return await self.admission.run(self._invoke, query, thread_id, version, key=key, client_id=client_id)
+
+    async def stream_query(self, query: str, thread_id: Optional[str] = None, client_id: Optional[str] = None):
+        """
+        Yield (event, data) pairs while the agent works: "token" for LLM
+        output, "tool_call"/"tool_result" for agent steps and a last
+        "answer" with the final text. Events go through a bounded queue, so
+        a slow client slows the agent thread instead of buffering without
+        limit; when the client goes away the agent stops at its next step.
+        """
+        if self.agent_executor is None:
+            await self.initialize()
+
+        answer = self.router.route(query)
+        loop = asyncio.get_event_loop()
+        version = self.knowledge.version
+        if answer is None and thread_id is None:
+            answer = await loop.run_in_executor(None, self.cache.get, query, version)
+        if answer is not None:
+            yield "answer", answer
+            return
+
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        cancelled = threading.Event()
+        producer = asyncio.ensure_future(self.admission.run(
+            self._stream, query, thread_id, version, queue, loop, cancelled, client_id=client_id
+        ))
+        get = None
+        try:
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({get, producer}, return_when=asyncio.FIRST_COMPLETED)
+                if get in done:
+                    yield get.result()
+                    continue
+
+                get.cancel()
+                while not queue.empty():
+                    yield queue.get_nowait()
+                yield "answer", producer.result()
+                return
+        finally:
+            cancelled.set()
+            if get is not None:
+                get.cancel()
+            if not producer.done():
+                producer.cancel()
+
+    def _stream(self, query, thread_id, version, queue, loop, cancelled):
+        def emit(event, data):
+            future = asyncio.run_coroutine_threadsafe(queue.put((event, data)), loop)
+            while not cancelled.is_set():
+                try:
+                    return future.result(timeout=0.5)
+                except FutureTimeoutError:
+                    continue
+            future.cancel()
+
+        config = {"configurable": {"thread_id": thread_id or f"query:{uuid.uuid4().hex}"}}
+        stream = self.agent_executor.stream(
+            {"messages": [HumanMessage(content=query)]}, config=config, stream_mode=["messages", "updates"]
         )
+        answer = None
+        try:
+            for mode, chunk in stream:
+                if cancelled.is_set():
+                    return None
+                if mode == "messages":
+                    message, metadata = chunk
+                    if isinstance(message, AIMessageChunk) and message.content and metadata.get("langgraph_node") == "agent":
+                        emit("token", {"content": message.content})
+                    continue
 
+                for update in chunk.values():
+                    for message in (update or {}).get("messages", []):
+                        if isinstance(message, AIMessage) and message.tool_calls:
+                            for call in message.tool_calls:
+                                emit("tool_call", {"name": call["name"], "args": call["args"]})
+                        elif isinstance(message, ToolMessage):
+                            emit("tool_result", {"name": message.name, "content": str(message.content)[:1000]})
+                        elif isinstance(message, AIMessage):
+                            answer = message.content
 
+            if thread_id is not None:
+                compact_thread(self.agent_executor, config)
+            elif answer is not None:
+                self.cache.put(query, answer, version)
+            return answer
+        finally:
+            stream.close()
+            if thread_id is None:
+                self.memory.delete_thread(config["configurable"]["thread_id"])
+
+    def _invoke(self, query, thread_id, version=None):
+        # Stateless queries get a throwaway thread so they never share history.
+        config = {"configurable": {"thread_id": thread_id or f"query:{uuid.uuid4().hex}"}}
+        try:
+            with stage("agent_invoke"):
+                response = self.agent_executor.invoke({"messages": [HumanMessage(content=query)]}, config=config)
+            if thread_id is not None:
+                compact_thread(self.agent_executor, config)
+            else:
+                # Cached here rather than by the caller so work whose caller timed out is not wasted.
+                self.cache.put(query, response["messages"][-1].content, version)
+            return response["messages"][-1].content
+        finally:
+            if thread_id is None:
+                self.memory.delete_thread(config["configurable"]["thread_id"])
 
 
 class CdpAgentClassifier:
     def __init__(self, max_workers: int = 3):
         self.thread_pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.admission = AdmissionController(self.thread_pool, max_workers)
         self.agent_executor = None
         self._lock = asyncio.Lock()
-        self.file_path = "./data/wallet.json"
+        self.store = get_wallet_store()
+        self.memory = create_checkpointer()
 
     async def initialize(self):
         async with self._lock:
@@ -109,14 +324,13 @@ class CdpAgentClassifier:
                 )
 
     def _sync_initialize_agent(self):
-        llm = ChatOpenAI(model="gpt-4o-mini-2024-07-18")
-        memory = MemorySaver()
-        
+        llm = ChatOpenAI(model="gpt-4o-mini-2024-07-18", callbacks=[llm_metrics])
+
         return create_react_agent(
             llm,
             tools=[],
-            checkpointer=memory,
-            state_modifier=(
+            checkpointer=self.memory,
+            state_modifier=bounded_prompt(
                 "You are a risk profile classifier that evaluates users based on their responses to investment-related questions. "
                 "You MUST ALWAYS respond in valid JSON format with a single 'risk' key with value being either 'low', 'medium', or 'high'. "
                 "When analyzing responses, consider factors like: age, investment experience, financial goals, time horizon, and risk tolerance. "
@@ -131,33 +345,30 @@ class CdpAgentClassifier:
             ),
         )
 
-    async def process_query(self, query: str, user_address: str):
+    async def process_query(self, query: str, user_address: str, client_id: Optional[str] = None):
         if self.agent_executor is None:
             raise RuntimeError("Agent not initialized. Please call initialize() first.")
             
-        config = {"configurable": {"thread_id": "Risk Assessment API"}}
-        
-        response =  await asyncio.get_event_loop().run_in_executor(
-            self.thread_pool,
-            lambda: self.agent_executor.invoke(
-                {"messages": [HumanMessage(content=query)]},
-                config=config
-            )["messages"][-1].content
+        # Never cached: the classification depends on this user's thread history, and a near-identical
+        # answer from another user (e.g. a negation) must not hand them someone else's risk profile.
+        response = await self.admission.run(
+            self._invoke, query, user_address,
+            key=("risk", user_address, query), client_id=client_id
         )
-        
+
         self._update_risk_profile(self._parse_risk(response), user_address)
         
         return response
     
+    def _invoke(self, query, user_address):
+        config = {"configurable": {"thread_id": f"risk:{user_address}"}}
+        with stage("classifier_invoke"):
+            response = self.agent_executor.invoke({"messages": [HumanMessage(content=query)]}, config=config)
+        compact_thread(self.agent_executor, config)
+        return response["messages"][-1].content
+
     def _update_risk_profile(self, risk_profile: str, user_address: str):
-        with open(self.file_path, 'rb') as file:
-            wallet_data = orjson.loads(file.read())
-            
-        for entry in wallet_data:
-            if entry["user_address"] == user_address:
-                entry["risk_profile"] = risk_profile
-                with open(self.file_path, 'wb') as file:
-                    file.write(orjson.dumps(wallet_data, option=orjson.OPT_INDENT_2))
+        self.store.set_risk_profile(user_address, risk_profile)
                 
     def _parse_risk(self, response):
         return orjson.loads(response).get("risk")
\ No newline at end of file
@@ -0,0 +1,226 @@
+import os
+import time
+import asyncio
+import threading
+from dotenv import load_dotenv
+from eth_account import Account
+from eth_account.messages import encode_typed_data
+from web3 import Web3
+from src.registry import get_registry
+
+load_dotenv()
+
+APPROVAL_MODE = os.getenv("APPROVAL_MODE", "exact")
+# Spenders that may get an unlimited allowance in "max"/"permit" mode: the router, the swap spender and the staking contracts.
+APPROVAL_TRUSTED_SPENDERS = {
+    address.strip().lower() for address in os.getenv("APPROVAL_TRUSTED_SPENDERS", ",".join([
+        "0x0b561A287588675AccE2f190FFa2AdCb30145e01",
+        "0x9F7b08e2365BFf594C4227752741Cb696B9b6E71",
+        "0xa976c4930e253CE56Ff129404a95F0578345C113",
+        "0xd39ef51d10FAeE75FE6fe66537F3D8128Ec72dA5",
+        "0xF50c64a2C422C6809e5BdbcF4Bb5af38D06a033a",
+        "0x60e78201ac487E5C382379dc8f9e39a896396728",
+        "0x23218e77D017AD293496976A5ee9Eb3F3F5EF217",
+    ])).split(",") if address.strip()
+}
+ALLOWANCE_CACHE_TTL = float(os.getenv("ALLOWANCE_CACHE_TTL", "300"))
+PERMIT_DEADLINE = int(os.getenv("PERMIT_DEADLINE", "3600"))
+APPROVAL_POLL_INTERVAL = float(os.getenv("APPROVAL_POLL_INTERVAL", "5"))
+MAX_UINT256 = 2 ** 256 - 1
+APPROVAL_TOPIC = Web3.keccak(text="Approval(address,address,uint256)").to_0x_hex()
+TOKEN_ABI = "./abi/MockToken.json"
+
+
+class ApprovalManager:
+    """
+    Allowance cache and approval policy shared by both wallets.
+
+    allowance(owner, spender) is read once and then kept for `ttl` seconds,
+    updated by our own approvals and spends and by Approval events, so a
+    repeat swap or stake needs no approve at all. Callers record an approval
+    only once it is mined and invalidate the entry when anything in the
+    sequence fails. When an approve is needed the mode decides the amount:
+    "exact" approves what the operation pulls, "max" approves 2**256-1 once
+    per (token, spender), and "permit" has the user sign an EIP-2612 permit
+    that the admin key submits, so the user never spends gas or a nonce on
+    approvals. Unlimited amounts only go to `trusted_spenders`; any other
+    spender (it comes from the request body) gets exactly what it pulls.
+    """
+
+    def __init__(self, mode=APPROVAL_MODE, ttl=ALLOWANCE_CACHE_TTL, trusted_spenders=APPROVAL_TRUSTED_SPENDERS):
+        self.mode = mode
+        self.ttl = ttl
+        self.trusted_spenders = trusted_spenders
+        self.contracts = get_registry()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._allowances = {}
+        self._last_block = None
+        self._lock = threading.Lock()
+
+    def target(self, required, spender):
+        if self.mode == "exact" or spender.lower() not in self.trusted_spenders:
+            return required
+        return MAX_UINT256
+
+    def needs_approval(self, allowance, required):
+        return allowance < required
+
+    def skip(self):
+        """Count an approve made unnecessary by the existing allowance."""
+        with self._lock:
+            self.skipped += 1
+
+    async def allowance(self, w3, token, owner, spender):
+        cached = self._cached(token, owner, spender)
+        if cached is not None:
+            return cached
+        value = await self._token(w3, token).functions.allowance(owner, spender).call()
+        self.record(token, owner, spender, value)
+        return value
+
+    def allowance_sync(self, w3, token, owner, spender):
+        cached = self._cached(token, owner, spender)
+        if cached is not None:
+            return cached
+        value = self._token(w3, token).functions.allowance(owner, spender).call()
+        self.record(token, owner, spender, value)
+        return value
+
+    def record(self, token, owner, spender, value):
+        with self._lock:
+            self._allowances[self._key(token, owner, spender)] = (value, time.monotonic() + self.ttl)
+
+    def consume(self, token, owner, spender, amount):
+        """Account for a transferFrom we just sent; an infinite allowance is never decreased."""
+        key = self._key(token, owner, spender)
+        with self._lock:
+            entry = self._allowances.get(key)
+            if entry is not None and entry[0] != MAX_UINT256:
+                self._allowances[key] = (max(entry[0] - amount, 0), entry[1])
+
+    def invalidate(self, token=None, owner=None, spender=None):
+        with self._lock:
+            if token is None and owner is None and spender is None:
+                self._allowances.clear()
+                return
+            for key in list(self._allowances):
+                if ((token is None or key[0] == token.lower()) and (owner is None or key[1] == owner.lower())
+                        and (spender is None or key[2] == spender.lower())):
+                    del self._allowances[key]
+
+    def apply_logs(self, logs):
+        """Update the cache from raw Approval logs of any token."""
+        for log in logs:
+            topics = log["topics"]
+            if len(topics) != 3 or self._hex(topics[0]) != APPROVAL_TOPIC:
+                continue
+            owner = "0x" + self._hex(topics[1])[-40:]
+            spender = "0x" + self._hex(topics[2])[-40:]
+            self.record(log["address"], owner, spender, int(self._hex(log["data"]), 16))
+
+    async def poll_events(self, w3):
+        """Apply Approval events emitted since the last poll for the (token, owner) pairs in the cache."""
+        latest = await w3.eth.block_number
+        if self._last_block is None or latest <= self._last_block:
+            self._last_block = latest
+            return 0
+
+        with self._lock:
+            tokens = sorted({Web3.to_checksum_address(key[0]) for key in self._allowances})
+            owners = sorted({"0x" + key[1][2:].rjust(64, "0") for key in self._allowances})
+        from_block, self._last_block = self._last_block + 1, latest
+        if not tokens:
+            return 0
+
+        logs = await w3.eth.get_logs({
+            "address": tokens,
+            "fromBlock": from_block,
+            "toBlock": latest,
+            "topics": [APPROVAL_TOPIC, owners],
+        })
+        self.apply_logs(logs)
+        return len(logs)
+
+    async def watch(self, w3, interval=APPROVAL_POLL_INTERVAL):
+        while True:
+            try:
+                await self.poll_events(w3)
+            except Exception as e:
+                print(f"Approval event poll failed: {e}")
+            await asyncio.sleep(interval)
+
+    def sign_permit(self, private_key, spender, value, nonce, domain, deadline=None):
+        """EIP-2612 permit signature of the owner of `private_key`; returns (deadline, v, r, s)."""
+        owner = self.contracts.address(private_key)
+        deadline = deadline or int(time.time()) + PERMIT_DEADLINE
+        _, name, version, chain_id, verifying_contract, _, _ = domain
+        signable = encode_typed_data(full_message={
+            "types": {
+                "EIP712Domain": [
+                    {"name": "name", "type": "string"},
+                    {"name": "version", "type": "string"},
+                    {"name": "chainId", "type": "uint256"},
+                    {"name": "verifyingContract", "type": "address"},
+                ],
+                "Permit": [
+                    {"name": "owner", "type": "address"},
+                    {"name": "spender", "type": "address"},
+                    {"name": "value", "type": "uint256"},
+                    {"name": "nonce", "type": "uint256"},
+                    {"name": "deadline", "type": "uint256"},
+                ],
+            },
+            "primaryType": "Permit",
+            "domain": {"name": name, "version": version, "chainId": chain_id, "verifyingContract": verifying_contract},
+            "message": {"owner": owner, "spender": spender, "value": value, "nonce": nonce, "deadline": deadline},
+        })
+        signed = Account.sign_message(signable, private_key)
+        return deadline, signed.v, signed.r.to_bytes(32, "big"), signed.s.to_bytes(32, "big")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "approvals_skipped": self.skipped,
+            "entries": len(self._allowances),
+        }
+
+    def _token(self, w3, token):
+        return self.contracts.contract(w3, token, TOKEN_ABI)
+
+    def _cached(self, token, owner, spender):
+        with self._lock:
+            entry = self._allowances.get(self._key(token, owner, spender))
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    @staticmethod
+    def _key(token, owner, spender):
+        return token.lower(), owner.lower(), spender.lower()
+
+    @staticmethod
+    def _hex(value):
+        if isinstance(value, (bytes, bytearray)):
+            return "0x" + bytes(value).hex()
+        return value if value.startswith("0x") else "0x" + value
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_approval_manager():
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ApprovalManager()
+    return _manager
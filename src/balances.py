@@ -0,0 +1,99 @@
+import os
+from dotenv import load_dotenv
+from src.registry import get_registry
+
+load_dotenv()
+
+MULTICALL3_ADDRESS = os.getenv("MULTICALL3_ADDRESS", "0xcA11bde05977b3631167028862bE2a173976CA11")
+BALANCE_READ_MODE = os.getenv("BALANCE_READ_MODE", "multicall")
+BALANCE_CHUNK_SIZE = int(os.getenv("BALANCE_CHUNK_SIZE", "500"))
+
+
+class StakedBalanceReader:
+    """
+    Reads getAmountStakeByUser for every (user, protocol) pair (and
+    balanceOf for every (holder, token) pair) in a handful of requests,
+    either packed into Multicall3 aggregate3 calls or sent as JSON-RPC
+    batches of chunk_size calls. Falls back to JSON-RPC batching when no
+    Multicall3 contract is deployed at multicall_address.
+    """
+
+    def __init__(self, w3, mode=BALANCE_READ_MODE, chunk_size=BALANCE_CHUNK_SIZE, multicall_address=MULTICALL3_ADDRESS):
+        self.w3 = w3
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.multicall_address = w3.to_checksum_address(multicall_address)
+        self.multicall_available = None
+        self.contracts = get_registry()
+
+    def read(self, users, protocols, block_identifier="latest"):
+        """Return {user: {protocol: raw_amount}} for every pair that could be read at block_identifier."""
+        return self._read_matrix(users, protocols, "./abi/MockStake.json", "getAmountStakeByUser", block_identifier)
+
+    def read_token_balances(self, holders, tokens, block_identifier="latest"):
+        """Return {holder: {token: raw_balance}} for every pair that could be read at block_identifier."""
+        return self._read_matrix(holders, tokens, "./abi/MockToken.json", "balanceOf", block_identifier)
+
+    def _read_matrix(self, owners, contracts, abi_path, fn_name, block_identifier):
+        pairs = [(owner, contract) for owner in owners for contract in contracts]
+        mode = "multicall" if self.mode == "multicall" and self._has_multicall() else "batch"
+
+        matrix = {owner: {} for owner in owners}
+        for start in range(0, len(pairs), self.chunk_size):
+            chunk = pairs[start:start + self.chunk_size]
+            if mode == "multicall":
+                amounts = self._read_multicall(chunk, abi_path, fn_name, block_identifier)
+            else:
+                amounts = self._read_batch(chunk, abi_path, fn_name, block_identifier)
+
+            for (owner, contract), amount in zip(chunk, amounts):
+                if amount is not None:
+                    matrix[owner][contract] = amount
+        return matrix
+
+    def _has_multicall(self):
+        """Whether Multicall3 is deployed; checked once, a failed check is retried on the next read."""
+        if self.multicall_available is None:
+            try:
+                self.multicall_available = len(self.w3.eth.get_code(self.multicall_address)) > 0
+            except Exception as e:
+                print(f"Multicall3 check failed, using JSON-RPC batching: {e}")
+                return False
+            if not self.multicall_available:
+                print(f"No Multicall3 at {self.multicall_address}, falling back to JSON-RPC batching")
+        return self.multicall_available
+
+    def _read_multicall(self, chunk, abi_path, fn_name, block_identifier="latest"):
+        multicall = self.contracts.contract(self.w3, self.multicall_address, "./abi/Multicall3.json")
+        calldata = {}
+        for owner, contract in chunk:
+            if owner not in calldata:
+                # Every contract of a kind shares one ABI, so the calldata only depends on the owner.
+                calldata[owner] = self._contract(contract, abi_path).encode_abi(fn_name, args=[owner])
+        calls = [(contract, True, calldata[owner]) for owner, contract in chunk]
+        results = multicall.functions.aggregate3(calls).call(block_identifier=block_identifier)
+        return [
+            int.from_bytes(return_data[:32], "big") if success and len(return_data) >= 32 else None
+            for success, return_data in results
+        ]
+
+    def _read_batch(self, chunk, abi_path, fn_name, block_identifier="latest"):
+        try:
+            with self.w3.batch_requests() as batch:
+                for owner, contract in chunk:
+                    batch.add(self._contract(contract, abi_path).functions[fn_name](owner).call(block_identifier=block_identifier))
+                return batch.execute()
+        except Exception as e:
+            print(f"Batch request failed, reading one by one: {e}")
+
+        amounts = []
+        for owner, contract in chunk:
+            try:
+                amounts.append(self._contract(contract, abi_path).functions[fn_name](owner).call(block_identifier=block_identifier))
+            except Exception as e:
+                print(f"Error retrieving balance: {e}")
+                amounts.append(None)
+        return amounts
+
+    def _contract(self, address, abi_path):
+        return self.contracts.contract(self.w3, address, abi_path)
@@ -0,0 +1,158 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+
+
+def normalize(query):
+    return re.sub(r"\s+", " ", query.strip().lower()).rstrip("?!. ")
+
+
+class ResponseCache:
+    """
+    Two-tier cache of agent answers. The exact tier is keyed on the
+    normalized query text; the semantic tier reuses an answer whose query
+    embedding has cosine similarity >= threshold with the new one. Entries
+    expire after `ttl` seconds, the least recently used go first past
+    `max_entries`, and everything is dropped when the knowledge version
+    changes; calls still carrying a version that was replaced are ignored.
+    With an `entities` callable a semantic hit also needs the same tokens,
+    chains and protocols, so "best USDC pool" never answers "best USDT
+    pool". Without an embedder only the exact tier is used.
+    """
+
+    def __init__(self, embeddings=None, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 threshold=RESPONSE_CACHE_THRESHOLD, entities=None):
+        self.embeddings = embeddings
+        self.entities = entities
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.version = None
+        self._retired = set()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._keys = []
+        self._lock = threading.Lock()
+
+    def get(self, query, version=None):
+        """Return the cached answer for `query`, or None. Embeds the query on an exact miss, so call it off the event loop."""
+        key = normalize(query)
+        with self._lock:
+            if not self._check_version(version):
+                self.misses += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["answer"]
+
+        if self.embeddings is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        vector = self._embed(query)
+        entities = self._entities(query)
+        with self._lock:
+            if not self._check_version(version):
+                self.misses += 1
+                return None
+            match = self._nearest(vector, entities)
+            if match is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(match)
+            self.semantic_hits += 1
+            return self._entries[match]["answer"]
+
+    def put(self, query, answer, version=None):
+        key = normalize(query)
+        vector = self._embed(query) if self.embeddings is not None else None
+        entities = self._entities(query)
+        with self._lock:
+            if not self._check_version(version):
+                return
+            self._entries[key] = {
+                "answer": answer, "vector": vector, "entities": entities, "expires_at": time.monotonic() + self.ttl,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self):
+        hits = self.exact_hits + self.semantic_hits
+        total = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "version": self.version,
+        }
+
+    def _check_version(self, version):
+        """Switch to `version` if it is new. Returns False for a version that was already replaced."""
+        if version == self.version:
+            return True
+        if version in self._retired:
+            return False
+        self._retired.add(self.version)
+        self._entries.clear()
+        self._matrix = None
+        self.version = version
+        return True
+
+    def _expired(self, entry):
+        return entry["expires_at"] <= time.monotonic()
+
+    def _nearest(self, vector, entities):
+        expired = [key for key, entry in self._entries.items() if self._expired(entry)]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+        if self._matrix is None:
+            self._keys = [key for key, entry in self._entries.items() if entry["vector"] is not None]
+            self._matrix = np.stack([self._entries[key]["vector"] for key in self._keys]) if self._keys else None
+        if self._matrix is None:
+            return None
+
+        scores = self._matrix @ vector
+        for position in np.argsort(-scores):
+            if scores[position] < self.threshold:
+                return None
+            key = self._keys[position]
+            if self._entries[key]["entities"] == entities:
+                return key
+        return None
+
+    def _entities(self, query):
+        return self.entities(query) if self.entities is not None else None
+
+    def _embed(self, query):
+        vector = np.asarray(self.embeddings.embed_query(normalize(query)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
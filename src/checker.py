@@ -3,66 +3,62 @@ import orjson
 import requests
 from web3 import Web3
 from src.utils import get_env_variable
+from src.store import get_wallet_store
+from src.registry import get_registry
+from src.balances import StakedBalanceReader
+from src.yields import get_yield_snapshot
+from src.indexer import get_indexer
+from src.rpc import get_web3
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def _load_existing_data(self):
-    if not os.path.exists('./data/wallet.json'):
-        return []
-
-    with open('./data/wallet.json', 'rb') as file:
-        return orjson.loads(file.read())
-    
 def fetch_data(user_address):
-    existing_data = _load_existing_data()
+    private_key = get_wallet_store().fetch_data(user_address)
+    if private_key is None:
+        print(f"No wallet data found for user address: {user_address}")
+    return private_key
 
-    for entry in existing_data:
-        if entry["user_address"] == user_address:
-            private_key = entry["data"]
-            
-            return private_key
+def get_data_staked(user_address, snapshot=None):
+    return get_data_staked_many([user_address], snapshot=snapshot)[user_address]
 
-    print(f"No wallet data found for user address: {user_address}")
-    return None   
+def get_data_staked_many(user_addresses, w3=None, snapshot=None):
+    registry = get_registry()
+    wallets = {}
+    for user_address in user_addresses:
+        private_key = fetch_data(user_address)
+        if private_key is not None:
+            wallets[user_address] = registry.address(private_key)
 
-def get_data_staked(user_address):
-    wallet = fetch_data(user_address)
-    address = wallet.default_address.address_id
-    
-    MANTA_RPC_URL = Web3.HTTPProvider(os.getenv("MANTA_RPC_URL"))
-    w3 = Web3(Web3.HTTPProvider(MANTA_RPC_URL))
+    snapshot = snapshot or get_yield_snapshot()
+    address_protocol = snapshot.staking_addresses
 
-    result = requests.get("https://opti-backend.vercel.app/staking")
-    response = result.json()
-    address_protocol = [item['addressStaking'] for item in response]
+    # A caught-up log index answers locally; otherwise read the contracts.
+    indexer = get_indexer()
+    if indexer is not None and indexer.is_fresh():
+        indexed = indexer.positions_many(list(wallets.values()))
+        protocols = {protocol.lower(): protocol for protocol in address_protocol}
+        matrix = {
+            address: {protocols[protocol.lower()]: amount for protocol, amount in indexed[Web3.to_checksum_address(address)].items()
+                      if protocol.lower() in protocols}
+            for address in wallets.values()
+        }
+    else:
+        w3 = w3 or get_web3()
+        matrix = StakedBalanceReader(w3).read(list(wallets.values()), address_protocol)
 
-
-    with open("abi/MockStake.json", 'r') as file:
-        contract_abi = orjson.loads(file.read())
-    
-    result_amount = []
-    for i in range(len(address_protocol)):
-        contract_address = address_protocol[i]
-        contract = w3.eth.contract(address=contract_address, abi=contract_abi)
-        try:
-            w3.to_checksum_address(address)
-            balance = contract.functions.getAmountStakeByUser(address).call()
+    result_amount = {user_address: [] for user_address in user_addresses}
+    for user_address, address in wallets.items():
+        for contract_address, balance in matrix[address].items():
             readable_balance = balance / (10 ** 6)
             if int(readable_balance) > 0:
                 user_staked = {
                     "protocol": contract_address,
                     "amount": readable_balance, 
                 }
-                result_amount.append(user_staked)
-                
-        except Exception as e:
-            print(f"Error retrieving balance: {e}")
+                result_amount[user_address].append(user_staked)
     
     return result_amount
 
 def get_risk(user_address):
-    wallet_data = _load_existing_data()
-    for entry in wallet_data:
-        if entry["user_address"] == user_address:
-            return entry["risk_profile"]
\ No newline at end of file
+    return get_wallet_store().get_risk(user_address)
\ No newline at end of file
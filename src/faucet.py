@@ -0,0 +1,148 @@
+import os
+import math
+import time
+import asyncio
+from dotenv import load_dotenv
+from src.admission import Overloaded
+from src.fees import TRANSFER_GAS
+
+load_dotenv()
+
+FAUCET_AMOUNT_ETH = os.getenv("FAUCET_AMOUNT_ETH", "0.0001")
+FAUCET_WINDOW = float(os.getenv("FAUCET_WINDOW", "0.25"))
+FAUCET_MAX_BATCH = int(os.getenv("FAUCET_MAX_BATCH", "100"))
+FAUCET_RATE_LIMIT = float(os.getenv("FAUCET_RATE_LIMIT", "60"))
+FAUCET_DISPERSE_ADDRESS = os.getenv("FAUCET_DISPERSE_ADDRESS")
+DISPERSE_GAS_PER_RECIPIENT = 40000
+
+
+class FaucetBatcher:
+    """
+    Collects funding requests for `window` seconds and sends them together
+    from the admin key: one disperseEther call per max_batch recipients when
+    a Disperse contract is configured, otherwise one transfer per recipient
+    broadcast back to back on consecutive nonces without waiting in between.
+    A recipient already in the open batch shares its transaction, and an
+    address funded less than rate_limit seconds ago is refused with 429.
+    """
+
+    def __init__(self, wallet, chain_id, amount_eth=FAUCET_AMOUNT_ETH, window=FAUCET_WINDOW, max_batch=FAUCET_MAX_BATCH,
+                 rate_limit=FAUCET_RATE_LIMIT, disperse_address=FAUCET_DISPERSE_ADDRESS):
+        self.wallet = wallet
+        self.chain_id = chain_id
+        self.amount = wallet.w3.to_wei(amount_eth, 'ether')
+        self.window = window
+        self.max_batch = max_batch
+        self.rate_limit = rate_limit
+        self.disperse_address = wallet.w3.to_checksum_address(disperse_address) if disperse_address else None
+        self.batches = 0
+        self.funded = 0
+        self.deduplicated = 0
+        self.rate_limited = 0
+        self._pending = {}
+        self._last_funded = {}
+        self._timer = None
+        self._tasks = set()
+
+    async def fund(self, address, wait=True):
+        """Queue `address` for the next batch and return its tx hash once broadcast (and mined, with wait=True)."""
+        future = self._pending.get(address)
+        if future is not None:
+            self.deduplicated += 1
+        else:
+            self._check_rate_limit(address)
+            future = asyncio.get_event_loop().create_future()
+            self._pending[address] = future
+            self._last_funded[address] = time.monotonic()
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_event_loop().call_later(self.window, self._flush)
+
+        tx_hash = await asyncio.shield(future)
+        return await self.wallet._settle([tx_hash], self.wallet.admin_private_key, wait)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "funded": self.funded,
+            "deduplicated": self.deduplicated,
+            "rate_limited": self.rate_limited,
+            "pending": len(self._pending),
+        }
+
+    def _check_rate_limit(self, address):
+        now = time.monotonic()
+        if len(self._last_funded) > 10 * self.max_batch:
+            self._last_funded = {
+                key: funded_at for key, funded_at in self._last_funded.items() if now - funded_at < self.rate_limit
+            }
+
+        funded_at = self._last_funded.get(address)
+        if funded_at is not None and now - funded_at < self.rate_limit:
+            self.rate_limited += 1
+            raise Overloaded(429, math.ceil(self.rate_limit - (now - funded_at)), f"{address} was funded recently")
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        recipients = list(batch)
+        self.batches += 1
+        try:
+            fees = await self.wallet.fees.fee_params(self.wallet.w3)
+            if self.disperse_address is not None and len(recipients) > 1:
+                chunks = [recipients[start:start + self.max_batch] for start in range(0, len(recipients), self.max_batch)]
+                hashes = await asyncio.gather(*(self._disperse(chunk, fees) for chunk in chunks), return_exceptions=True)
+                results = [result for chunk, result in zip(chunks, hashes) for _ in chunk]
+            else:
+                results = await asyncio.gather(
+                    *(self._transfer(recipient, fees) for recipient in recipients), return_exceptions=True
+                )
+        except Exception as e:
+            results = [e] * len(recipients)
+
+        for recipient, result in zip(recipients, results):
+            if isinstance(result, BaseException):
+                self._last_funded.pop(recipient, None)
+                batch[recipient].set_exception(result)
+            else:
+                self.funded += 1
+                batch[recipient].set_result(result)
+
+    async def _transfer(self, recipient, fees):
+        transaction = {
+            'to': recipient,
+            'value': self.amount,
+            'chainId': self.chain_id,
+            'gas': TRANSFER_GAS,
+            **fees,
+        }
+        # A plain value transfer from the admin key has nothing to simulate.
+        return await self.wallet._broadcast(transaction, self.wallet.admin_private_key, simulate=False)
+
+    async def _disperse(self, recipients, fees):
+        disperse = self.wallet._contract(self.disperse_address, "./abi/Disperse.json")
+        admin_address = self.wallet.contracts.address(self.wallet.admin_private_key)
+        value = self.amount * len(recipients)
+        function = disperse.functions.disperseEther(recipients, [self.amount] * len(recipients))
+        try:
+            gas = int(await function.estimate_gas({'from': admin_address, 'value': value}) * self.wallet.fees.margin)
+        except Exception:
+            gas = TRANSFER_GAS + DISPERSE_GAS_PER_RECIPIENT * len(recipients)
+
+        transaction = await function.build_transaction({
+            'chainId': self.chain_id,
+            'from': admin_address,
+            'value': value,
+            'gas': gas,
+            **fees,
+        })
+        return await self.wallet._broadcast(transaction, self.wallet.admin_private_key)
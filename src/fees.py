@@ -0,0 +1,131 @@
+import os
+import time
+import asyncio
+import threading
+from dotenv import load_dotenv
+from web3 import Web3
+
+load_dotenv()
+
+FEE_CACHE_TTL = float(os.getenv("FEE_CACHE_TTL", "3"))
+GAS_LIMIT_MARGIN = float(os.getenv("GAS_LIMIT_MARGIN", "1.2"))
+DEFAULT_GAS_LIMIT = int(os.getenv("DEFAULT_GAS_LIMIT", "1000000"))
+DEFAULT_PRIORITY_FEE = int(os.getenv("DEFAULT_PRIORITY_FEE", "1000000"))
+TRANSFER_GAS = 21000
+
+
+class FeeOracle:
+    """
+    Shared fee and gas-limit source for every transaction build.
+
+    Fees are cached for FEE_CACHE_TTL seconds and returned as EIP-1559
+    fields when the latest block carries a base fee, otherwise as a legacy
+    gasPrice. Gas limits are estimated for every transaction (storage state
+    changes what the same call costs) and padded by GAS_LIMIT_MARGIN. The
+    highest padded estimate or mined gasUsed seen per (contract, selector)
+    is kept only as the fallback for when estimation fails (e.g. a call that
+    depends on a transaction still in the mempool), before DEFAULT_GAS_LIMIT.
+    """
+
+    def __init__(self, ttl=FEE_CACHE_TTL, margin=GAS_LIMIT_MARGIN, default_gas=DEFAULT_GAS_LIMIT):
+        self.ttl = ttl
+        self.margin = margin
+        self.default_gas = default_gas
+        self._fees = None
+        self._expires_at = 0
+        self._gas_limits = {}
+        self._async_lock = None
+        self._sync_lock = threading.Lock()
+
+    async def fee_params(self, w3):
+        if self._is_fresh():
+            return dict(self._fees)
+
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if not self._is_fresh():
+                block = await w3.eth.get_block("latest")
+                priority_fee = None
+                if block.get("baseFeePerGas") is not None:
+                    try:
+                        priority_fee = await w3.eth.max_priority_fee
+                    except Exception:
+                        priority_fee = DEFAULT_PRIORITY_FEE
+                gas_price = None if priority_fee is not None else await w3.eth.gas_price
+                self._store(block, priority_fee, gas_price)
+        return dict(self._fees)
+
+    def fee_params_sync(self, w3):
+        if self._is_fresh():
+            return dict(self._fees)
+
+        with self._sync_lock:
+            if not self._is_fresh():
+                block = w3.eth.get_block("latest")
+                priority_fee = None
+                if block.get("baseFeePerGas") is not None:
+                    try:
+                        priority_fee = w3.eth.max_priority_fee
+                    except Exception:
+                        priority_fee = DEFAULT_PRIORITY_FEE
+                gas_price = None if priority_fee is not None else w3.eth.gas_price
+                self._store(block, priority_fee, gas_price)
+        return dict(self._fees)
+
+    async def estimate_gas(self, function, sender_address):
+        key = (function.address, function.selector)
+        try:
+            estimate = await function.estimate_gas({'from': sender_address})
+        except Exception:
+            return self._gas_limits.get(key, self.default_gas)
+        return self._learn(key, estimate)
+
+    def estimate_gas_sync(self, function, sender_address):
+        key = (function.address, function.selector)
+        try:
+            estimate = function.estimate_gas({'from': sender_address})
+        except Exception:
+            return self._gas_limits.get(key, self.default_gas)
+        return self._learn(key, estimate)
+
+    def observe(self, transaction, gas_used):
+        """Raise the fallback limit of the transaction's call when it used more gas than learned so far."""
+        data = transaction.get("data")
+        if not transaction.get("to") or not data:
+            return
+        data = data if isinstance(data, str) else Web3.to_hex(data)
+        self._learn((Web3.to_checksum_address(transaction["to"]), data[:10]), gas_used)
+
+    def invalidate(self):
+        self._fees = None
+        self._expires_at = 0
+        self._gas_limits.clear()
+
+    def _is_fresh(self):
+        return self._fees is not None and time.monotonic() < self._expires_at
+
+    def _store(self, block, priority_fee, gas_price):
+        if gas_price is not None:
+            self._fees = {'gasPrice': gas_price}
+        else:
+            base_fee = block["baseFeePerGas"]
+            self._fees = {
+                'maxFeePerGas': 2 * base_fee + priority_fee,
+                'maxPriorityFeePerGas': priority_fee,
+            }
+        self._expires_at = time.monotonic() + self.ttl
+
+    def _learn(self, key, gas):
+        """Padded limit for `gas`; the fallback for key only ever goes up."""
+        limit = int(gas * self.margin)
+        if limit > self._gas_limits.get(key, 0):
+            self._gas_limits[key] = limit
+        return limit
+
+
+_oracle = FeeOracle()
+
+
+def get_fee_oracle():
+    return _oracle
@@ -0,0 +1,399 @@
+import os
+import time
+import sqlite3
+import threading
+import orjson
+from dotenv import load_dotenv
+from web3 import Web3
+from src.registry import get_registry
+from src.yields import get_yield_snapshot
+from src.rpc import get_web3
+from src.balances import StakedBalanceReader
+from src.store import get_wallet_store
+
+load_dotenv()
+
+INDEXER_ENABLED = os.getenv("INDEXER_ENABLED", "false").lower() == "true"
+INDEXER_DB_PATH = os.getenv("INDEXER_DB_PATH", "./data/index.db")
+INDEXER_START_BLOCK = os.getenv("INDEXER_START_BLOCK") or None
+INDEXER_CONFIRMATIONS = int(os.getenv("INDEXER_CONFIRMATIONS", "2"))
+INDEXER_BATCH_BLOCKS = int(os.getenv("INDEXER_BATCH_BLOCKS", "2000"))
+INDEXER_POLL_INTERVAL = float(os.getenv("INDEXER_POLL_INTERVAL", "2"))
+INDEXER_FRESH_SLACK = int(os.getenv("INDEXER_FRESH_SLACK", "5"))
+REORG_DEPTH = 128
+
+ROUTER_ADDRESS = "0x0b561A287588675AccE2f190FFa2AdCb30145e01"
+TOKEN_ADDRESSES = [
+    "0x94F0Fd09f425Be15C7Bc0575Aa71780A044039e3",
+    "0x6c8D1fd3AA9F436CBA20E4b6A5aeDb1bf814A732",
+    "0x3455b6B22cBD998512286428De8844CBFBcc06C2",
+    "0x7598099fFC36dCC3e96F3aB33f18E86F85ae7E44",
+    "0x74A8Ee760959AF0B18307861e92769CfEcC42f9B",
+]
+EVENTS = {
+    "./abi/MockStake.json": ["Staked", "WithdrawAll", "PartialWithdraw", "EmergencyWithdraw"],
+    "./abi/OptiFinance.json": ["Swap", "Deposit", "Withdrawal"],
+    "./abi/MockToken.json": ["Transfer"],
+}
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+
+class LogIndexer:
+    """
+    Follows the chain with eth_getLogs and keeps staked positions
+    (MockStake Staked/WithdrawAll/PartialWithdraw/EmergencyWithdraw), token
+    balances (MockToken Transfer) and router activity (OptiFinance
+    Swap/Deposit/Withdrawal) in SQLite. Every applied event is journaled
+    with the hash of its block; when a stored hash no longer matches the
+    chain the journal is unwound to the fork point and re-indexed. The
+    cursor survives restarts, so a new process resumes where the last one
+    stopped. Without a start block the first poll seeds the positions and
+    token balances of users() from the contracts at the confirmed head and
+    follows on from there.
+    """
+
+    def __init__(self, w3, stake_addresses, db_path=INDEXER_DB_PATH, router_address=ROUTER_ADDRESS,
+                 token_addresses=TOKEN_ADDRESSES, start_block=INDEXER_START_BLOCK,
+                 confirmations=INDEXER_CONFIRMATIONS, batch_blocks=INDEXER_BATCH_BLOCKS, users=None, reader=None):
+        self.w3 = w3
+        self.users = users or (lambda: [])
+        self.reader = reader
+        self.confirmations = confirmations
+        self.batch_blocks = batch_blocks
+        self.start_block = int(start_block) if start_block is not None else None
+        self.stake_addresses = {Web3.to_checksum_address(address) for address in stake_addresses}
+        self.router_address = Web3.to_checksum_address(router_address)
+        self.token_addresses = {Web3.to_checksum_address(address) for address in token_addresses}
+        self._events = self._event_table()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS cursor (id INTEGER PRIMARY KEY CHECK (id = 0), "
+            "block_number INTEGER NOT NULL, block_hash TEXT, updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS blocks (number INTEGER PRIMARY KEY, hash TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS events (block_number INTEGER NOT NULL, log_index INTEGER NOT NULL, "
+            "tx_hash TEXT NOT NULL, address TEXT NOT NULL, name TEXT NOT NULL, user TEXT, args TEXT NOT NULL, "
+            "PRIMARY KEY (block_number, log_index));"
+            "CREATE INDEX IF NOT EXISTS events_user ON events (user);"
+            "CREATE TABLE IF NOT EXISTS positions (protocol TEXT NOT NULL, user TEXT NOT NULL, amount TEXT NOT NULL, "
+            "PRIMARY KEY (protocol, user));"
+            "CREATE INDEX IF NOT EXISTS positions_user ON positions (user);"
+            "CREATE TABLE IF NOT EXISTS balances (token TEXT NOT NULL, holder TEXT NOT NULL, amount TEXT NOT NULL, "
+            "PRIMARY KEY (token, holder));"
+        )
+
+    # ---- reading ----
+
+    def cursor(self):
+        row = self._conn.execute("SELECT block_number, block_hash, updated_at FROM cursor WHERE id = 0").fetchone()
+        return {"block_number": row[0], "block_hash": row[1], "updated_at": row[2]} if row else None
+
+    def is_fresh(self, slack=INDEXER_FRESH_SLACK):
+        """Whether the cursor is within confirmations + slack blocks of the chain head."""
+        cursor = self.cursor()
+        if cursor is None:
+            return False
+        try:
+            head = self.w3.eth.block_number
+        except Exception as e:
+            print(f"Indexer head check failed: {e}")
+            return False
+        return head - cursor["block_number"] <= self.confirmations + slack
+
+    def positions(self, user):
+        return self.positions_many([user])[Web3.to_checksum_address(user)]
+
+    def positions_many(self, users):
+        """{user: {protocol: raw_amount}} for every non-zero position, in the StakedBalanceReader shape."""
+        users = [Web3.to_checksum_address(user) for user in users]
+        result = {user: {} for user in users}
+        for start in range(0, len(users), 500):
+            chunk = users[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT user, protocol, amount FROM positions WHERE user IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for user, protocol, amount in rows:
+                if int(amount) > 0:
+                    result[user][protocol] = int(amount)
+        return result
+
+    def balances(self, holder):
+        rows = self._conn.execute(
+            "SELECT token, amount FROM balances WHERE holder = ?", (Web3.to_checksum_address(holder),)
+        ).fetchall()
+        return {token: int(amount) for token, amount in rows if int(amount) != 0}
+
+    def activity(self, user, limit=50):
+        rows = self._conn.execute(
+            "SELECT block_number, tx_hash, address, name, args FROM events WHERE user = ? "
+            "ORDER BY block_number DESC, log_index DESC LIMIT ?",
+            (Web3.to_checksum_address(user), limit),
+        ).fetchall()
+        return [
+            {"block_number": row[0], "tx_hash": row[1], "contract": row[2], "event": row[3], "args": orjson.loads(row[4])}
+            for row in rows
+        ]
+
+    # ---- writing ----
+
+    def bootstrap(self, matrix, block_number, block_hash=None, balances=None):
+        """
+        Seed positions (and token balances, {holder: {token: amount}}) from
+        StakedBalanceReader matrices read at block_number and start indexing
+        after it.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for user, amounts in matrix.items():
+                    for protocol, amount in amounts.items():
+                        self._set("positions", "protocol", "user", protocol, user, amount)
+                for holder, amounts in (balances or {}).items():
+                    for token, amount in amounts.items():
+                        self._set("balances", "token", "holder", token, holder, amount)
+                self._set_cursor(block_number, block_hash)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def seed(self):
+        """Bootstrap from the staked and token balances of users() at the confirmed head."""
+        block = self.w3.eth.get_block(self.w3.eth.block_number - self.confirmations)
+        users = list(self.users())
+        reader = self.reader or StakedBalanceReader(self.w3)
+        matrix = reader.read(users, sorted(self.stake_addresses), block_identifier=block["number"])
+        balances = reader.read_token_balances(users, sorted(self.token_addresses), block_identifier=block["number"])
+        self.bootstrap(matrix, block["number"], self._hex(block["hash"]), balances=balances)
+        print(f"Index seeded with {len(users)} users at block {block['number']}")
+
+    def apply_logs(self, logs, block_number=None, block_hash=None):
+        """
+        Decode and apply raw logs (as returned by eth_getLogs, or recorded
+        from it) in one transaction; logs already applied are skipped.
+        When block_number is given the cursor moves there afterwards.
+        """
+        applied = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for log in sorted(logs, key=lambda log: (log["blockNumber"], log["logIndex"])):
+                    applied += self._apply(log)
+                if block_number is not None:
+                    self._set_cursor(block_number, block_hash)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return applied
+
+    def rollback(self, block_number):
+        """Undo every event above block_number (a reorg fork point) and move the cursor back to it."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT address, name, args FROM events WHERE block_number > ? ORDER BY block_number DESC, log_index DESC",
+                    (block_number,),
+                ).fetchall()
+                for address, name, args in rows:
+                    self._apply_deltas(address, name, orjson.loads(args), sign=-1)
+                self._conn.execute("DELETE FROM events WHERE block_number > ?", (block_number,))
+                self._conn.execute("DELETE FROM blocks WHERE number > ?", (block_number,))
+                row = self._conn.execute("SELECT hash FROM blocks WHERE number = ?", (block_number,)).fetchone()
+                self._set_cursor(block_number, row[0] if row else None)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        print(f"Index rolled back {len(rows)} events to block {block_number}")
+        return len(rows)
+
+    def poll(self):
+        """Index the next batch of confirmed blocks. Returns the number of events applied."""
+        cursor = self.cursor()
+        if cursor is None:
+            if self.start_block is not None:
+                self._touch(self.start_block - 1, None)
+            else:
+                self.seed()
+            cursor = self.cursor()
+
+        fork = self._find_fork(cursor)
+        if fork is not None:
+            self.rollback(fork)
+            cursor = self.cursor()
+
+        head = self.w3.eth.block_number - self.confirmations
+        if head <= cursor["block_number"]:
+            self._touch(cursor["block_number"], cursor["block_hash"])
+            return 0
+
+        from_block = cursor["block_number"] + 1
+        to_block = min(head, from_block + self.batch_blocks - 1)
+        logs = self.w3.eth.get_logs({
+            "address": sorted(self.stake_addresses | self.token_addresses | {self.router_address}),
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "topics": [sorted(self._events)],
+        })
+        end = self.w3.eth.get_block(to_block)
+        return self.apply_logs(logs, block_number=to_block, block_hash=self._hex(end["hash"]))
+
+    def run_forever(self, interval=INDEXER_POLL_INTERVAL):
+        while True:
+            try:
+                caught_up = self.poll() == 0
+            except Exception as e:
+                print(f"Indexer poll failed: {e}")
+                caught_up = True
+            if caught_up:
+                time.sleep(interval)
+
+    # ---- internals ----
+
+    def _find_fork(self, cursor):
+        """Newest stored block whose hash still matches the chain, if the cursor block was reorged out."""
+        if cursor["block_hash"] is None:
+            return None
+        if self._hex(self.w3.eth.get_block(cursor["block_number"])["hash"]) == cursor["block_hash"]:
+            return None
+
+        rows = self._conn.execute(
+            "SELECT number, hash FROM blocks WHERE number < ? ORDER BY number DESC", (cursor["block_number"],)
+        ).fetchall()
+        for number, block_hash in rows:
+            if self._hex(self.w3.eth.get_block(number)["hash"]) == block_hash:
+                return number
+        oldest = rows[-1][0] if rows else cursor["block_number"]
+        return max(oldest - 1, (self.start_block or 1) - 1)
+
+    def _apply(self, log):
+        topic = self._hex(log["topics"][0]) if log["topics"] else None
+        address = Web3.to_checksum_address(log["address"])
+        if topic not in self._events or not self._accepts(address, self._events[topic][0]):
+            return 0
+
+        block_hash = self._hex(log["blockHash"])
+        stored = self._conn.execute(
+            "SELECT 1 FROM events WHERE block_number = ? AND log_index = ?", (log["blockNumber"], log["logIndex"])
+        ).fetchone()
+        if stored:
+            return 0
+
+        abi_path, event = self._events[topic]
+        args = {
+            key: value if isinstance(value, (int, str)) else self._hex(value)
+            for key, value in event.process_log(log)["args"].items()
+        }
+        self._conn.execute(
+            "INSERT INTO events (block_number, log_index, tx_hash, address, name, user, args) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (log["blockNumber"], log["logIndex"], self._hex(log["transactionHash"]), address, event.event_name,
+             self._user(event.event_name, args), orjson.dumps({k: str(v) if isinstance(v, int) else v for k, v in args.items()}).decode()),
+        )
+        self._conn.execute("INSERT OR REPLACE INTO blocks (number, hash) VALUES (?, ?)", (log["blockNumber"], block_hash))
+        self._apply_deltas(address, event.event_name, args, sign=1)
+        return 1
+
+    def _apply_deltas(self, address, name, args, sign):
+        match name:
+            case "Staked":
+                self._add("positions", "protocol", "user", address, args["staker"], sign * int(args["amount"]))
+            case "WithdrawAll" | "PartialWithdraw" | "EmergencyWithdraw":
+                self._add("positions", "protocol", "user", address, args["withdrawer"], -sign * int(args["amount"]))
+            case "Transfer":
+                if args["from"] != ZERO_ADDRESS:
+                    self._add("balances", "token", "holder", address, args["from"], -sign * int(args["value"]))
+                if args["to"] != ZERO_ADDRESS:
+                    self._add("balances", "token", "holder", address, args["to"], sign * int(args["value"]))
+
+    def _add(self, table, key_column, owner_column, key, owner, delta):
+        row = self._conn.execute(
+            f"SELECT amount FROM {table} WHERE {key_column} = ? AND {owner_column} = ?", (key, owner)
+        ).fetchone()
+        self._set(table, key_column, owner_column, key, owner, (int(row[0]) if row else 0) + delta)
+
+    def _set(self, table, key_column, owner_column, key, owner, amount):
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO {table} ({key_column}, {owner_column}, amount) VALUES (?, ?, ?)",
+            (Web3.to_checksum_address(key), Web3.to_checksum_address(owner), str(amount)),
+        )
+
+    def _set_cursor(self, block_number, block_hash):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cursor (id, block_number, block_hash, updated_at) VALUES (0, ?, ?, ?)",
+            (block_number, block_hash, time.time()),
+        )
+        if block_hash is not None:
+            self._conn.execute("INSERT OR REPLACE INTO blocks (number, hash) VALUES (?, ?)", (block_number, block_hash))
+        self._conn.execute("DELETE FROM blocks WHERE number < ?", (block_number - REORG_DEPTH,))
+
+    def _touch(self, block_number, block_hash):
+        with self._lock:
+            self._set_cursor(block_number, block_hash)
+
+    def _accepts(self, address, abi_path):
+        match abi_path:
+            case "./abi/MockStake.json":
+                return address in self.stake_addresses
+            case "./abi/OptiFinance.json":
+                return address == self.router_address
+            case _:
+                return address in self.token_addresses
+
+    @staticmethod
+    def _user(name, args):
+        match name:
+            case "Staked":
+                return args["staker"]
+            case "WithdrawAll" | "PartialWithdraw" | "EmergencyWithdraw":
+                return args["withdrawer"]
+            case "Swap":
+                return args["user"]
+            case "Transfer":
+                return args["to"] if args["from"] == ZERO_ADDRESS else args["from"]
+            case "Deposit" | "Withdrawal":
+                return args["from"]
+
+    def _event_table(self):
+        registry = get_registry()
+        events = {}
+        for abi_path, names in EVENTS.items():
+            contract = self.w3.eth.contract(abi=registry.abi(abi_path))
+            for name in names:
+                event = contract.events[name]()
+                entry = next(item for item in registry.abi(abi_path) if item.get("type") == "event" and item["name"] == name)
+                signature = f"{name}({','.join(item['type'] for item in entry['inputs'])})"
+                events[Web3.keccak(text=signature).to_0x_hex()] = (abi_path, event)
+        return events
+
+    @staticmethod
+    def _hex(value):
+        if isinstance(value, (bytes, bytearray)):
+            return "0x" + bytes(value).hex()
+        return value if value.startswith("0x") else "0x" + value
+
+
+def wallet_addresses():
+    """On-chain addresses of every wallet in the store."""
+    store, registry = get_wallet_store(), get_registry()
+    return [registry.address(key) for key in map(store.fetch_data, store.addresses()) if key is not None]
+
+
+_indexer = None
+_indexer_lock = threading.Lock()
+
+
+def get_indexer():
+    """The process-wide indexer over the shared RPC pool and the staking contracts of the yield snapshot, or None when disabled."""
+    global _indexer
+    if not INDEXER_ENABLED:
+        return None
+    if _indexer is None:
+        with _indexer_lock:
+            if _indexer is None:
+                _indexer = LogIndexer(get_web3(), get_yield_snapshot().staking_addresses, users=wallet_addresses)
+    return _indexer
@@ -0,0 +1,308 @@
+import os
+import time
+import uuid
+import socket
+import asyncio
+import sqlite3
+import threading
+import ipaddress
+from urllib.parse import urlsplit
+import aiohttp
+import orjson
+from aiohttp.resolver import ThreadedResolver
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "./data/jobs.db")
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "8"))
+JOBS_WEBHOOK_RETRIES = int(os.getenv("JOBS_WEBHOOK_RETRIES", "3"))
+JOBS_WEBHOOK_HOSTS = {host.strip().lower() for host in os.getenv("JOBS_WEBHOOK_HOSTS", "").split(",") if host.strip()}
+JOBS_WEBHOOK_INSECURE = os.getenv("JOBS_WEBHOOK_INSECURE", "false").lower() == "true"
+
+
+def is_public_address(address):
+    try:
+        return ipaddress.ip_address(address.split("%")[0]).is_global
+    except ValueError:
+        return False
+
+
+async def check_webhook_url(url, hosts=JOBS_WEBHOOK_HOSTS, insecure=JOBS_WEBHOOK_INSECURE):
+    """
+    Raise ValueError unless `url` is an https URL whose host is on the
+    JOBS_WEBHOOK_HOSTS allow-list (when set) and resolves only to public
+    addresses, so user input cannot make the server call into its own
+    network. `insecure` (local development only) also allows http and
+    private addresses.
+    """
+    parts = urlsplit(url)
+    if parts.scheme != "https" and not (insecure and parts.scheme == "http"):
+        raise ValueError("webhook_url must be an https URL")
+    if not parts.hostname or parts.username or parts.password:
+        raise ValueError("webhook_url must name a host and carry no credentials")
+    if hosts and parts.hostname.lower() not in hosts:
+        raise ValueError(f"webhook host {parts.hostname} is not allowed")
+    if insecure:
+        return
+    try:
+        infos = await asyncio.get_event_loop().getaddrinfo(parts.hostname, parts.port or 443, type=socket.SOCK_STREAM)
+    except OSError:
+        raise ValueError(f"webhook host {parts.hostname} does not resolve")
+    if not all(is_public_address(info[4][0]) for info in infos):
+        raise ValueError(f"webhook host {parts.hostname} resolves to a private address")
+
+
+class PublicResolver(ThreadedResolver):
+    """Resolver for webhook delivery: re-checks addresses at connect time, so DNS rebinding cannot reach private hosts."""
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        addresses = await super().resolve(host, port, family)
+        if not all(is_public_address(address["host"]) for address in addresses):
+            raise OSError(f"{host} resolves to a private address")
+        return addresses
+
+
+def wallet_actions(wallet):
+    """
+    Job actions for the /action endpoints. Each broadcasts with wait=False
+    and returns (tx_hashes, result); the job confirms every hash afterwards.
+    A string instead of hashes is the error message of a failed broadcast.
+    """
+
+    async def create_wallet(params):
+        await wallet.create_wallet(user_address=params["user_address"])
+        tx_hash = await wallet._fund_wallet(params["user_address"], wait=False)
+        return tx_hash, {"address": await wallet._check_address(params["user_address"])}
+
+    async def get_eth_faucet(params):
+        return await wallet._fund_wallet(params["user_address"], wait=False), {}
+
+    async def mint(params):
+        return await wallet.mint(params["user_address"], params["asset_id"], params["amount"], wait=False), {}
+
+    async def transfer(params):
+        return await wallet.transfer(
+            params["user_address"], params["contract_address"], params["to"], params["amount"], wait=False
+        ), {}
+
+    async def swap(params):
+        return await wallet.swap(
+            params["user_address"], params["spender"], params["token_in"], params["token_out"], params["amount"],
+            wait=False, return_all=True
+        ), {}
+
+    async def stake(params):
+        return await wallet.stake(
+            params["user_address"], params["asset_id"], params["protocol"], params["spender"], params["amount"],
+            wait=False, return_all=True
+        ), {}
+
+    async def unstake(params):
+        return await wallet.unstake(params["user_address"], params["protocol"], wait=False), {}
+
+    return {
+        "create-wallet": create_wallet,
+        "get-eth-faucet": get_eth_faucet,
+        "mint": mint,
+        "transfer": transfer,
+        "swap": swap,
+        "stake": stake,
+        "unstake": unstake,
+    }
+
+
+class JobStore:
+    """SQLite (WAL) table of jobs; status goes queued -> running -> submitted -> confirmed | failed."""
+
+    _COLUMNS = "id, action, params, status, tx_hashes, result, error, webhook_url, created_at, updated_at"
+
+    def __init__(self, db_path=JOBS_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, action TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL, "
+            "tx_hashes TEXT NOT NULL, result TEXT NOT NULL, error TEXT, webhook_url TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def create(self, action, params, webhook_url=None):
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex, "action": action, "params": params, "status": "queued",
+            "tx_hashes": [], "result": {}, "error": None, "webhook_url": webhook_url,
+            "created_at": now, "updated_at": now,
+        }
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, action, params, status, tx_hashes, result, error, webhook_url, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job["id"], action, orjson.dumps(params).decode(), "queued", "[]", "{}", None, webhook_url, now, now),
+            )
+        return job
+
+    def update(self, job, **fields):
+        job.update(fields, updated_at=time.time())
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, tx_hashes = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (job["status"], orjson.dumps(job["tx_hashes"]).decode(), orjson.dumps(job["result"]).decode(),
+                 job["error"], job["updated_at"], job["id"]),
+            )
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def unfinished(self):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE status IN ('queued', 'running', 'submitted') ORDER BY created_at"
+            ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    @staticmethod
+    def _to_job(row):
+        return {
+            "id": row[0], "action": row[1], "params": orjson.loads(row[2]), "status": row[3],
+            "tx_hashes": orjson.loads(row[4]), "result": orjson.loads(row[5]), "error": row[6],
+            "webhook_url": row[7], "created_at": row[8], "updated_at": row[9],
+        }
+
+
+class JobManager:
+    """
+    Runs wallet actions outside the HTTP request. submit() persists the job
+    and returns at once; `workers` asyncio tasks broadcast the transactions
+    and record the hash (submitted), then the receipt is awaited in a
+    separate task so workers never sit on confirmations (confirmed/failed).
+    On start, queued jobs are re-run and submitted jobs resume waiting for
+    their receipt; a job caught mid-broadcast is failed rather than re-sent,
+    since its transaction may already be on chain.
+    """
+
+    def __init__(self, wallet, store=None, workers=JOBS_WORKERS, webhook_hosts=JOBS_WEBHOOK_HOSTS,
+                 webhook_insecure=JOBS_WEBHOOK_INSECURE):
+        self.wallet = wallet
+        self.actions = wallet_actions(wallet)
+        self.store = store or JobStore()
+        self.workers = workers
+        self.webhook_hosts = webhook_hosts
+        self.webhook_insecure = webhook_insecure
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._background = set()
+        self._session = None
+
+    async def start(self):
+        connector = None if self.webhook_insecure else aiohttp.TCPConnector(resolver=PublicResolver())
+        self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=10))
+        for job in self.store.unfinished():
+            match job["status"]:
+                case "queued":
+                    self._queue.put_nowait(job)
+                case "submitted":
+                    self._track(self._confirm(job))
+                case _:
+                    self._finish(job, "failed", error="Interrupted by restart before the transaction hash was recorded")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def submit(self, action, params, webhook_url=None):
+        if action not in self.actions:
+            raise ValueError(f"Unknown job action: {action}")
+        if webhook_url is not None:
+            await check_webhook_url(webhook_url, self.webhook_hosts, self.webhook_insecure)
+        job = self.store.create(action, params, webhook_url)
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id):
+        job = self.store.get(job_id)
+        if job is not None:
+            job.pop("params")
+            job.pop("webhook_url")
+        return job
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                print(f"Job {job['id']} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job):
+        self.store.update(job, status="running")
+        try:
+            tx_hashes, result = await self.actions[job["action"]](job["params"])
+        except Exception as e:
+            return self._finish(job, "failed", error=str(e))
+        tx_hashes = [tx_hashes] if isinstance(tx_hashes, str) else tx_hashes
+        if not tx_hashes or not all(isinstance(tx_hash, str) and tx_hash.startswith("0x") for tx_hash in tx_hashes):
+            return self._finish(job, "failed", error=str(tx_hashes[0] if tx_hashes else "No transaction sent"))
+
+        self.store.update(job, status="submitted", tx_hashes=list(tx_hashes), result=result)
+        self._notify(job)
+        self._track(self._confirm(job))
+
+    async def _confirm(self, job):
+        try:
+            receipts = await asyncio.gather(*(self.wallet.wait_for_receipt(tx_hash) for tx_hash in job["tx_hashes"]))
+        except Exception as e:
+            return self._finish(job, "failed", error=f"Not confirmed: {e}")
+
+        result = {**job["result"], "block_number": receipts[-1]["blockNumber"]}
+        # Fee bumps replace stuck transactions: keep the hashes that were actually mined.
+        tx_hashes = [f"0x{receipt['transactionHash'].hex()}" for receipt in receipts]
+        reverted = [tx_hash for tx_hash, receipt in zip(tx_hashes, receipts) if receipt["status"] != 1]
+        if not reverted:
+            self._finish(job, "confirmed", result=result, tx_hashes=tx_hashes)
+        else:
+            self._finish(job, "failed", result=result, tx_hashes=tx_hashes, error=f"Transaction reverted: {', '.join(reverted)}")
+
+    def _finish(self, job, status, **fields):
+        self.store.update(job, status=status, **fields)
+        self._notify(job)
+
+    def _notify(self, job):
+        # Delivered in the background so a slow webhook never holds a wallet worker.
+        if not job.get("webhook_url") or self._session is None:
+            return
+        payload = {key: value for key, value in job.items() if key not in ("params", "webhook_url")}
+        self._track(self._deliver(job["id"], job["webhook_url"], payload))
+
+    def _track(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _deliver(self, job_id, webhook_url, payload):
+        for attempt in range(JOBS_WEBHOOK_RETRIES):
+            try:
+                async with self._session.post(webhook_url, data=orjson.dumps(payload), allow_redirects=False,
+                                              headers={"Content-Type": "application/json"}) as response:
+                    if response.status < 500:
+                        return
+            except Exception as e:
+                print(f"Webhook for job {job_id} failed: {e}")
+            await asyncio.sleep(2 ** attempt)
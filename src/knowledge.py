@@ -0,0 +1,82 @@
+import hashlib
+from typing import Any, List
+
+from langchain.docstore.document import Document
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from src.metrics import stage
+
+
+def to_page_content(row):
+    return f"IdProject: {row['idProtocol']}, Chain: {row['chain']}, Symbol: {row['nameToken']}, TVL: {row['tvl']}, APY: {row['apy']}, Stablecoin: {row['stablecoin']}"
+
+
+class KnowledgeBase:
+    """
+    FAISS index over the staking protocols that is rebuilt incrementally.
+    Rows are keyed by idProtocol and only new or changed rows are embedded;
+    the new index is swapped in with a single reference assignment, so
+    retrievals already running keep the index they started with.
+    """
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.vectorstore = None
+        self.version = None
+        self._rows = {}
+
+    def update(self, knowledge_data):
+        """Apply a fresh backend snapshot. Returns True when the index changed."""
+        documents = {}
+        for row in knowledge_data:
+            documents[str(row['idProtocol'])] = Document(
+                page_content=to_page_content(row),
+                metadata={"symbol": row["nameToken"], "protocol": row["idProtocol"]},
+            )
+        if not documents:
+            return False
+
+        changed = [
+            key for key, document in documents.items()
+            if key not in self._rows or self._rows[key][0].page_content != document.page_content
+        ]
+        removed = set(self._rows) - set(documents)
+        if self.vectorstore is not None and not changed and not removed:
+            return False
+
+        vectors = self.embeddings.embed_documents([documents[key].page_content for key in changed]) if changed else []
+        rows = {key: self._rows[key] for key in documents if key not in changed}
+        for key, vector in zip(changed, vectors):
+            rows[key] = (documents[key], vector)
+
+        keys = list(documents)
+        vectorstore = FAISS.from_embeddings(
+            [(rows[key][0].page_content, rows[key][1]) for key in keys],
+            self.embeddings,
+            metadatas=[rows[key][0].metadata for key in keys],
+            ids=keys,
+        )
+
+        self._rows = rows
+        self.vectorstore = vectorstore
+        self.version = hashlib.sha256(
+            "\n".join(rows[key][0].page_content for key in sorted(keys)).encode()
+        ).hexdigest()[:16]
+        print(f"Knowledge base {self.version}: {len(changed)} embedded, {len(removed)} removed, {len(keys)} total")
+        return True
+
+    def as_retriever(self, **search_kwargs):
+        return KnowledgeRetriever(knowledge=self, search_kwargs=search_kwargs)
+
+
+class KnowledgeRetriever(BaseRetriever):
+    """Retriever that always searches the knowledge base's current index."""
+
+    knowledge: Any
+    search_kwargs: dict = {}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with stage("retrieval"):
+            return self.knowledge.vectorstore.similarity_search(query, **self.search_kwargs)
@@ -0,0 +1,207 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, RemoveMessage, SystemMessage, trim_messages
+from langgraph.checkpoint.memory import MemorySaver
+
+load_dotenv()
+
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "memory")
+MEMORY_DB_PATH = os.getenv("MEMORY_DB_PATH", "./data/memory.db")
+MEMORY_MAX_THREADS = int(os.getenv("MEMORY_MAX_THREADS", "1000"))
+MEMORY_IDLE_TTL = float(os.getenv("MEMORY_IDLE_TTL", "3600"))
+MEMORY_KEEP_CHECKPOINTS = int(os.getenv("MEMORY_KEEP_CHECKPOINTS", "1"))
+MEMORY_MAX_MESSAGES = int(os.getenv("MEMORY_MAX_MESSAGES", "20"))
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "2000"))
+
+
+def count_tokens(messages):
+    # Roughly four characters per token; close enough to keep prompts bounded without a tokenizer.
+    return sum(len(str(message.content)) // 4 + 4 for message in messages)
+
+
+def bounded_prompt(system_prompt=None, max_tokens=MEMORY_MAX_TOKENS):
+    """state_modifier for create_react_agent that only sends the most recent turns that fit in max_tokens."""
+
+    def modifier(state):
+        messages = trim_messages(
+            state["messages"],
+            max_tokens=max_tokens,
+            token_counter=count_tokens,
+            strategy="last",
+            start_on="human",
+            allow_partial=False,
+        )
+        if system_prompt:
+            messages = [SystemMessage(content=system_prompt), *messages]
+        return messages
+
+    return modifier
+
+
+def compact_thread(agent, config, max_messages=MEMORY_MAX_MESSAGES):
+    """Drop the oldest turns of a thread so at most max_messages stay in the checkpoint, cutting on a user turn."""
+    messages = agent.get_state(config).values.get("messages", [])
+    if len(messages) <= max_messages:
+        return 0
+
+    cut = len(messages) - max_messages
+    while cut < len(messages) and not isinstance(messages[cut], HumanMessage):
+        cut += 1
+    removed = [RemoveMessage(id=message.id) for message in messages[:cut]]
+    if removed:
+        agent.update_state(config, {"messages": removed})
+    return len(removed)
+
+
+class ThreadTracker:
+    """LRU bookkeeping of thread activity shared by the bounded savers."""
+
+    def __init__(self, max_threads, idle_ttl):
+        self.max_threads = max_threads
+        self.idle_ttl = idle_ttl
+        self._threads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, thread_id):
+        with self._lock:
+            self._threads[thread_id] = time.monotonic()
+            self._threads.move_to_end(thread_id)
+
+    def forget(self, thread_id):
+        with self._lock:
+            self._threads.pop(thread_id, None)
+
+    def expired(self, keep=None):
+        """Pop and return the threads that are idle for too long or beyond max_threads."""
+        now = time.monotonic()
+        victims = []
+        with self._lock:
+            for thread_id, last_used in list(self._threads.items()):
+                if thread_id == keep:
+                    continue
+                if len(self._threads) > self.max_threads or now - last_used > self.idle_ttl:
+                    del self._threads[thread_id]
+                    victims.append(thread_id)
+                else:
+                    break
+        return victims
+
+    def __len__(self):
+        return len(self._threads)
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    MemorySaver that keeps only the last `keep_checkpoints` checkpoints of
+    each thread (and the channel blobs they reference) and deletes whole
+    threads that are idle for idle_ttl seconds or beyond max_threads.
+    """
+
+    def __init__(self, max_threads=MEMORY_MAX_THREADS, idle_ttl=MEMORY_IDLE_TTL,
+                 keep_checkpoints=MEMORY_KEEP_CHECKPOINTS, **kwargs):
+        super().__init__(**kwargs)
+        self.keep_checkpoints = max(1, keep_checkpoints)
+        self.threads = ThreadTracker(max_threads, idle_ttl)
+        self._lock = threading.RLock()
+
+    def get_tuple(self, config):
+        with self._lock:
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            self._prune(thread_id, config["configurable"]["checkpoint_ns"])
+        self.threads.touch(thread_id)
+        for victim in self.threads.expired(keep=thread_id):
+            self.delete_thread(victim)
+        return saved
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            return super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            super().delete_thread(thread_id)
+        self.threads.forget(thread_id)
+
+    def _prune(self, thread_id, checkpoint_ns):
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_checkpoints:
+            return
+
+        ordered = sorted(checkpoints)
+        for checkpoint_id in ordered[:-self.keep_checkpoints]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+        referenced = set()
+        for checkpoint_id in ordered[-self.keep_checkpoints:]:
+            versions = self.serde.loads_typed(checkpoints[checkpoint_id][0])["channel_versions"]
+            referenced.update(versions.items())
+        for key in [key for key in self.blobs if key[:2] == (thread_id, checkpoint_ns)]:
+            if (key[2], key[3]) not in referenced:
+                del self.blobs[key]
+
+
+def _bounded_sqlite_saver(path, max_threads, idle_ttl, keep_checkpoints):
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    class BoundedSqliteSaver(SqliteSaver):
+        """SqliteSaver with the same checkpoint pruning and idle-thread eviction as BoundedMemorySaver."""
+
+        def __init__(self, conn):
+            super().__init__(conn)
+            self.keep_checkpoints = max(1, keep_checkpoints)
+            self.threads = ThreadTracker(max_threads, idle_ttl)
+            with self.cursor(transaction=False) as cur:
+                cur.execute("SELECT DISTINCT thread_id FROM checkpoints")
+                for (thread_id,) in cur.fetchall():
+                    self.threads.touch(thread_id)
+
+        def put(self, config, checkpoint, metadata, new_versions):
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = str(config["configurable"]["thread_id"])
+            with self.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+                    "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT ?)",
+                    (thread_id, config["configurable"]["checkpoint_ns"],
+                     thread_id, config["configurable"]["checkpoint_ns"], self.keep_checkpoints),
+                )
+                cur.execute(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_id NOT IN ("
+                    "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ?)",
+                    (thread_id, thread_id),
+                )
+            self.threads.touch(thread_id)
+            for victim in self.threads.expired(keep=thread_id):
+                self.delete_thread(victim)
+            return saved
+
+        def delete_thread(self, thread_id):
+            with self.cursor() as cur:
+                cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (str(thread_id),))
+                cur.execute("DELETE FROM writes WHERE thread_id = ?", (str(thread_id),))
+            self.threads.forget(thread_id)
+
+    return BoundedSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+
+def create_checkpointer(backend=MEMORY_BACKEND, path=MEMORY_DB_PATH, max_threads=MEMORY_MAX_THREADS,
+                        idle_ttl=MEMORY_IDLE_TTL, keep_checkpoints=MEMORY_KEEP_CHECKPOINTS):
+    """Checkpointer for the agents: SQLite when MEMORY_BACKEND=sqlite and langgraph-checkpoint-sqlite is installed, else in memory."""
+    if backend == "sqlite":
+        try:
+            return _bounded_sqlite_saver(path, max_threads, idle_ttl, keep_checkpoints)
+        except ImportError:
+            print("langgraph-checkpoint-sqlite is not installed, keeping agent memory in process")
+    return BoundedMemorySaver(max_threads=max_threads, idle_ttl=idle_ttl, keep_checkpoints=keep_checkpoints)
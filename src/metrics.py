@@ -0,0 +1,168 @@
+import time
+import bisect
+import threading
+
+# Seconds; covers a cached read (ms) up to an LLM call or a confirmation wait (tens of seconds).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    escape = lambda value: str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values.items()]
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() is a bisect and a few additions under a lock."""
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, *labels):
+        """Context manager that observes the seconds spent in its block."""
+        return _Timer(self, labels)
+
+    def render(self):
+        with self._lock:
+            values = {labels: (list(counts), total) for labels, (counts, total) in self._values.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, {'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms updated on the hot path, plus stats() sources
+    that are only read at scrape time: every numeric value of such a dict
+    becomes a gauge `<prefix>_<key>`, so components that already keep
+    counters for /health need no extra instrumentation.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._sources = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(name, lambda: Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(name, lambda: Histogram(name, help, labelnames, buckets))
+
+    def register_stats(self, prefix, stats, **labels):
+        with self._lock:
+            self._sources.append((prefix, stats, labels))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            sources = list(self._sources)
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+
+        gauges = {}
+        for prefix, stats, labels in sources:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Metrics source {prefix} failed: {e}")
+                continue
+            for key, value in (values or {}).items():
+                if isinstance(value, (int, float)):
+                    gauges.setdefault(f"{prefix}_{key}", []).append((labels, value))
+        for name, samples in gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines += [f"{name}{_labels((), (), labels)} {_number(value)}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+    def _register(self, name, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry()
+    return _metrics
+
+
+STAGE_SECONDS = get_metrics().histogram(
+    "opti_stage_seconds", "Time spent in one internal stage of a request (nonce, simulate, confirm, llm, ...)", ("stage",)
+)
+
+
+def stage(name):
+    """`with stage("nonce"):` records the block's duration under opti_stage_seconds{stage="nonce"}."""
+    return STAGE_SECONDS.time(name)
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+NONCE_ERRORS = (
+    "nonce too low",
+    "nonce too high",
+    "replacement transaction underpriced",
+    "transaction underpriced",
+    "invalid nonce",
+)
+
+
+def is_nonce_error(error):
+    message = str(error).lower()
+    return any(pattern in message for pattern in NONCE_ERRORS)
+
+
+def is_already_known(error):
+    return "already known" in str(error).lower()
+
+
+class NonceManager:
+    """
+    Hands out sequential nonces per sender so several transactions from one
+    account can be in flight at once. Each address is seeded from its
+    "pending" transaction count and resynced whenever the node reports a
+    nonce conflict or a transaction is dropped or replaced.
+    """
+
+    def __init__(self, w3):
+        self.w3 = w3
+        self._next = {}
+        self._locks = defaultdict(asyncio.Lock)
+
+    async def allocate(self, address):
+        async with self._locks[address]:
+            if address not in self._next:
+                self._next[address] = await self.w3.eth.get_transaction_count(address, "pending")
+            nonce = self._next[address]
+            self._next[address] = nonce + 1
+            return nonce
+
+    async def release(self, address, nonce):
+        """Return a nonce whose transaction never reached the node."""
+        async with self._locks[address]:
+            if self._next.get(address) == nonce + 1:
+                self._next[address] = nonce
+            else:
+                # Later nonces are already out, so leave the gap to the next resync.
+                self._next.pop(address, None)
+
+    async def resync(self, address):
+        async with self._locks[address]:
+            self._next[address] = await self.w3.eth.get_transaction_count(address, "pending")
+            return self._next[address]
+
+    def reset(self, address=None):
+        if address is None:
+            self._next.clear()
+        else:
+            self._next.pop(address, None)
+
+
+class SyncNonceManager:
+    """
+    Thread-safe counterpart of NonceManager for the sync wallet, whose
+    runner threads share one admin key. Holding lock(address) across
+    allocate and the send keeps concurrent transactions on consecutive
+    nonces and lets a failed send hand its nonce back.
+    """
+
+    def __init__(self, w3):
+        self.w3 = w3
+        self._next = {}
+        self._locks = defaultdict(threading.RLock)
+        self._guard = threading.Lock()
+
+    def lock(self, address):
+        with self._guard:
+            return self._locks[address]
+
+    def allocate(self, address):
+        with self.lock(address):
+            if address not in self._next:
+                self._next[address] = self.w3.eth.get_transaction_count(address, "pending")
+            nonce = self._next[address]
+            self._next[address] = nonce + 1
+            return nonce
+
+    def release(self, address, nonce):
+        """Return a nonce whose transaction never reached the node."""
+        with self.lock(address):
+            if self._next.get(address) == nonce + 1:
+                self._next[address] = nonce
+            else:
+                self._next.pop(address, None)
+
+    def reset(self, address=None):
+        with self._guard:
+            if address is None:
+                self._next.clear()
+            else:
+                self._next.pop(address, None)
@@ -0,0 +1,116 @@
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PLANNER_MIN_IMPROVEMENT = float(os.getenv("PLANNER_MIN_IMPROVEMENT", "0.5"))
+RISK_FILTERS = {"low": "highest", "medium": "highest-best", "high": "highest-best"}
+
+
+class RebalancePlan:
+    """
+    Moves of one planning pass as parallel arrays: move i takes amount[i]
+    tokens of user users[user[i]] out of protocol source[i] and into
+    protocol target[i], swapping first when the two stake different tokens.
+    Moves of a user are contiguous, so the executor can batch per user.
+    """
+
+    def __init__(self, users, protocols, tokens, user, source, target, amount, improvement):
+        self.users = users
+        self.protocols = protocols
+        self.tokens = tokens
+        self.user = user
+        self.source = source
+        self.target = target
+        self.amount = amount
+        self.improvement = improvement
+        self.needs_swap = tokens[source] != tokens[target]
+        self._bounds = np.searchsorted(user, np.arange(len(users) + 1))
+
+    def __len__(self):
+        return len(self.user)
+
+    def moves_for(self, user_index):
+        start, end = self._bounds[user_index], self._bounds[user_index + 1]
+        return [self._move(i) for i in range(start, end)]
+
+    def by_user(self):
+        """{user_address: [move, ...]} for every user with at least one move."""
+        return {self.users[index]: self.moves_for(index) for index in np.unique(self.user)}
+
+    def _move(self, i):
+        return {
+            "from_protocol": self.protocols[self.source[i]],
+            "from_token": self.tokens[self.source[i]],
+            "to_protocol": self.protocols[self.target[i]],
+            "to_token": self.tokens[self.target[i]],
+            "amount": int(self.amount[i]),
+            "swap": bool(self.needs_swap[i]),
+            "improvement": float(self.improvement[i]),
+        }
+
+
+class RebalancePlanner:
+    """
+    Computes every user's moves from the yield snapshot in one vectorized
+    pass. Each risk profile maps to one target protocol (the best stablecoin
+    APY for low risk, the best APY otherwise); a position is moved there
+    only when the target pays at least min_improvement APY points more.
+    """
+
+    def __init__(self, snapshot, min_improvement=PLANNER_MIN_IMPROVEMENT):
+        self.min_improvement = min_improvement
+        self.protocols = np.array([protocol[0] for protocol in snapshot.protocols], dtype=object)
+        self.tokens = np.array([protocol[2] for protocol in snapshot.protocols], dtype=object)
+        self.apy = np.array([protocol[1] for protocol in snapshot.protocols], dtype=np.float64)
+        self.index = {address.lower(): i for i, address in enumerate(self.protocols)}
+
+        self.risks = list(RISK_FILTERS)
+        self.risk_target = np.full(len(self.risks) + 1, -1, dtype=np.int64)
+        for code, risk in enumerate(self.risks):
+            best = snapshot.best_for(RISK_FILTERS[risk])
+            if best is not None:
+                self.risk_target[code] = self.index[best[0].lower()]
+
+    def position_matrix(self, users, staked):
+        """users x protocols token amounts from the {user: [{"protocol", "amount"}]} shape of get_data_staked_many."""
+        matrix = np.zeros((len(users), len(self.protocols)), dtype=np.float64)
+        for row, user in enumerate(users):
+            for position in staked.get(user, []):
+                column = self.index.get(position["protocol"].lower())
+                if column is not None:
+                    matrix[row, column] = position["amount"]
+        return matrix
+
+    def risk_codes(self, risks):
+        codes = {risk: code for code, risk in enumerate(self.risks)}
+        return np.fromiter((codes.get(risk, len(self.risks)) for risk in risks), dtype=np.int64, count=len(risks))
+
+    def plan(self, users, risks, positions):
+        """Plan moves for `users` given their risk profiles and a users x protocols matrix of staked tokens."""
+        positions = np.asarray(positions, dtype=np.float64).reshape(len(users), len(self.protocols))
+        if len(self.protocols) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return RebalancePlan(list(users), self.protocols, self.tokens, empty, empty, empty, empty, empty.astype(np.float64))
+
+        target = self.risk_target[self.risk_codes(risks)]
+        improvement = self.apy[target][:, None] - self.apy[None, :]
+
+        movable = (
+            (target[:, None] >= 0)
+            & (np.arange(len(self.protocols))[None, :] != target[:, None])
+            & (improvement >= self.min_improvement)
+            & (np.floor(positions) >= 1)
+        )
+        user, source = np.nonzero(movable)
+        return RebalancePlan(
+            users=list(users),
+            protocols=self.protocols,
+            tokens=self.tokens,
+            user=user,
+            source=source,
+            target=target[user],
+            amount=np.floor(positions[user, source]).astype(np.int64),
+            improvement=improvement[user, source],
+        )
@@ -0,0 +1,215 @@
+import os
+import asyncio
+from dotenv import load_dotenv
+from web3.exceptions import TimeExhausted, TransactionNotFound
+from src.registry import get_registry
+
+load_dotenv()
+
+RECEIPT_CONFIRMATIONS = int(os.getenv("RECEIPT_CONFIRMATIONS", "1"))
+RECEIPT_STUCK_BLOCKS = int(os.getenv("RECEIPT_STUCK_BLOCKS", "20"))
+RECEIPT_FEE_BUMP = float(os.getenv("RECEIPT_FEE_BUMP", "1.125"))
+RECEIPT_MAX_BUMPS = int(os.getenv("RECEIPT_MAX_BUMPS", "3"))
+
+
+class _Pending:
+    def __init__(self, future, first_block):
+        self.future = future
+        self.first_block = first_block
+        self.hashes = []
+        self.transaction = None
+        self.private_key = None
+        self.bumps = 0
+        self.waiters = 0
+
+
+class ReceiptWatcher:
+    """
+    One loop that confirms every pending transaction of the process. It
+    polls the chain head every `interval` seconds and, once per new block,
+    asks for the receipts of all pending hashes in a single JSON-RPC batch,
+    so RPC load follows the block rate rather than the number of waiters.
+    A receipt resolves its future once it is `confirmations` blocks deep,
+    and its gasUsed is reported to `fees` (a FeeOracle) when one is given.
+    A tracked transaction that is still pending after stuck_blocks is
+    re-signed on the same nonce with fees raised by fee_bump (up to
+    max_bumps times) while someone waits on it; whichever version is mined
+    resolves the wait, so the receipt carries the final hash. Transactions
+    nobody waits on are never bumped and are forgotten after stuck_blocks.
+    """
+
+    def __init__(self, w3, confirmations=RECEIPT_CONFIRMATIONS, interval=0.5,
+                 stuck_blocks=RECEIPT_STUCK_BLOCKS, fee_bump=RECEIPT_FEE_BUMP, max_bumps=RECEIPT_MAX_BUMPS, fees=None):
+        self.w3 = w3
+        self.fees = fees
+        self.confirmations = confirmations
+        self.interval = interval
+        self.stuck_blocks = stuck_blocks
+        self.fee_bump = fee_bump
+        self.max_bumps = max_bumps
+        self.contracts = get_registry()
+        self.head = None
+        self.blocks = 0
+        self.batches = 0
+        self.confirmed = 0
+        self.replaced = 0
+        self.expired = 0
+        self._pending = {}
+        self._wakeup = asyncio.Event()
+        self._fresh = False
+        self._task = None
+
+    def track(self, tx_hash, transaction, private_key):
+        """Remember how tx_hash was signed so it can be fee-bumped if it gets stuck."""
+        entry = self._entry(tx_hash)
+        entry.transaction = transaction
+        entry.private_key = private_key
+
+    async def wait(self, tx_hash, timeout):
+        entry = self._entry(tx_hash)
+        entry.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(entry.future), timeout)
+        except asyncio.TimeoutError:
+            raise TimeExhausted(f"Transaction {self._hex(tx_hash)} is not in the chain after {timeout} seconds")
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0 and not entry.future.done():
+                self._drop(entry)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self):
+        return {
+            "pending": len({id(entry) for entry in self._pending.values()}),
+            "head": self.head,
+            "blocks": self.blocks,
+            "batches": self.batches,
+            "confirmed": self.confirmed,
+            "replaced": self.replaced,
+            "expired": self.expired,
+        }
+
+    def _entry(self, tx_hash):
+        key = self._hex(tx_hash)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = _Pending(asyncio.get_event_loop().create_future(), self.head)
+            entry.hashes.append(key)
+            self._pending[key] = entry
+            if self._task is None or self._task.done():
+                self._task = asyncio.create_task(self._run())
+            self._fresh = True
+            self._wakeup.set()
+        return entry
+
+    def _drop(self, entry):
+        for key in entry.hashes:
+            if self._pending.get(key) is entry:
+                del self._pending[key]
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            try:
+                head = await self.w3.eth.block_number
+                # New hashes are looked up right away; after that only once per block.
+                if head != self.head or self._fresh:
+                    self.blocks += head != self.head
+                    self.head, self._fresh = head, False
+                    await self._on_block(head)
+            except Exception as e:
+                print(f"Receipt watcher poll failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _on_block(self, head):
+        keys = list(self._pending)
+        if not keys:
+            return
+        mined = await self._mined_blocks(keys)
+
+        for key, block_number in mined.items():
+            entry = self._pending.get(key)
+            if entry is None or entry.future.done() or head - block_number + 1 < self.confirmations:
+                continue
+            try:
+                receipt = await self.w3.eth.get_transaction_receipt(key)
+            except TransactionNotFound:
+                # Reorged out between the batch and this read: keep waiting.
+                continue
+            self.confirmed += 1
+            if self.fees is not None and entry.transaction is not None:
+                self.fees.observe(entry.transaction, receipt["gasUsed"])
+            entry.future.set_result(receipt)
+            self._drop(entry)
+
+        for entry in {id(entry): entry for entry in self._pending.values()}.values():
+            if entry.first_block is None:
+                entry.first_block = head
+            elif entry.waiters == 0:
+                if head - entry.first_block >= self.stuck_blocks:
+                    self.expired += 1
+                    self._drop(entry)
+            elif (entry.transaction is not None and entry.bumps < self.max_bumps
+                  and head - entry.first_block >= self.stuck_blocks * (entry.bumps + 1)
+                  and not any(key in mined for key in entry.hashes)):
+                await self._replace(entry)
+
+    async def _mined_blocks(self, keys):
+        """{hash: block number} for the keys that have a receipt, from one batch request."""
+        self.batches += 1
+        try:
+            responses = await self.w3.provider.make_batch_request(
+                [("eth_getTransactionReceipt", [key]) for key in keys]
+            )
+            results = [response.get("result") for response in responses]
+            return {
+                key: int(result["blockNumber"], 16) for key, result in zip(keys, results)
+                if result and result.get("blockNumber") is not None
+            }
+        except (NotImplementedError, TypeError):
+            # Providers without JSON-RPC batching (e.g. eth-tester) get one call per hash.
+            receipts = await asyncio.gather(
+                *(self.w3.eth.get_transaction_receipt(key) for key in keys), return_exceptions=True
+            )
+            return {
+                key: receipt["blockNumber"] for key, receipt in zip(keys, receipts)
+                if not isinstance(receipt, BaseException) and receipt.get("blockNumber") is not None
+            }
+
+    async def _replace(self, entry):
+        transaction = dict(entry.transaction)
+        if "gasPrice" in transaction:
+            transaction["gasPrice"] = int(transaction["gasPrice"] * self.fee_bump) + 1
+        else:
+            transaction["maxFeePerGas"] = int(transaction["maxFeePerGas"] * self.fee_bump) + 1
+            transaction["maxPriorityFeePerGas"] = int(transaction["maxPriorityFeePerGas"] * self.fee_bump) + 1
+
+        signed_txn = self.contracts.account(entry.private_key).sign_transaction(transaction)
+        try:
+            tx_hash = await self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+        except Exception as e:
+            # Usually "nonce too low": the original was mined in the meantime.
+            print(f"Fee bump of {entry.hashes[-1]} failed: {e}")
+            entry.bumps += 1
+            return
+
+        entry.transaction = transaction
+        entry.bumps += 1
+        key = self._hex(tx_hash)
+        entry.hashes.append(key)
+        self._pending[key] = entry
+        self.replaced += 1
+        print(f"Replaced stuck transaction {entry.hashes[-2]} with {key}")
+
+    @staticmethod
+    def _hex(value):
+        if isinstance(value, (bytes, bytearray)):
+            return "0x" + bytes(value).hex()
+        return value if value.startswith("0x") else "0x" + value
@@ -0,0 +1,72 @@
+import os
+import threading
+import orjson
+from eth_account import Account
+
+
+class ContractRegistry:
+    """
+    Process-wide cache of parsed ABIs, contract objects per (web3, address, abi)
+    and accounts derived from private keys.
+    """
+
+    def __init__(self):
+        self._abis = {}
+        self._contracts = {}
+        self._accounts = {}
+        self._lock = threading.Lock()
+
+    def abi(self, abi_path):
+        key = os.path.normpath(abi_path)
+        abi = self._abis.get(key)
+        if abi is None:
+            with open(key, 'rb') as file:
+                abi = orjson.loads(file.read())
+            with self._lock:
+                abi = self._abis.setdefault(key, abi)
+        return abi
+
+    def contract(self, w3, address, abi_path):
+        key = (w3, address, os.path.normpath(abi_path))
+        contract = self._contracts.get(key)
+        if contract is None:
+            contract = w3.eth.contract(address=address, abi=self.abi(abi_path))
+            with self._lock:
+                contract = self._contracts.setdefault(key, contract)
+        return contract
+
+    def account(self, private_key):
+        account = self._accounts.get(private_key)
+        if account is None:
+            account = Account.from_key(private_key)
+            with self._lock:
+                account = self._accounts.setdefault(private_key, account)
+        return account
+
+    def address(self, private_key):
+        return self.account(private_key).address
+
+    def invalidate(self, abi_path=None, address=None, private_key=None):
+        """Drop cached entries. Without arguments everything is cleared."""
+        with self._lock:
+            if abi_path is None and address is None and private_key is None:
+                self._abis.clear()
+                self._contracts.clear()
+                self._accounts.clear()
+                return
+
+            if abi_path is not None:
+                key = os.path.normpath(abi_path)
+                self._abis.pop(key, None)
+                self._contracts = {k: v for k, v in self._contracts.items() if k[2] != key}
+            if address is not None:
+                self._contracts = {k: v for k, v in self._contracts.items() if k[1] != address}
+            if private_key is not None:
+                self._accounts.pop(private_key, None)
+
+
+_registry = ContractRegistry()
+
+
+def get_registry():
+    return _registry
@@ -0,0 +1,158 @@
+import re
+import threading
+import orjson
+import numpy as np
+
+RANK_MAX_WORDS = "best|highest|higest|top|max|maximum|largest|biggest|most|greatest"
+RANK_MIN_WORDS = "lowest|least|smallest|minimum|min"
+TVL_WORDS = "tvl|liquidity|total value locked"
+APY_WORDS = "apy|apr|yield|yields|return|returns|interest"
+RANK_MAX = re.compile(rf"\b({RANK_MAX_WORDS})\b")
+METRIC_TVL = re.compile(rf"\b({TVL_WORDS})\b")
+METRIC_APY = re.compile(rf"\b({APY_WORDS})\b")
+# The superlative has to rank the metric itself ("highest APY", "best pool by TVL"), not something
+# else in the question ("minimum amount ... to earn yield", "most secure pool").
+RANKING = re.compile(rf"\b({RANK_MAX_WORDS}|{RANK_MIN_WORDS})\s+(?:\w+\s+){{0,3}}?({TVL_WORDS}|{APY_WORDS})\b")
+# Exclusions and explanations need the LLM: an argmax would answer a different question.
+NEGATION = re.compile(r"\b(not|no|excluding|exclude|except|without|ignoring|ignore|besides|other than)\b|n't\b|\bnon[-\s]?\w")
+EXPLANATION = re.compile(r"\b(why|explain|explains|how|describe)\b")
+STABLECOIN = re.compile(r"\bstable\s?coins?\b|\bstable\b")
+DISJUNCTION = re.compile(r"\bor\b")
+UPPER_WORD = re.compile(r"\b[A-Z][A-Z0-9]{1,9}\b")
+RESERVED_WORDS = {"APY", "APR", "TVL", "JSON", "USD", "ID", "DEFI", "CDP", "API", "OR", "AND"}
+
+
+class QueryRouter:
+    """
+    Answers ranking/filter questions ("best APY stablecoin on chain X",
+    "highest TVL pool for token Y") with an argmax over columnar NumPy
+    arrays built from knowledge_data. Anything it cannot parse with
+    confidence returns None and goes to the LLM agent, including
+    exclusions ("not on Base"), explanations ("why ...") and superlatives
+    that do not rank APY or TVL ("minimum amount", "most secure").
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._index = None
+        self._lock = threading.Lock()
+
+    def update(self, knowledge_data):
+        rows = [row for row in knowledge_data if row.get("idProtocol") is not None]
+        index = {
+            "id_project": np.array([str(row["idProtocol"]) for row in rows], dtype=object),
+            "chain": np.array([str(row.get("chain", "")).lower() for row in rows], dtype=object),
+            "symbol": np.array([str(row.get("nameToken", "")).upper() for row in rows], dtype=object),
+            "apy": np.array([self._to_float(row.get("apy")) for row in rows], dtype=np.float64),
+            "tvl": np.array([self._to_float(row.get("tvl")) for row in rows], dtype=np.float64),
+            "stablecoin": np.array([row.get("stablecoin") is True for row in rows], dtype=bool),
+        }
+        index["chains"] = sorted({chain for chain in index["chain"] if chain}, key=len, reverse=True)
+        index["symbols"] = {symbol for symbol in index["symbol"] if symbol}
+        index["symbol_parts"] = {part for symbol in index["symbols"] for part in re.split(r"[^A-Z0-9]+", symbol) if part}
+        index["protocols"] = {project.lower() for project in index["id_project"]}
+        self._index = index
+
+    def route(self, query):
+        """Return the agent's JSON answer for a ranking query, or None to fall through to the LLM."""
+        answer = self._answer(query)
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return answer
+
+    def entities(self, query):
+        """Tokens, chains and protocols named in `query`; two queries naming different ones have different answers."""
+        index = self._index
+        text = query.lower()
+        words = set(re.findall(r"[a-z0-9]+", text))
+        found = {("token", word) for word in UPPER_WORD.findall(query) if word not in RESERVED_WORDS}
+        if index is not None:
+            found |= {("token", part) for part in index["symbol_parts"] if part.lower() in words}
+            found |= {("chain", chain) for chain in index["chains"] if re.search(rf"\b{re.escape(chain)}\b", text)}
+            found |= {("protocol", project) for project in index["protocols"]
+                      if re.search(rf"(?<![\w-]){re.escape(project)}(?![\w-])", text)}
+        return frozenset(found)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def _answer(self, query):
+        index = self._index
+        if index is None or len(index["id_project"]) == 0:
+            return None
+
+        text = query.lower()
+        if NEGATION.search(text) or EXPLANATION.search(text):
+            return None
+        rankings = {(RANK_MAX.fullmatch(rank) is not None, METRIC_TVL.fullmatch(metric) is not None)
+                    for rank, metric in RANKING.findall(text)}
+        if len(rankings) != 1:
+            return None
+        maximize, wants_tvl = rankings.pop()
+
+        # A question that also mentions the other metric is not a plain ranking.
+        if METRIC_TVL.search(text) is not None and METRIC_APY.search(text) is not None:
+            return None
+        values = index["tvl"] if wants_tvl else index["apy"]
+
+        stable = STABLECOIN.search(text) is not None
+        tokens = self._tokens(query, index["symbols"])
+        chains = [chain for chain in index["chains"] if self._mentions_chain(text, chain)]
+        if len(chains) > 1:
+            return None
+
+        mask = np.ones(len(values), dtype=bool)
+        if chains:
+            mask &= index["chain"] == chains[0]
+
+        token_mask = None
+        if tokens:
+            token_mask = np.array([any(token in symbol for token in tokens) for symbol in index["symbol"]], dtype=bool)
+
+        if stable and token_mask is not None:
+            if not DISJUNCTION.search(text):
+                return None
+            mask &= index["stablecoin"] | token_mask
+        elif stable:
+            mask &= index["stablecoin"]
+        elif token_mask is not None:
+            mask &= token_mask
+
+        mask &= ~np.isnan(values)
+        if not mask.any():
+            return None
+
+        candidates = np.where(mask, values, -np.inf if maximize else np.inf)
+        position = int(np.argmax(candidates) if maximize else np.argmin(candidates))
+        return orjson.dumps({"id_project": index["id_project"][position]}).decode()
+
+    @staticmethod
+    def _mentions_chain(text, chain):
+        # Only "on X", "chain X", "X chain" etc. count, so "knowledge base" is not the Base chain.
+        chain = re.escape(chain)
+        return re.search(rf"\b(on|in|chain|network)\s+(the\s+)?{chain}\b|\b{chain}\s+(chain|network|mainnet)\b", text) is not None
+
+    @staticmethod
+    def _tokens(query, symbols):
+        tokens = set()
+        for word in UPPER_WORD.findall(query):
+            if word in RESERVED_WORDS:
+                continue
+            if word in symbols or any(word in symbol for symbol in symbols):
+                tokens.add(word)
+        for word in re.findall(r"\btoken\s+(\w+)", query, flags=re.IGNORECASE):
+            if word.upper() in symbols:
+                tokens.add(word.upper())
+        return tokens
+
+    @staticmethod
+    def _to_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
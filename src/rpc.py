@@ -0,0 +1,439 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import aiohttp
+import requests
+from dotenv import load_dotenv
+from web3 import Web3, AsyncWeb3, HTTPProvider, AsyncHTTPProvider
+from web3.providers import JSONBaseProvider
+from web3.providers.async_base import AsyncJSONBaseProvider
+from src.metrics import get_metrics
+
+load_dotenv()
+
+MANTA_RPC_URLS = [
+    url.strip() for url in (os.getenv("MANTA_RPC_URLS") or os.getenv("MANTA_RPC_URL") or "http://localhost:8545").split(",")
+    if url.strip()
+]
+RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", "10"))
+RPC_RATE_LIMIT = float(os.getenv("RPC_RATE_LIMIT", "0"))
+RPC_BURST = int(os.getenv("RPC_BURST", "20"))
+RPC_HEDGE_DELAY = float(os.getenv("RPC_HEDGE_DELAY", "0.3"))
+RPC_FAILURE_THRESHOLD = int(os.getenv("RPC_FAILURE_THRESHOLD", "3"))
+RPC_COOLDOWN = float(os.getenv("RPC_COOLDOWN", "10"))
+RPC_POOL_CONNECTIONS = int(os.getenv("RPC_POOL_CONNECTIONS", "32"))
+
+# Side-effect free calls: safe to send to a second endpoint while the first is still answering.
+READ_METHODS = {
+    "eth_blockNumber", "eth_call", "eth_chainId", "eth_estimateGas", "eth_feeHistory", "eth_gasPrice",
+    "eth_getBalance", "eth_getBlockByHash", "eth_getBlockByNumber", "eth_getCode", "eth_getLogs",
+    "eth_getStorageAt", "eth_getTransactionByHash", "eth_getTransactionCount", "eth_getTransactionReceipt",
+    "eth_maxPriorityFeePerGas", "eth_simulateV1", "net_version", "web3_clientVersion",
+}
+# Calls that depend on one node's mempool: a pending nonce read has to see our own sends.
+PINNED_METHODS = {"eth_getTransactionCount", "eth_sendRawTransaction"}
+THROTTLE_CODES = {429, -32005, -32090}
+TRANSPORT_ERRORS = (requests.RequestException, aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+RPC_SECONDS = get_metrics().histogram("opti_rpc_seconds", "JSON-RPC call latency including failover and hedging", ("method",))
+RPC_ERRORS = get_metrics().counter("opti_rpc_errors_total", "JSON-RPC calls that failed on every endpoint or returned an error", ("method",))
+
+
+class TokenBucket:
+    """`rate` requests per second with bursts of up to `burst`; a rate of 0 never limits."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Reserve a token and return the seconds to wait before using it (0 if one was free)."""
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            self._refill()
+            # The balance may go negative: later callers queue up behind the reservations already made.
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_take(self):
+        """Take a token if one is free right now."""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def wait_time(self):
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            self._refill()
+            return max(0, 1 - self.tokens) / self.rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class Endpoint:
+    def __init__(self, url, rate_limit, burst):
+        self.url = url
+        self.bucket = TokenBucket(rate_limit, burst)
+        self.latency = None
+        self.failures = 0
+        self.cooldown_until = 0
+        self.requests = 0
+        self.errors = 0
+        self.hedged = 0
+        self._provider = None
+        self._async_provider = None
+
+    @property
+    def provider(self):
+        if self._provider is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=RPC_POOL_CONNECTIONS, pool_maxsize=RPC_POOL_CONNECTIONS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._provider = HTTPProvider(self.url, session=session, request_kwargs={"timeout": RPC_TIMEOUT})
+        return self._provider
+
+    @property
+    def async_provider(self):
+        if self._async_provider is None:
+            self._async_provider = AsyncHTTPProvider(self.url, request_kwargs={"timeout": aiohttp.ClientTimeout(total=RPC_TIMEOUT)})
+        return self._async_provider
+
+    def available(self, now):
+        return now >= self.cooldown_until
+
+    def score(self):
+        return (self.latency if self.latency is not None else 0.0) * (1 + self.failures)
+
+
+class RpcPool:
+    """
+    Health-scored set of RPC endpoints shared by every provider in the
+    process. Requests go to the endpoint with the best latency/failure
+    score that has a rate-limit token; one that fails failure_threshold
+    times in a row is benched for `cooldown` seconds (unless nothing else
+    is left). Pinned requests (sends and pending nonce reads) ignore the
+    score and go to the first available endpoint in configuration order,
+    so nonces are always read from the mempool our transactions went to.
+    """
+
+    def __init__(self, urls=None, rate_limit=RPC_RATE_LIMIT, burst=RPC_BURST, hedge_delay=RPC_HEDGE_DELAY,
+                 failure_threshold=RPC_FAILURE_THRESHOLD, cooldown=RPC_COOLDOWN):
+        self.endpoints = [Endpoint(url, rate_limit, burst) for url in urls or MANTA_RPC_URLS]
+        self.hedge_delay = hedge_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    def ordered(self, exclude=(), pinned=False):
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        healthy = [endpoint for endpoint in candidates if endpoint.available(now)]
+        return (healthy or candidates) if pinned else sorted(healthy or candidates, key=Endpoint.score)
+
+    def pick(self, exclude=(), pinned=False):
+        """
+        (endpoint, 0) for the best endpoint with a free token, else the
+        endpoint whose token comes soonest and the seconds to wait for it;
+        either way the token is taken.
+        """
+        candidates = self.ordered(exclude, pinned)
+        if not candidates:
+            return None, 0
+        if pinned:
+            return candidates[0], candidates[0].bucket.take()
+        for endpoint in candidates:
+            if endpoint.bucket.try_take():
+                return endpoint, 0
+        endpoint = min(candidates, key=lambda endpoint: endpoint.bucket.wait_time())
+        return endpoint, endpoint.bucket.take()
+
+    def hedge_for(self, method, primary):
+        if method not in READ_METHODS or self.hedge_delay <= 0:
+            return None
+        now = time.monotonic()
+        for endpoint in self.ordered(exclude=(primary,)):
+            if endpoint.available(now) and endpoint.bucket.try_take():
+                return endpoint
+        return None
+
+    def succeeded(self, endpoint, elapsed):
+        with self._lock:
+            endpoint.requests += 1
+            endpoint.failures = 0
+            endpoint.latency = elapsed if endpoint.latency is None else 0.8 * endpoint.latency + 0.2 * elapsed
+
+    def failed(self, endpoint, error):
+        with self._lock:
+            endpoint.requests += 1
+            endpoint.errors += 1
+            endpoint.failures += 1
+            if endpoint.failures >= self.failure_threshold:
+                endpoint.cooldown_until = time.monotonic() + self.cooldown
+        print(f"RPC {endpoint.url} failed: {error}")
+
+    def stats(self):
+        now = time.monotonic()
+        return [
+            {
+                "url": endpoint.url,
+                "healthy": endpoint.available(now),
+                "latency": endpoint.latency,
+                "requests": endpoint.requests,
+                "errors": endpoint.errors,
+                "hedged": endpoint.hedged,
+            }
+            for endpoint in self.endpoints
+        ]
+
+
+def is_throttled(response):
+    error = response.get("error") if isinstance(response, dict) else None
+    if not isinstance(error, dict):
+        return False
+    message = str(error.get("message", "")).lower()
+    return error.get("code") in THROTTLE_CODES or "rate limit" in message or "too many requests" in message
+
+
+def is_pinned(method, params):
+    if method not in PINNED_METHODS:
+        return False
+    return method == "eth_sendRawTransaction" or (len(params) > 1 and params[1] == "pending")
+
+
+def _counted(method, fn, *args):
+    try:
+        response = fn(*args)
+    except Exception:
+        RPC_ERRORS.inc(method)
+        raise
+    if isinstance(response, dict) and "error" in response:
+        RPC_ERRORS.inc(method)
+    return response
+
+
+class PooledProvider(JSONBaseProvider):
+    """
+    Sync web3 provider over an RpcPool. Transport errors and throttling
+    answers fail over to the next endpoint; reads still unanswered after
+    hedge_delay are also sent to a second endpoint and the first answer
+    wins. `semaphore` optionally caps the requests in flight.
+    """
+
+    _hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="rpc-hedge")
+
+    def __init__(self, pool=None, semaphore=None, **kwargs):
+        super().__init__(**kwargs)
+        self.pool = pool or get_rpc_pool()
+        self.semaphore = semaphore
+
+    def make_request(self, method, params):
+        with RPC_SECONDS.time(method):
+            if self.semaphore is None:
+                return _counted(method, self._request, method, params)
+            with self.semaphore:
+                return _counted(method, self._request, method, params)
+
+    def make_batch_request(self, batch_requests):
+        call = lambda endpoint: endpoint.provider.make_batch_request(batch_requests)
+        with RPC_SECONDS.time("batch"):
+            if self.semaphore is None:
+                return _counted("batch", self._failover, call)
+            with self.semaphore:
+                return _counted("batch", self._failover, call)
+
+    def _request(self, method, params):
+        call = lambda endpoint: endpoint.provider.make_request(method, params)
+        pinned = is_pinned(method, params)
+        endpoint, delay = self.pool.pick(pinned=pinned)
+        if delay:
+            time.sleep(delay)
+
+        hedge = None
+        if pinned or method not in READ_METHODS or self.pool.hedge_delay <= 0 or len(self.pool.endpoints) < 2:
+            response, error = self._timed(endpoint, call)
+        else:
+            primary = self._hedge_executor.submit(self._timed, endpoint, call)
+            done, _ = wait([primary], timeout=self.pool.hedge_delay)
+            if not done:
+                hedge = self.pool.hedge_for(method, endpoint)
+            if hedge is None:
+                response, error = primary.result()
+        if hedge is not None:
+            hedge.hedged += 1
+            secondary = self._hedge_executor.submit(self._timed, hedge, call)
+            done, pending = wait([primary, secondary], return_when=FIRST_COMPLETED)
+            response, error = next(iter(done)).result()
+            if error is not None and pending:
+                response, error = next(iter(pending)).result()
+            endpoint = hedge if error is None and secondary in done else endpoint
+
+        if error is None:
+            return response
+        return self._failover(call, exclude=(endpoint, hedge), error=error, pinned=pinned)
+
+    def _failover(self, call, exclude=(), error=None, pinned=False):
+        tried = [endpoint for endpoint in exclude if endpoint is not None]
+        while True:
+            endpoint, delay = self.pool.pick(exclude=tried, pinned=pinned)
+            if endpoint is None:
+                if isinstance(error, dict):
+                    return error
+                raise error or ConnectionError("No RPC endpoint available")
+            if delay:
+                time.sleep(delay)
+            response, error = self._timed(endpoint, call)
+            if error is None:
+                return response
+            tried.append(endpoint)
+
+    def _timed(self, endpoint, call):
+        """(response, None) on success; (None, exception) or (response, response) when the endpoint should be avoided."""
+        started = time.monotonic()
+        try:
+            response = call(endpoint)
+        except TRANSPORT_ERRORS as e:
+            self.pool.failed(endpoint, e)
+            return None, e
+        if is_throttled(response):
+            self.pool.failed(endpoint, response["error"])
+            return response, response
+        self.pool.succeeded(endpoint, time.monotonic() - started)
+        return response, None
+
+
+class AsyncPooledProvider(AsyncJSONBaseProvider):
+    """Async counterpart of PooledProvider; cache_async_session shares one aiohttp session across endpoints."""
+
+    def __init__(self, pool=None, **kwargs):
+        super().__init__(**kwargs)
+        self.pool = pool or get_rpc_pool()
+
+    async def cache_async_session(self, session):
+        for endpoint in self.pool.endpoints:
+            await endpoint.async_provider.cache_async_session(session)
+        return session
+
+    async def make_request(self, method, params):
+        with RPC_SECONDS.time(method):
+            try:
+                response = await self._request(method, params)
+            except Exception:
+                RPC_ERRORS.inc(method)
+                raise
+        if isinstance(response, dict) and "error" in response:
+            RPC_ERRORS.inc(method)
+        return response
+
+    async def make_batch_request(self, batch_requests):
+        with RPC_SECONDS.time("batch"):
+            try:
+                return await self._failover(lambda endpoint: endpoint.async_provider.make_batch_request(batch_requests))
+            except Exception:
+                RPC_ERRORS.inc("batch")
+                raise
+
+    async def _request(self, method, params):
+        call = lambda endpoint: endpoint.async_provider.make_request(method, params)
+        pinned = is_pinned(method, params)
+        endpoint, delay = self.pool.pick(pinned=pinned)
+        if delay:
+            await asyncio.sleep(delay)
+
+        hedge = None
+        if pinned or method not in READ_METHODS or self.pool.hedge_delay <= 0 or len(self.pool.endpoints) < 2:
+            response, error = await self._timed(endpoint, call)
+        else:
+            primary = asyncio.ensure_future(self._timed(endpoint, call))
+            done, _ = await asyncio.wait([primary], timeout=self.pool.hedge_delay)
+            if not done:
+                hedge = self.pool.hedge_for(method, endpoint)
+            if hedge is None:
+                response, error = await primary
+        if hedge is not None:
+            hedge.hedged += 1
+            secondary = asyncio.ensure_future(self._timed(hedge, call))
+            done, pending = await asyncio.wait([primary, secondary], return_when=asyncio.FIRST_COMPLETED)
+            winner = next(iter(done))
+            response, error = winner.result()
+            if error is not None and pending:
+                response, error = await next(iter(pending))
+            else:
+                for task in pending:
+                    task.cancel()
+            endpoint = hedge if error is None and winner is secondary else endpoint
+
+        if error is None:
+            return response
+        return await self._failover(call, exclude=(endpoint, hedge), error=error, pinned=pinned)
+
+    async def _failover(self, call, exclude=(), error=None, pinned=False):
+        tried = [endpoint for endpoint in exclude if endpoint is not None]
+        while True:
+            endpoint, delay = self.pool.pick(exclude=tried, pinned=pinned)
+            if endpoint is None:
+                if isinstance(error, dict):
+                    return error
+                raise error or ConnectionError("No RPC endpoint available")
+            if delay:
+                await asyncio.sleep(delay)
+            response, error = await self._timed(endpoint, call)
+            if error is None:
+                return response
+            tried.append(endpoint)
+
+    async def _timed(self, endpoint, call):
+        started = time.monotonic()
+        try:
+            response = await call(endpoint)
+        except TRANSPORT_ERRORS as e:
+            self.pool.failed(endpoint, e)
+            return None, e
+        if is_throttled(response):
+            self.pool.failed(endpoint, response["error"])
+            return response, response
+        self.pool.succeeded(endpoint, time.monotonic() - started)
+        return response, None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_web3 = None
+
+
+def get_rpc_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RpcPool()
+    return _pool
+
+
+def get_web3():
+    """Process-wide sync Web3 over the shared pool."""
+    global _web3
+    if _web3 is None:
+        with _pool_lock:
+            if _web3 is None:
+                _web3 = Web3(PooledProvider(get_rpc_pool()))
+    return _web3
+
+
+def get_async_web3():
+    return AsyncWeb3(AsyncPooledProvider(get_rpc_pool()))
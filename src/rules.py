@@ -1,4 +1,12 @@
 from src.checker import *
+from src.registry import get_registry
+from src.fees import get_fee_oracle
+from src.yields import get_yield_snapshot
+from src.approvals import get_approval_manager
+from src.planner import RebalancePlanner
+from src.simulation import get_simulator, TransactionRejected
+from src.rpc import get_web3
+from src.nonce import SyncNonceManager, is_nonce_error
 
 import os
 import orjson
@@ -6,26 +14,28 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+REBALANCE_MODE = os.getenv("REBALANCE_MODE", "batched")
+SWAP_SPENDER = "0x9F7b08e2365BFf594C4227752741Cb696B9b6E71"
+ROUTER_ADDRESS = "0x0b561A287588675AccE2f190FFa2AdCb30145e01"
+
 class AgentWalletSync:
-    def __init__(self):
-        self.file_path = "./data/wallet.json"
-        MANTA_RPC_URL = Web3.HTTPProvider(os.getenv("MANTA_RPC_URL"))
-        self.w3 = Web3(MANTA_RPC_URL)
+    def __init__(self, w3=None):
+        self.store = get_wallet_store()
+        self.contracts = get_registry()
+        self.fees = get_fee_oracle()
+        self.approvals = get_approval_manager()
+        self.simulator = get_simulator()
+        self.w3 = w3 or get_web3()
+        self.nonces = SyncNonceManager(self.w3)
         self.admin_private_key=os.getenv("PRIVATE_KEY")
 
     def fetch_data(self, user_address):
-        existing_data = self._load_existing_data()
-
-        for entry in existing_data:
-            if entry["user_address"] == user_address:
-                private_key = entry["data"]
-                
-                return private_key
-
-        print(f"No wallet data found for user address: {user_address}")
-        return None
+        private_key = self.store.fetch_data(user_address)
+        if private_key is None:
+            print(f"No wallet data found for user address: {user_address}")
+        return private_key
     
-    async def _get_token_ca(self, asset_id):
+    def _get_token_ca(self, asset_id):
         match asset_id:
             case "usdc":
                 return "0x94F0Fd09f425Be15C7Bc0575Aa71780A044039e3"
@@ -37,30 +47,38 @@ class AgentWalletSync:
                 return "0x7598099fFC36dCC3e96F3aB33f18E86F85ae7E44"
             case "dai":
                 return "0x74A8Ee760959AF0B18307861e92769CfEcC42f9B"
-    
+            case _ if Web3.is_address(asset_id):
+                return Web3.to_checksum_address(asset_id)
+
+    def _get_protocol_ca(self, protocol):
+        match protocol:
+            case "uniswap":
+                return "0xa976c4930e253CE56Ff129404a95F0578345C113"
+            case "compoundv3":
+                return "0xd39ef51d10FAeE75FE6fe66537F3D8128Ec72dA5"
+            case "usdxmoney":
+                return "0xF50c64a2C422C6809e5BdbcF4Bb5af38D06a033a"
+            case "stargatev3":
+                return "0x60e78201ac487E5C382379dc8f9e39a896396728"
+            case "aavev3":
+                return "0x23218e77D017AD293496976A5ee9Eb3F3F5EF217"
+            case _ if Web3.is_address(protocol):
+                return Web3.to_checksum_address(protocol)
+
     def swap(self, user_address, spender, token_in, token_out, amount):
         private_key = self.fetch_data(user_address)
-        sender_address = self.w3.eth.account.from_key(private_key).address
+        sender_address = self.contracts.address(private_key)
         
         amount_generalized = int(amount) * (10 ** 6)
         
         status = self.approve(sender_address, private_key, spender, token_in, amount)
         if status:
-            abi = self._read_abi("./abi/OptiFinance.json")
-            
-            staking_contract = self.w3.eth.contract(address="0x0b561A287588675AccE2f190FFa2AdCb30145e01", abi=abi)
+            staking_contract = self._contract(ROUTER_ADDRESS, "./abi/OptiFinance.json")
             nonce = self.w3.eth.get_transaction_count(sender_address)
             
-            transaction = staking_contract.functions.swap(token_in, token_out, amount_generalized).build_transaction({
-                'chainId': 3441006,
-                'gas': 1000000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': nonce,
-            })
-            
-            signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-            tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-            self.w3.eth.wait_for_transaction_receipt(tx_hash)
+            function = staking_contract.functions.swap(token_in, token_out, amount_generalized)
+            transaction = function.build_transaction(self._tx_params(function, sender_address, nonce))
+            tx_hash = self._send_spending(transaction, private_key, "swap", token_in, sender_address, spender, amount_generalized)
             
             return f"0x{tx_hash.hex()}"
         else:
@@ -68,193 +86,276 @@ class AgentWalletSync:
     
     def approve(self, sender_address, private_key, spender, token_in, amount):
         try:
-            approve_abi = self._read_abi("./abi/MockToken.json")
-            amount = int(amount) * (10 ** 6)
-            
-            token_contract = self.w3.eth.contract(address=token_in, abi=approve_abi)
-            nonce = self.w3.eth.get_transaction_count(sender_address)
-            
-            transaction = token_contract.functions.approve(spender, amount+10).build_transaction({
-                'chainId': 3441006,
-                'gas': 1000000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': nonce,
-            })
-            
-            signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-            tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-            self.w3.eth.wait_for_transaction_receipt(tx_hash)
-            
+            self._ensure_allowance(private_key, sender_address, spender, token_in, int(amount) * (10 ** 6))
             return True
         
+        except TransactionRejected:
+            raise
         except Exception as e:
             return False
+
+    def _ensure_allowance(self, private_key, sender_address, spender, token_in, required):
+        allowance = self.approvals.allowance_sync(self.w3, token_in, sender_address, spender)
+        if not self.approvals.needs_approval(allowance, required):
+            self.approvals.skip()
+            return
+
+        value = self.approvals.target(required, spender)
+        token_contract = self._contract(token_in, "./abi/MockToken.json")
+        if self.approvals.mode == "permit":
+            nonce = token_contract.functions.nonces(sender_address).call()
+            domain = token_contract.functions.eip712Domain().call()
+            deadline, v, r, s = self.approvals.sign_permit(private_key, spender, value, nonce, domain)
+            function = token_contract.functions.permit(sender_address, spender, value, deadline, v, r, s)
+        else:
+            function = token_contract.functions.approve(spender, value)
+
+        try:
+            if self.approvals.mode == "permit":
+                _, receipt = self._send_admin(function)
+            else:
+                nonce = self.w3.eth.get_transaction_count(sender_address)
+                transaction = function.build_transaction(self._tx_params(function, sender_address, nonce))
+                self.simulator.check_sync(self.w3, transaction, function.fn_name)
+                _, receipt = self._send(transaction, private_key)
+        except Exception:
+            self.approvals.invalidate(token_in, sender_address, spender)
+            raise
+        if receipt["status"] != 1:
+            self.approvals.invalidate(token_in, sender_address, spender)
+            raise RuntimeError(f"Approval for {spender} on {token_in} reverted")
+        self.approvals.record(token_in, sender_address, spender, value)
     
     def stake(self, user_address, asset_id, protocol, spender, amount):
-        approve_abi = self._read_abi("./abi/MockToken.json")
         amount = int(amount) * (10 ** 6)
         
         private_key = self.fetch_data(user_address)
-        sender_address = self.w3.eth.account.from_key(private_key).address
-        
-        contract_address = self._get_token_ca(asset_id)
-        token_contract = self.w3.eth.contract(address=contract_address, abi=approve_abi)
-        nonce = self.w3.eth.get_transaction_count(sender_address)
-        
-        transaction = token_contract.functions.approve(spender, amount+10).build_transaction({
-            'chainId': 3441006,
-            'gas': 1000000,
-            'gasPrice': self.w3.eth.gas_price,
-            'nonce': nonce,
-        })
+        sender_address = self.contracts.address(private_key)
         
-        signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        token_address = self._get_token_ca(asset_id)
+        self._ensure_allowance(private_key, sender_address, spender, token_address, amount)
         
         #=========================================================
         
-        abi = self._read_abi("./abi/MockStake.json")
-        
         contract_address = self._get_protocol_ca(protocol)
-        token_contract = self.w3.eth.contract(address=contract_address, abi=abi)
+        token_contract = self._contract(contract_address, "./abi/MockStake.json")
         nonce = self.w3.eth.get_transaction_count(sender_address)
         
-        transaction = token_contract.functions.stake(0, amount).build_transaction({
-            'chainId': 3441006,
-            'gas': 1000000,
-            'gasPrice': self.w3.eth.gas_price,
-            'nonce': nonce,
-        })
-        signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        function = token_contract.functions.stake(0, amount)
+        transaction = function.build_transaction(self._tx_params(function, sender_address, nonce))
+        tx_hash = self._send_spending(transaction, private_key, "stake", token_address, sender_address, spender, amount)
         
         return f"0x{tx_hash.hex()}"
     
     
     def unstake(self, user_address, protocol):        
-        abi = self._read_abi("./abi/MockStake.json")
-        
         private_key = self.fetch_data(user_address)
-        sender_address = self.w3.eth.account.from_key(private_key).address
+        sender_address = self.contracts.address(private_key)
         
         contract_address = self._get_protocol_ca(protocol)
-        token_contract = self.w3.eth.contract(address=contract_address, abi=abi)
+        token_contract = self._contract(contract_address, "./abi/MockStake.json")
         nonce = self.w3.eth.get_transaction_count(sender_address)
         
-        transaction = token_contract.functions.withdrawAll().build_transaction({
-            'chainId': 3441006,
-            'gas': 1000000,
-            'gasPrice': self.w3.eth.gas_price,
-            'nonce': nonce,
-        })
-        signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        function = token_contract.functions.withdrawAll()
+        transaction = function.build_transaction(self._tx_params(function, sender_address, nonce))
+        self.simulator.check_sync(self.w3, transaction, "withdrawAll")
+        tx_hash, _ = self._send(transaction, private_key)
         
         return f"0x{tx_hash.hex()}"
 
 
-    def _read_abi(self, abi_path):
-        with open(abi_path, 'r') as file:
-            return orjson.loads(file.read())
+    def rebalance(self, user_address, move, spender=SWAP_SPENDER):
+        """
+        Run one planned move (unstake -> swap -> stake) as a single batch:
+        the missing approvals and the three calls are simulated together,
+        signed on consecutive nonces, then broadcast back to back and
+        confirmed once, so they land in the same or adjacent blocks.
+        """
+        private_key = self.fetch_data(user_address)
+        sender_address = self.contracts.address(private_key)
+        amount = int(move["amount"]) * (10 ** 6)
+        from_protocol = self._get_protocol_ca(move["from_protocol"])
+        to_protocol = self._get_protocol_ca(move["to_protocol"])
+        to_token = self._get_token_ca(move["to_token"])
 
+        functions = [self._contract(from_protocol, "./abi/MockStake.json").functions.withdrawAll()]
+        allowances = []
+        if move["swap"]:
+            token_in = self._get_token_ca(move["from_token"])
+            functions += self._approval_steps(private_key, sender_address, spender, token_in, amount, allowances)
+            functions.append(self._contract(ROUTER_ADDRESS, "./abi/OptiFinance.json").functions.swap(token_in, to_token, amount))
+        functions += self._approval_steps(private_key, sender_address, to_protocol, to_token, amount, allowances)
+        functions.append(self._contract(to_protocol, "./abi/MockStake.json").functions.stake(0, amount))
 
-    def _load_existing_data(self):
-        if not os.path.exists(self.file_path):
-            return []
+        calls = [
+            {"from": sender_address, "to": function.address, "data": function._encode_transaction_data()}
+            for function in functions
+        ]
+        try:
+            tx_hashes = self._send_batch(functions, calls, sender_address, private_key)
+        except Exception:
+            # Rejected, dropped or reverted: whatever the approvals did is unknown now.
+            self.approvals.invalidate(owner=sender_address)
+            raise
 
-        with open(self.file_path, 'rb') as file:
-            return orjson.loads(file.read())
+        for token, owner, approved_spender, value in allowances:
+            self.approvals.record(token, owner, approved_spender, value)
+        if move["swap"]:
+            self.approvals.consume(token_in, sender_address, spender, amount)
+        self.approvals.consume(to_token, sender_address, to_protocol, amount)
+        return [f"0x{tx_hash.hex()}" for tx_hash in tx_hashes]
 
-    def _save_data(self, data):
-        with open(self.file_path, 'wb') as file:
-            file.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    def _send_batch(self, functions, calls, sender_address, private_key):
+        gas_used = self.simulator.check_sequence_sync(self.w3, calls, [function.fn_name for function in functions])
+        fees = self.fees.fee_params_sync(self.w3)
+        nonce = self.w3.eth.get_transaction_count(sender_address, "pending")
+        signed = []
+        for offset, (function, gas) in enumerate(zip(functions, gas_used)):
+            transaction = function.build_transaction({
+                'chainId': 3441006,
+                'from': sender_address,
+                'gas': int(gas * self.fees.margin) if gas else self.fees.estimate_gas_sync(function, sender_address),
+                'nonce': nonce + offset,
+                **fees,
+            })
+            signed.append((transaction, self.w3.eth.account.sign_transaction(transaction, private_key)))
 
+        tx_hashes = [self.w3.eth.send_raw_transaction(signed_txn.raw_transaction) for _, signed_txn in signed]
+        for function, (transaction, _), tx_hash in zip(functions, signed, tx_hashes):
+            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+            self.fees.observe(transaction, receipt["gasUsed"])
+            if receipt["status"] != 1:
+                raise RuntimeError(f"{function.fn_name} reverted in 0x{tx_hash.hex()}")
+        return tx_hashes
 
-def handle_user(user_address: str):
-    user_risk = get_risk(user_address)
-    user_staked = get_data_staked(user_address)
-    
-    match user_risk:
-        case "low":
-            handle_low_risk(user_address, user_staked)
-        case "medium":
-            handle_high_risk(user_address, user_staked)
-        case "high":
-            handle_high_risk(user_address, user_staked)
-
-
-def handle_low_risk(user_address, user_staked):
-    for i in range(len(user_staked)):
-        protocol, response_raw = get_apy(filter='highest')
-        result = handle_protocols(user_staked[i], protocol, response_raw)
-        
-        if result is None:
-            continue
+    def _approval_steps(self, private_key, sender_address, spender, token, required, allowances):
+        """Approve calls the batch needs; permits are submitted by the admin up front instead."""
+        if self.approvals.mode == "permit":
+            self._ensure_allowance(private_key, sender_address, spender, token, required)
+            return []
+        allowance = self.approvals.allowance_sync(self.w3, token, sender_address, spender)
+        if not self.approvals.needs_approval(allowance, required):
+            self.approvals.skip()
+            return []
+        value = self.approvals.target(required, spender)
+        allowances.append((token, sender_address, spender, value))
+        return [self._contract(token, "./abi/MockToken.json").functions.approve(spender, value)]
 
-        from_protocol, token_ca, amount = result
+    def _send_spending(self, transaction, private_key, name, token, owner, spender, amount):
+        """Simulate and send a transaction that spends `amount` of the owner's allowance for `spender`."""
         try:
-            agent = AgentWalletSync()
-            agent.unstake(user_address, from_protocol)
-            agent.swap(user_address, spender="0x9F7b08e2365BFf594C4227752741Cb696B9b6E71", token_in=token_ca, token_out=protocol[2], amount=amount)
-            agent.stake(user_address, protocol[2], protocol[0], amount)
-            print("success")
-        except Exception as e:
-            print(e)
-    
+            self.simulator.check_sync(self.w3, transaction, name)
+            tx_hash, receipt = self._send(transaction, private_key)
+        except Exception:
+            self.approvals.invalidate(token, owner, spender)
+            raise
+        if receipt["status"] != 1:
+            self.approvals.invalidate(token, owner, spender)
+        else:
+            self.approvals.consume(token, owner, spender, amount)
+        return tx_hash
 
-def handle_high_risk(user_address, user_staked):
-    for i in range(len(user_staked)):
-        protocol, response_raw = get_apy(filter='highest-best')
-        result = handle_protocols(user_staked[i], protocol, response_raw)
-        
-        if result is None:
-            continue
+    def _send_admin(self, function):
+        """
+        Simulate and send an admin transaction (a permit). Runner threads share
+        the admin key, so its nonces come from one local counter and each one
+        is sent before the next is handed out.
+        """
+        admin = self.contracts.address(self.admin_private_key)
+        with self.nonces.lock(admin):
+            nonce = self.nonces.allocate(admin)
+            transaction = function.build_transaction(self._tx_params(function, admin, nonce))
+            try:
+                self.simulator.check_sync(self.w3, transaction, function.fn_name)
+                signed_txn = self.w3.eth.account.sign_transaction(transaction, self.admin_private_key)
+                tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+            except Exception as e:
+                if is_nonce_error(e):
+                    self.nonces.reset(admin)
+                else:
+                    self.nonces.release(admin, nonce)
+                raise
+        try:
+            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        except Exception:
+            # Dropped: the counter may be ahead of the node now.
+            self.nonces.reset(admin)
+            raise
+        self.fees.observe(transaction, receipt["gasUsed"])
+        return tx_hash, receipt
 
-        from_protocol, token_ca, amount = result
-        
+    def _send(self, transaction, private_key):
+        """Sign, send and wait for one transaction; its gasUsed feeds the fee oracle's fallback limits."""
+        signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
+        tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        self.fees.observe(transaction, receipt["gasUsed"])
+        return tx_hash, receipt
+
+    def _tx_params(self, function, sender_address, nonce):
+        return {
+            'chainId': 3441006,
+            'from': sender_address,
+            'gas': self.fees.estimate_gas_sync(function, sender_address),
+            'nonce': nonce,
+            **self.fees.fee_params_sync(self.w3),
+        }
+
+    def _contract(self, address, abi_path):
+        return self.contracts.contract(self.w3, address, abi_path)
+
+    def _read_abi(self, abi_path):
+        return self.contracts.abi(abi_path)
+
+
+_agent_wallet_sync = None
+
+
+def get_agent_wallet_sync():
+    """Shared instance, so contracts cached in the registry are reused across users."""
+    global _agent_wallet_sync
+    if _agent_wallet_sync is None:
+        _agent_wallet_sync = AgentWalletSync()
+    return _agent_wallet_sync
+
+
+def handle_user(user_address: str, user_staked=None, agent=None, snapshot=None, moves=None):
+    snapshot = snapshot or get_yield_snapshot()
+    if moves is None:
+        if user_staked is None:
+            user_staked = get_data_staked(user_address, snapshot=snapshot)
+        planner = RebalancePlanner(snapshot)
+        plan = planner.plan(
+            [user_address], [get_risk(user_address)], planner.position_matrix([user_address], {user_address: user_staked})
+        )
+        moves = plan.moves_for(0)
+    return execute_moves(user_address, moves, agent)
+
+
+def execute_moves(user_address, moves, agent=None, mode=REBALANCE_MODE):
+    agent = agent or get_agent_wallet_sync()
+    errors = []
+    for move in moves:
         try:
-            agent = AgentWalletSync()
-            agent.unstake(user_address, from_protocol)
-            agent.swap(user_address, spender="0x9F7b08e2365BFf594C4227752741Cb696B9b6E71", token_in=token_ca, token_out=protocol[2], amount=amount)
-            agent.stake(user_address, protocol[2], protocol[0], amount)
+            if mode == "batched":
+                agent.rebalance(user_address, move)
+            else:
+                agent.unstake(user_address, move["from_protocol"])
+                if move["swap"]:
+                    agent.swap(user_address, spender=SWAP_SPENDER, token_in=move["from_token"], token_out=move["to_token"], amount=move["amount"])
+                agent.stake(user_address, move["to_token"], move["to_protocol"], move["to_protocol"], move["amount"])
             print("success")
         except Exception as e:
             print(e)
+            errors.append(str(e))
+    return errors
 
 
-def get_apy(filter):
-    result = requests.get('https://opti-backend.vercel.app/staking')
-    response = result.json()
-    
-    if filter == 'highest':
-        protocol = [(item['addressStaking'], float(item['apy']), item['addressToken']) for item in response if item['stablecoin'] is True]
-        highest_apy = max(protocol, key=lambda x: x[1])
-
-        return highest_apy, response
-    
-    elif filter == 'highest-best':
-        protocol = [(item['addressStaking'], float(item['apy']), item['addressToken']) for item in response]
-        highest_apy = max(protocol, key=lambda x: x[1])
-
-        return highest_apy, response
+def get_apy(filter, snapshot=None):
+    snapshot = snapshot or get_yield_snapshot()
+    return snapshot.best_for(filter), snapshot.response
     
 
-def handle_protocols(user_staked, protocol, response):
-    for item in [user_staked]:
-        protocol_address = item['protocol']
-        if protocol_address != protocol[0]:
-            token_ca = [item['addressToken'] for item in response if item['addressStaking'] == protocol_address][0]
-            return item['protocol'], token_ca, item['amount']
-    return None
-
-
 def runner():
-    with open('./data/wallet.json', 'rb') as file:
-        existing_data =  orjson.loads(file.read())
-        
-    address_list = [item['user_address'] for item in existing_data]
-    for address in address_list:
-        handle_user(address)
\ No newline at end of file
+    from src.runner import RebalanceRunner
+    return RebalanceRunner().run()
\ No newline at end of file
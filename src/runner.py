@@ -0,0 +1,182 @@
+import os
+import time
+import threading
+import orjson
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from web3 import Web3
+from dotenv import load_dotenv
+
+from src.store import get_wallet_store
+from src.checker import get_data_staked_many
+from src.rules import AgentWalletSync, execute_moves
+from src.planner import RebalancePlanner
+from src.yields import get_yield_snapshot
+from src.rpc import PooledProvider, get_rpc_pool
+
+load_dotenv()
+
+RUNNER_WORKERS = int(os.getenv("RUNNER_WORKERS", "8"))
+RUNNER_RPC_CONCURRENCY = int(os.getenv("RUNNER_RPC_CONCURRENCY", "16"))
+RUNNER_CHECKPOINT_PATH = os.getenv("RUNNER_CHECKPOINT_PATH", "./data/runner_checkpoint.jsonl")
+RUNNER_MAX_ATTEMPTS = int(os.getenv("RUNNER_MAX_ATTEMPTS", "3"))
+
+
+class Checkpoint:
+    """
+    Append-only progress log of one rebalancing cycle. The first line names
+    the cycle, each following line records one attempt at a user ("done" or
+    "failed"), and a final {"completed": true} line closes the cycle. Only
+    "done" users are skipped on resume; failed ones are retried until they
+    have failed max_attempts times.
+    """
+
+    def __init__(self, path, cycle, max_attempts=RUNNER_MAX_ATTEMPTS):
+        self.path = path
+        self.cycle = cycle
+        self.max_attempts = max_attempts
+        self.done = set()
+        self.failures = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    def open(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as file:
+                lines = [orjson.loads(line) for line in file if line.strip()]
+            if lines and lines[0].get("cycle") == self.cycle and not lines[-1].get("completed"):
+                for line in lines[1:]:
+                    if "user" in line:
+                        self._apply(line["user"], line["status"])
+                self._file = open(self.path, 'ab')
+                return self
+
+        self._file = open(self.path, 'wb')
+        self._write({"cycle": self.cycle})
+        return self
+
+    def pending(self, addresses):
+        """The addresses this cycle still has to (re)try."""
+        return [
+            address for address in addresses
+            if address not in self.done and self.failures.get(address, 0) < self.max_attempts
+        ]
+
+    def record(self, user_address, status, error=None):
+        with self._lock:
+            self._apply(user_address, status)
+        self._write({"user": user_address, "status": status, "error": error})
+
+    def complete(self):
+        self._write({"completed": True})
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _apply(self, user_address, status):
+        if status == "done":
+            self.done.add(user_address)
+            self.failures.pop(user_address, None)
+        else:
+            self.failures[user_address] = self.failures.get(user_address, 0) + 1
+
+    def _write(self, entry):
+        with self._lock:
+            self._file.write(orjson.dumps(entry) + b"\n")
+            self._file.flush()
+
+
+def pending_cycle(path=RUNNER_CHECKPOINT_PATH):
+    """Return the cycle of an interrupted run, or None if the last run completed."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as file:
+        lines = [orjson.loads(line) for line in file if line.strip()]
+    if not lines or lines[-1].get("completed"):
+        return None
+    return lines[0].get("cycle")
+
+
+class RebalanceRunner:
+    """
+    Rebalances every user with a bounded thread pool. Each user is handled
+    by exactly one worker at a time, all RPC traffic shares a concurrency
+    limit, and progress is checkpointed so an interrupted cycle resumes
+    with the users that were not finished yet. A cycle with failed users
+    stays open, so the next run of the same cycle retries them.
+    """
+
+    def __init__(self, workers=RUNNER_WORKERS, rpc_concurrency=RUNNER_RPC_CONCURRENCY,
+                 checkpoint_path=RUNNER_CHECKPOINT_PATH, cycle=None):
+        self.workers = workers
+        self.checkpoint_path = checkpoint_path
+        self.cycle = cycle or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        rpc_semaphore = threading.BoundedSemaphore(rpc_concurrency)
+        self.w3 = Web3(PooledProvider(get_rpc_pool(), semaphore=rpc_semaphore))
+        self.agent = AgentWalletSync(w3=self.w3)
+        self.execute = execute_moves
+
+    def run(self, addresses=None):
+        start_time = time.time()
+        checkpoint = Checkpoint(self.checkpoint_path, self.cycle).open()
+
+        addresses = list(dict.fromkeys(addresses or get_wallet_store().addresses()))
+        todo = checkpoint.pending(addresses)
+        if len(todo) < len(addresses) or checkpoint.failures:
+            print(f"Resuming cycle {self.cycle}: {len(checkpoint.done)} users already done, "
+                  f"{sum(address in checkpoint.failures for address in todo)} failed users retried")
+
+        moves = self.plan(todo) if todo else []
+
+        failures = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {
+                pool.submit(self.execute, address, user_moves, self.agent): address
+                for address, user_moves in zip(todo, moves)
+            }
+            for future in as_completed(futures):
+                address = futures[future]
+                try:
+                    errors = future.result() or []
+                except Exception as e:
+                    errors = [str(e)]
+
+                if errors:
+                    failures[address] = errors
+                    checkpoint.record(address, "failed", "; ".join(errors))
+                else:
+                    checkpoint.record(address, "done")
+
+        if checkpoint.pending(addresses):
+            checkpoint.close()
+        else:
+            checkpoint.complete()
+
+        elapsed = time.time() - start_time
+        summary = {
+            "cycle": self.cycle,
+            "users": len(addresses),
+            "processed": len(todo),
+            "skipped": len(addresses) - len(todo),
+            "succeeded": len(todo) - len(failures),
+            "failed": len(failures),
+            "elapsed": round(elapsed, 3),
+            "users_per_second": round(len(todo) / elapsed, 3) if elapsed > 0 else 0.0,
+            "failures": failures,
+        }
+        print(f"Rebalance {self.cycle}: {summary['succeeded']}/{summary['processed']} users succeeded, "
+              f"{summary['failed']} failed, {summary['skipped']} skipped, "
+              f"{summary['users_per_second']} users/s in {summary['elapsed']}s")
+        return summary
+
+    def plan(self, addresses):
+        """The list of moves of every address, in order."""
+        snapshot = get_yield_snapshot(refresh=True)
+        staked = get_data_staked_many(addresses, w3=self.w3, snapshot=snapshot)
+
+        planner = RebalancePlanner(snapshot)
+        store = get_wallet_store()
+        plan = planner.plan(addresses, [store.get_risk(address) for address in addresses], planner.position_matrix(addresses, staked))
+        print(f"Planned {len(plan)} moves for {len(addresses)} users")
+        return [plan.moves_for(index) for index in range(len(addresses))]
@@ -0,0 +1,241 @@
+import os
+import re
+import ast
+import glob
+import threading
+from eth_abi import decode
+from dotenv import load_dotenv
+from web3 import Web3
+from src.registry import get_registry
+
+load_dotenv()
+
+SIMULATION_ENABLED = os.getenv("SIMULATION_ENABLED", "true").lower() == "true"
+SIMULATION_BLOCK = os.getenv("SIMULATION_BLOCK", "pending")
+
+
+class TransactionRejected(Exception):
+    """A transaction that would revert; raised before it is sent. status_code is what the API answers with."""
+
+    status_code = 422
+
+    def __init__(self, error, args=None, function=None, reason=None):
+        self.error = error
+        self.details = args or {}
+        self.function = function
+        detail = reason or ", ".join(f"{key}={value}" for key, value in self.details.items())
+        super().__init__(f"{function or 'transaction'} would revert with {error}" + (f": {detail}" if detail else ""))
+
+
+class InsufficientBalance(TransactionRejected):
+    status_code = 400
+
+
+class InsufficientAllowance(TransactionRejected):
+    status_code = 400
+
+
+class InvalidSignature(TransactionRejected):
+    status_code = 400
+
+
+class Unauthorized(TransactionRejected):
+    status_code = 403
+
+
+class ContractPaused(TransactionRejected):
+    status_code = 409
+
+
+ERROR_TYPES = {
+    "ERC20InsufficientBalance": InsufficientBalance,
+    "ERC20InsufficientAllowance": InsufficientAllowance,
+    "ECDSAInvalidSignature": InvalidSignature,
+    "ECDSAInvalidSignatureLength": InvalidSignature,
+    "ECDSAInvalidSignatureS": InvalidSignature,
+    "ERC2612ExpiredSignature": InvalidSignature,
+    "ERC2612InvalidSigner": InvalidSignature,
+    "InvalidAccountNonce": InvalidSignature,
+    "OwnableUnauthorizedAccount": Unauthorized,
+    "EnforcedPause": ContractPaused,
+}
+
+
+class RevertDecoder:
+    """Maps revert data to typed exceptions using the custom errors declared in every ABI under ./abi."""
+
+    def __init__(self, abi_dir="./abi"):
+        registry = get_registry()
+        self.errors = {}
+        for abi_path in sorted(glob.glob(os.path.join(abi_dir, "*.json"))):
+            for entry in registry.abi(abi_path):
+                if entry.get("type") == "error":
+                    types = [item["type"] for item in entry["inputs"]]
+                    selector = Web3.keccak(text=f"{entry['name']}({','.join(types)})")[:4].to_0x_hex()
+                    self.errors[selector] = (entry["name"], [item["name"] for item in entry["inputs"]], types)
+
+    def decode(self, data, function=None, message=None):
+        data = data if isinstance(data, str) else Web3.to_hex(data) if data else "0x"
+        selector, payload = data[:10], bytes.fromhex(data[10:])
+        try:
+            match selector:
+                case "0x08c379a0":
+                    return TransactionRejected("Error", function=function, reason=decode(["string"], payload)[0])
+                case "0x4e487b71":
+                    return TransactionRejected("Panic", function=function, reason=hex(decode(["uint256"], payload)[0]))
+                case _ if selector in self.errors:
+                    name, names, types = self.errors[selector]
+                    values = [Web3.to_hex(value) if isinstance(value, bytes) else value for value in decode(types, payload)]
+                    return ERROR_TYPES.get(name, TransactionRejected)(name, dict(zip(names, values)), function)
+        except Exception:
+            pass
+        return TransactionRejected("revert", function=function, reason=message or (data if data != "0x" else None))
+
+
+def revert_data(exception):
+    """Raw revert data carried by a web3 call error, or None if the node did not return any."""
+    data = getattr(exception, "data", None)
+    if isinstance(data, str) and data.startswith("0x"):
+        return data
+    # eth-tester (local dev chains) only puts the repr of the revert bytes in its message.
+    match = re.search(r"(b'.*'|b\".*\")$", str(exception))
+    if match:
+        try:
+            return Web3.to_hex(ast.literal_eval(match.group(1)))
+        except (ValueError, SyntaxError):
+            pass
+    response = getattr(exception, "rpc_response", None) or (exception.args[0] if exception.args else None)
+    if isinstance(response, dict):
+        error = response.get("error", response)
+        data = error.get("data") if isinstance(error, dict) else None
+        if isinstance(data, dict):
+            data = data.get("data")
+        if isinstance(data, str) and data.startswith("0x"):
+            return data
+    return None
+
+
+class TransactionSimulator:
+    """
+    Dry-runs transactions with eth_call against the pending block before
+    they are signed, so a revert costs one RPC instead of gas and a
+    confirmation wait. A sequence whose later steps depend on the earlier
+    ones (approve -> swap) is simulated as a whole with eth_simulateV1;
+    nodes without it only get the first step checked. Rejections are
+    counted per error name.
+    """
+
+    def __init__(self, decoder=None, enabled=SIMULATION_ENABLED, block=SIMULATION_BLOCK):
+        self.decoder = decoder or RevertDecoder()
+        self.enabled = enabled
+        self.block = block
+        self.simulated = 0
+        self.rejected = {}
+        self._lock = threading.Lock()
+
+    async def check(self, w3, transaction, function=None):
+        if not self.enabled:
+            return
+        self._count()
+        try:
+            await w3.eth.call(self._call(transaction), self.block)
+        except Exception as e:
+            self._reject(e, function)
+
+    def check_sync(self, w3, transaction, function=None):
+        if not self.enabled:
+            return
+        self._count()
+        try:
+            w3.eth.call(self._call(transaction), self.block)
+        except Exception as e:
+            self._reject(e, function)
+
+    async def check_sequence(self, w3, transactions, functions=None):
+        """Simulate `transactions` in order; returns the gas each used, or Nones when only the first could be checked."""
+        if not self.enabled or len(transactions) == 1:
+            await self.check(w3, transactions[0], functions[0] if functions else None)
+            return [None] * len(transactions)
+        self._count()
+        response = await w3.provider.make_request("eth_simulateV1", self._simulate_params(transactions))
+        result = self._sequence_result(response, functions)
+        if result is None:
+            await self.check(w3, transactions[0], functions[0] if functions else None)
+            return [None] * len(transactions)
+        return result
+
+    def check_sequence_sync(self, w3, transactions, functions=None):
+        if not self.enabled or len(transactions) == 1:
+            self.check_sync(w3, transactions[0], functions[0] if functions else None)
+            return [None] * len(transactions)
+        self._count()
+        response = w3.provider.make_request("eth_simulateV1", self._simulate_params(transactions))
+        result = self._sequence_result(response, functions)
+        if result is None:
+            self.check_sync(w3, transactions[0], functions[0] if functions else None)
+            return [None] * len(transactions)
+        return result
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "simulated": self.simulated,
+            "rejected": sum(self.rejected.values()),
+            "rejected_by_error": dict(self.rejected),
+        }
+
+    def _sequence_result(self, response, functions):
+        if "error" in response:
+            return None
+        results = response["result"][0]["calls"]
+        for index, result in enumerate(results):
+            if int(result["status"], 16) != 1:
+                error = result.get("error") or {}
+                exception = self.decoder.decode(
+                    error.get("data") or result.get("returnData"), functions[index] if functions else None, error.get("message")
+                )
+                self._record(exception)
+                raise exception
+        return [int(result["gasUsed"], 16) for result in results]
+
+    def _simulate_params(self, transactions):
+        block = "latest" if self.block == "pending" else self.block
+        calls = [self._call(transaction) for transaction in transactions]
+        for call in calls:
+            if isinstance(call.get("value"), int):
+                call["value"] = hex(call["value"])
+        return [{"blockStateCalls": [{"calls": calls}], "validation": False}, block]
+
+    def _reject(self, exception, function):
+        data = revert_data(exception)
+        if data is None and "revert" not in str(exception).lower():
+            # Not a revert (RPC or network trouble): let the send path deal with it.
+            return
+        rejected = self.decoder.decode(data, function, str(exception))
+        self._record(rejected)
+        raise rejected from exception
+
+    def _record(self, exception):
+        with self._lock:
+            self.rejected[exception.error] = self.rejected.get(exception.error, 0) + 1
+
+    def _count(self):
+        with self._lock:
+            self.simulated += 1
+
+    @staticmethod
+    def _call(transaction):
+        return {key: transaction[key] for key in ("from", "to", "data", "value") if transaction.get(key) is not None}
+
+
+_simulator = None
+_simulator_lock = threading.Lock()
+
+
+def get_simulator():
+    global _simulator
+    if _simulator is None:
+        with _simulator_lock:
+            if _simulator is None:
+                _simulator = TransactionSimulator()
+    return _simulator
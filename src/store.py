@@ -0,0 +1,214 @@
+import os
+import sqlite3
+import threading
+import orjson
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WALLET_STORE = os.getenv("WALLET_STORE", "sqlite")
+WALLET_DB_PATH = os.getenv("WALLET_DB_PATH", "./data/wallet.db")
+WALLET_JSON_PATH = "./data/wallet.json"
+
+
+class WalletStore(ABC):
+    """
+    Storage backend for user wallets. Entries keep the legacy wallet.json shape:
+    {"user_address": ..., "data": <private key>, "risk_profile": ...}
+    """
+
+    @abstractmethod
+    def get(self, user_address):
+        ...
+
+    @abstractmethod
+    def insert(self, user_address, private_key):
+        """Store a new wallet. Returns False if the user already has one."""
+
+    @abstractmethod
+    def set_risk_profile(self, user_address, risk_profile):
+        ...
+
+    @abstractmethod
+    def addresses(self):
+        ...
+
+    def fetch_data(self, user_address):
+        entry = self.get(user_address)
+        return entry["data"] if entry else None
+
+    def get_risk(self, user_address):
+        entry = self.get(user_address)
+        return entry.get("risk_profile") if entry else None
+
+
+class MemoryWalletStore(WalletStore):
+    def __init__(self):
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_address):
+        return self._index.get(user_address)
+
+    def insert(self, user_address, private_key):
+        with self._lock:
+            if user_address in self._index:
+                return False
+            self._index[user_address] = {"user_address": user_address, "data": private_key, "risk_profile": None}
+            return True
+
+    def set_risk_profile(self, user_address, risk_profile):
+        with self._lock:
+            entry = self._index.get(user_address)
+            if entry is None:
+                return False
+            self._index[user_address] = {**entry, "risk_profile": risk_profile}
+            return True
+
+    def addresses(self):
+        return list(self._index)
+
+
+class SqliteWalletStore(WalletStore):
+    """
+    SQLite (WAL) backend with an in-memory index keyed by user_address.
+    Every write touches a single row, so concurrent requests never rewrite
+    each other's entries. The index is filled on open and on read misses,
+    and dropped whenever PRAGMA data_version shows that another connection
+    (e.g. the API while the scheduler runs) committed, so their inserts and
+    risk profile updates are seen on the next read.
+    """
+
+    def __init__(self, db_path=WALLET_DB_PATH, json_path=WALLET_JSON_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS wallets ("
+            "user_address TEXT PRIMARY KEY, data TEXT NOT NULL, risk_profile TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        if json_path:
+            self.migrate_from_json(json_path)
+
+        self._index = {}
+        self._data_version = None
+        self._revalidate()
+
+    def migrate_from_json(self, json_path):
+        """One-shot import of the legacy wallet.json file."""
+        with self._lock:
+            migrated = self._conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+            if migrated or not os.path.exists(json_path):
+                return 0
+
+            with open(json_path, 'rb') as file:
+                content = file.read()
+            existing_data = orjson.loads(content) if content.strip() else []
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.executemany(
+                    "INSERT OR IGNORE INTO wallets (user_address, data, risk_profile) VALUES (?, ?, ?)",
+                    [(entry["user_address"], entry["data"], entry.get("risk_profile")) for entry in existing_data],
+                )
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (json_path,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            print(f"Migrated {cursor.rowcount} wallets from {json_path}")
+            return cursor.rowcount
+
+    def get(self, user_address):
+        self._revalidate()
+        entry = self._index.get(user_address)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT user_address, data, risk_profile FROM wallets WHERE user_address = ?",
+                (user_address,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        entry = self._to_entry(row)
+        self._index[user_address] = entry
+        return entry
+
+    def insert(self, user_address, private_key):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO wallets (user_address, data) VALUES (?, ?)",
+                (user_address, private_key),
+            )
+        if cursor.rowcount == 0:
+            self._index.pop(user_address, None)
+            return False
+
+        self._index[user_address] = {"user_address": user_address, "data": private_key, "risk_profile": None}
+        return True
+
+    def set_risk_profile(self, user_address, risk_profile):
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE wallets SET risk_profile = ? WHERE user_address = ?",
+                (risk_profile, user_address),
+            )
+        if cursor.rowcount == 0:
+            return False
+
+        entry = self.get(user_address)
+        self._index[user_address] = {**entry, "risk_profile": risk_profile}
+        return True
+
+    def addresses(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT user_address FROM wallets ORDER BY rowid").fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        self._conn.close()
+
+    def _revalidate(self):
+        """Drop the index if another connection has committed since it was filled."""
+        with self._lock:
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return
+            if self._data_version is None:
+                rows = self._conn.execute("SELECT user_address, data, risk_profile FROM wallets").fetchall()
+                self._index = {row[0]: self._to_entry(row) for row in rows}
+            else:
+                # Refilled row by row through read misses.
+                self._index = {}
+            self._data_version = version
+
+    @staticmethod
+    def _to_entry(row):
+        return {"user_address": row[0], "data": row[1], "risk_profile": row[2]}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_wallet_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                match WALLET_STORE:
+                    case "memory":
+                        _store = MemoryWalletStore()
+                    case _:
+                        _store = SqliteWalletStore()
+    return _store
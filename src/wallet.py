@@ -1,103 +1,105 @@
 import os
-import orjson
-from web3 import Web3
+import asyncio
+import aiohttp
+from web3 import AsyncWeb3
+from web3.exceptions import TimeExhausted
 from dotenv import load_dotenv
+from src.store import get_wallet_store
+from src.nonce import NonceManager, is_nonce_error, is_already_known
+from src.registry import get_registry
+from src.fees import get_fee_oracle
+from src.faucet import FaucetBatcher
+from src.approvals import get_approval_manager
+from src.simulation import get_simulator, TransactionRejected
+from src.receipts import ReceiptWatcher
+from src.rpc import AsyncPooledProvider, get_rpc_pool
+from src.metrics import stage
 
 load_dotenv()
 
+CHAIN_ID = 3441006
+RPC_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE", "100"))
+TX_RECEIPT_TIMEOUT = float(os.getenv("TX_RECEIPT_TIMEOUT", "120"))
+TX_POLL_LATENCY = float(os.getenv("TX_POLL_LATENCY", "0.5"))
+
 class AgentWallet:
     def __init__(self):
-        self.file_path = "./data/wallet.json"
-        MANTA_RPC_URL = Web3.HTTPProvider(os.getenv("MANTA_RPC_URL"))
-        self.w3 = Web3(MANTA_RPC_URL)
+        self.store = get_wallet_store()
+        self.w3 = AsyncWeb3(AsyncPooledProvider(get_rpc_pool()))
         self.admin_private_key=os.getenv("PRIVATE_KEY")
+        self.nonces = NonceManager(self.w3)
+        self.contracts = get_registry()
+        self.fees = get_fee_oracle()
+        self.faucet = FaucetBatcher(self, CHAIN_ID)
+        self.approvals = get_approval_manager()
+        self.simulator = get_simulator()
+        self.receipts = ReceiptWatcher(self.w3, interval=TX_POLL_LATENCY, fees=self.fees)
+        self._session = None
+        self._background_tasks = set()
+
+    async def connect(self):
+        """Share one pooled aiohttp session between all RPC calls of this wallet."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=RPC_POOL_SIZE, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+            await self.w3.provider.cache_async_session(self._session)
+
+    async def close(self):
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        await self.receipts.stop()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
     async def create_wallet(self, user_address):
-        existing_data = await self._load_existing_data()
-        
-        for entry in existing_data:
-            if entry["user_address"] == user_address:
-                print(f"Wallet already exists for user address: {user_address}")
-                return
-        
+        if self.store.get(user_address) is not None:
+            print(f"Wallet already exists for user address: {user_address}")
+            return
+
         private_key = self.w3.eth.account.create()._private_key.hex()
         await self.save_wallet_data(private_key, user_address)
-        
 
-    async def save_wallet_data(self, private_key, user_address):
-        output_data = {
-            "user_address": user_address,
-            "data": private_key
-        }
 
-        existing_data = await self._load_existing_data()
-        existing_data.append(output_data)
-        await self._save_data(existing_data)
+    async def save_wallet_data(self, private_key, user_address):
+        if not self.store.insert(user_address, private_key):
+            print(f"Wallet already exists for user address: {user_address}")
+            return
         print("Wallet data saved successfully.")
 
     async def fetch_data(self, user_address):
-        existing_data = await self._load_existing_data()
-
-        for entry in existing_data:
-            if entry["user_address"] == user_address:
-                private_key = entry["data"]
-                
-                return private_key
+        private_key = self.store.fetch_data(user_address)
+        if private_key is None:
+            print(f"No wallet data found for user address: {user_address}")
+        return private_key
 
-        print(f"No wallet data found for user address: {user_address}")
-        return None
-    
     async def _check_address(self, user_address):
         private_key = await self.fetch_data(user_address)
-        account = Web3().eth.account.from_key(private_key)
-        return account.address
-    
-    async def _fund_wallet(self, user_address):
+        return self.contracts.address(private_key)
+
+    async def _fund_wallet(self, user_address, wait=True):
         private_key = await self.fetch_data(user_address)
 
-        sender_address = self.w3.eth.account.from_key(self.admin_private_key).address
-        receiver_address = self.w3.eth.account.from_key(private_key).address
-        
-        nonce = self.w3.eth.get_transaction_count(sender_address)
-        transaction = {
-            'to': receiver_address,
-            'value': self.w3.to_wei(0.0001, 'ether'),
-            'gas': 1000000,
-            'gasPrice': self.w3.eth.gas_price,
-            'nonce': nonce,
-            'chainId': 3441006,
-        }
+        receiver_address = self.contracts.address(private_key)
+
+        return await self.faucet.fund(receiver_address, wait)
 
-        signed_txn = self.w3.eth.account.sign_transaction(transaction, self.admin_private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        return f"0x{tx_hash.hex()}"
 
-    
-    async def _transfer(self, user_address, amount, asset_id, destination):
+    async def _transfer(self, user_address, amount, asset_id, destination, wait=True):
         amount = amount * 10 ** 6
         private_key = await self.fetch_data(user_address)
-        sender_address = self.w3.eth.account.from_key(self.admin_private_key).address
-        
+        sender_address = self.contracts.address(private_key)
+
         contract_address = await self._get_token_ca(asset_id)
-        token_contract = self.w3.eth.contract(address=contract_address, abi=self._read_abi("abi/MockToken.json"))
-    
-        nonce = self.w3.eth.get_transaction_count(sender_address)
-        
-        transaction = token_contract.functions.transfer(destination, amount).build_transaction({
-            'nonce': nonce,
-            'gas': 1000000,
-            'gasPrice': self.w3.eth.gas_price,
-            'chainId': 3441006,
-        })
-
-        signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        return f"0x{tx_hash.hex()}"
-    
+        token_contract = self._contract(contract_address, "./abi/MockToken.json")
+
+        function = token_contract.functions.transfer(destination, amount)
+        transaction = await function.build_transaction(await self._tx_params(function, sender_address))
+
+        return await self._send_transaction(transaction, private_key, wait)
+
     async def _get_token_ca(self, asset_id):
         match asset_id:
             case "usdc":
@@ -110,7 +112,7 @@ class AgentWallet:
                 return "0x7598099fFC36dCC3e96F3aB33f18E86F85ae7E44"
             case "dai":
                 return "0x74A8Ee760959AF0B18307861e92769CfEcC42f9B"
-    
+
     async def _get_protocol_ca(self, protocol):
         match protocol:
             case "uniswap":
@@ -123,184 +125,289 @@ class AgentWallet:
                 return "0x60e78201ac487E5C382379dc8f9e39a896396728"
             case "aavev3":
                 return "0x23218e77D017AD293496976A5ee9Eb3F3F5EF217"
-    
-    async def mint(self, user_address, asset_id, amount):
+
+    async def mint(self, user_address, asset_id, amount, wait=True):
         amount = int(amount) * (10 ** 6)
-        abi = await self._read_abi("./abi/MockToken.json")
-        
+
         private_key = await self.fetch_data(user_address)
-        sender_address = self.w3.eth.account.from_key(private_key).address
-        
+        sender_address = self.contracts.address(private_key)
+
         contract_address = await self._get_token_ca(asset_id)
-        token_contract = self.w3.eth.contract(address=contract_address, abi=abi)
-        nonce = self.w3.eth.get_transaction_count(sender_address)
-        
-        transaction = token_contract.functions.mint(sender_address, amount).build_transaction({
-            'chainId': 3441006,
-            'gas': 1000000,
-            'gasPrice': self.w3.eth.gas_price,
-            'nonce': nonce,
-        })
-        
-        signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        return f"0x{tx_hash.hex()}"
-    
-    async def transfer(self, user_address, contract_address, to, amount):
+        token_contract = self._contract(contract_address, "./abi/MockToken.json")
+
+        function = token_contract.functions.mint(sender_address, amount)
+        transaction = await function.build_transaction(await self._tx_params(function, sender_address))
+
+        return await self._send_transaction(transaction, private_key, wait)
+
+    async def transfer(self, user_address, contract_address, to, amount, wait=True):
         amount = int(amount) * (10 ** 6)
-        abi = await self._read_abi("./abi/MockToken.json")
-        
+
         private_key = await self.fetch_data(user_address)
-        sender_address = self.w3.eth.account.from_key(private_key).address
-        
-        token_contract = self.w3.eth.contract(address=contract_address, abi=abi)
-        nonce = self.w3.eth.get_transaction_count(sender_address)
-        
-        transaction = token_contract.functions.transfer(to, amount).build_transaction({
-            'chainId': 3441006,
-            'gas': 1000000,
-            'gasPrice': self.w3.eth.gas_price,
-            'nonce': nonce,
-        })
-        
-        signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        return f"0x{tx_hash.hex()}"
-    
-    async def swap(self, user_address, spender, token_in, token_out, amount):
+        sender_address = self.contracts.address(private_key)
+
+        token_contract = self._contract(contract_address, "./abi/MockToken.json")
+
+        function = token_contract.functions.transfer(to, amount)
+        transaction = await function.build_transaction(await self._tx_params(function, sender_address))
+
+        return await self._send_transaction(transaction, private_key, wait)
+
+    async def swap(self, user_address, spender, token_in, token_out, amount, wait=True, return_all=False):
         private_key = await self.fetch_data(user_address)
-        sender_address = self.w3.eth.account.from_key(private_key).address
-        
+        sender_address = self.contracts.address(private_key)
+
         amount_generalized = int(amount) * (10 ** 6)
-        
-        status = await self.approve(sender_address, private_key, spender, token_in, amount)
-        if status:
-            abi = await self._read_abi("./abi/OptiFinance.json")
-            
-            staking_contract = self.w3.eth.contract(address="0x0b561A287588675AccE2f190FFa2AdCb30145e01", abi=abi)
-            nonce = self.w3.eth.get_transaction_count(sender_address)
-            
-            transaction = staking_contract.functions.swap(token_in, token_out, amount_generalized).build_transaction({
-                'chainId': 3441006,
-                'gas': 1000000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': nonce,
-            })
-            
-            signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-            tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-            self.w3.eth.wait_for_transaction_receipt(tx_hash)
-            
-            return f"0x{tx_hash.hex()}"
-        else:
+
+        try:
+            approves = await self._ensure_allowance(private_key, sender_address, spender, token_in, amount_generalized)
+        except TransactionRejected:
+            raise
+        except Exception as e:
             return f"Error during transaction"
-    
-    async def approve(self, sender_address, private_key, spender, token_in, amount):
+
+        staking_contract = self._contract("0x0b561A287588675AccE2f190FFa2AdCb30145e01", "./abi/OptiFinance.json")
+
+        function = staking_contract.functions.swap(token_in, token_out, amount_generalized)
+        transaction = await function.build_transaction(await self._tx_params(function, sender_address))
+
+        # The swap is sent right behind the approval on the next nonce instead of waiting a block for it.
+        tx_hashes = await self._broadcast_allowance_sequence(
+            [*approves, transaction], private_key, ["approve"] * len(approves) + ["swap"],
+            token_in, sender_address, spender, self.approvals.target(amount_generalized, spender) if approves else None,
+            amount_generalized,
+        )
+        return await self._settle(tx_hashes, private_key, wait, return_all)
+
+    async def approve(self, sender_address, private_key, spender, token_in, amount, wait=True):
         try:
-            approve_abi = await self._read_abi("./abi/MockToken.json")
-            amount = int(amount) * (10 ** 6)
-            
-            token_contract = self.w3.eth.contract(address=token_in, abi=approve_abi)
-            nonce = self.w3.eth.get_transaction_count(sender_address)
-            
-            transaction = token_contract.functions.approve(spender, amount+10).build_transaction({
-                'chainId': 3441006,
-                'gas': 1000000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': nonce,
-            })
-            
-            signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-            tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-            self.w3.eth.wait_for_transaction_receipt(tx_hash)
-            
+            required = int(amount) * (10 ** 6)
+            approves = await self._ensure_allowance(private_key, sender_address, spender, token_in, required)
+            if approves:
+                approve_hashes = await self._broadcast_allowance_sequence(
+                    approves, private_key, ["approve"], token_in, sender_address, spender,
+                    self.approvals.target(required, spender), 0,
+                )
+                await self._settle(approve_hashes, private_key, wait)
+
             return True
-        
+
+        except TransactionRejected:
+            raise
         except Exception as e:
             return False
-    
-    async def stake(self, user_address, asset_id, protocol, spender, amount):
-        approve_abi = await self._read_abi("./abi/MockToken.json")
-        amount = int(amount) * (10 ** 6)
-        
+
+    async def _ensure_allowance(self, private_key, sender_address, spender, token_in, required):
+        """
+        Make sure `spender` may pull `required` raw units of token_in. Returns
+        the approve transactions to send (none when the allowance already
+        covers it or a permit was used); the caller sends them together with
+        its own transaction through _broadcast_allowance_sequence.
+        """
+        with stage("tx_allowance"):
+            allowance = await self.approvals.allowance(self.w3, token_in, sender_address, spender)
+        if not self.approvals.needs_approval(allowance, required):
+            self.approvals.skip()
+            return []
+
+        value = self.approvals.target(required, spender)
+        if self.approvals.mode == "permit":
+            await self._permit(private_key, sender_address, spender, token_in, value)
+            return []
+
+        return [await self._build_approve(sender_address, spender, token_in, value)]
+
+    async def _build_approve(self, sender_address, spender, token_in, value):
+        token_contract = self._contract(token_in, "./abi/MockToken.json")
+
+        function = token_contract.functions.approve(spender, value)
+        return await function.build_transaction(await self._tx_params(function, sender_address))
+
+    async def _permit(self, private_key, sender_address, spender, token_in, value):
+        token_contract = self._contract(token_in, "./abi/MockToken.json")
+        nonce, domain = await asyncio.gather(
+            token_contract.functions.nonces(sender_address).call(),
+            token_contract.functions.eip712Domain().call(),
+        )
+        deadline, v, r, s = self.approvals.sign_permit(private_key, spender, value, nonce, domain)
+
+        admin_address = self.contracts.address(self.admin_private_key)
+        function = token_contract.functions.permit(sender_address, spender, value, deadline, v, r, s)
+        transaction = await function.build_transaction(await self._tx_params(function, admin_address))
+
+        # Sent from the admin key, so nothing orders it before the user's next nonce: wait for it.
+        try:
+            receipt = await self.wait_for_receipt(await self._broadcast(transaction, self.admin_private_key), admin_address)
+        except Exception:
+            self.approvals.invalidate(token_in, sender_address, spender)
+            raise
+        if receipt["status"] != 1:
+            self.approvals.invalidate(token_in, sender_address, spender)
+            raise RuntimeError(f"Permit for {spender} on {token_in} reverted")
+        self.approvals.record(token_in, sender_address, spender, value)
+
+    async def stake(self, user_address, asset_id, protocol, spender, amount, wait=True, return_all=False):
         private_key = await self.fetch_data(user_address)
-        sender_address = self.w3.eth.account.from_key(private_key).address
-        
-        contract_address = await self._get_token_ca(asset_id)
-        token_contract = self.w3.eth.contract(address=contract_address, abi=approve_abi)
-        nonce = self.w3.eth.get_transaction_count(sender_address)
-        
-        transaction = token_contract.functions.approve(spender, amount+10).build_transaction({
-            'chainId': 3441006,
-            'gas': 1000000,
-            'gasPrice': self.w3.eth.gas_price,
-            'nonce': nonce,
-        })
-        
-        signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        
+        sender_address = self.contracts.address(private_key)
+
+        token_address = await self._get_token_ca(asset_id)
+        amount = int(amount) * (10 ** 6)
+        approves = await self._ensure_allowance(private_key, sender_address, spender, token_address, amount)
+
         #=========================================================
-        
-        abi = await self._read_abi("./abi/MockStake.json")
-        
+
         contract_address = await self._get_protocol_ca(protocol)
-        token_contract = self.w3.eth.contract(address=contract_address, abi=abi)
-        nonce = self.w3.eth.get_transaction_count(sender_address)
-        
-        transaction = token_contract.functions.stake(0, amount).build_transaction({
-            'chainId': 3441006,
-            'gas': 1000000,
-            'gasPrice': self.w3.eth.gas_price,
-            'nonce': nonce,
-        })
-        signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        return f"0x{tx_hash.hex()}"
-    
-    
-    async def unstake(self, user_address, protocol):        
-        abi = await self._read_abi("./abi/MockStake.json")
-        
+        token_contract = self._contract(contract_address, "./abi/MockStake.json")
+
+        function = token_contract.functions.stake(0, amount)
+        transaction = await function.build_transaction(await self._tx_params(function, sender_address))
+
+        tx_hashes = await self._broadcast_allowance_sequence(
+            [*approves, transaction], private_key, ["approve"] * len(approves) + ["stake"],
+            token_address, sender_address, spender, self.approvals.target(amount, spender) if approves else None, amount,
+        )
+        return await self._settle(tx_hashes, private_key, wait, return_all)
+
+
+    async def unstake(self, user_address, protocol, wait=True):
         private_key = await self.fetch_data(user_address)
-        sender_address = self.w3.eth.account.from_key(private_key).address
-        
+        sender_address = self.contracts.address(private_key)
+
         contract_address = await self._get_protocol_ca(protocol)
-        token_contract = self.w3.eth.contract(address=contract_address, abi=abi)
-        nonce = self.w3.eth.get_transaction_count(sender_address)
-        
-        transaction = token_contract.functions.withdrawAll().build_transaction({
-            'chainId': 3441006,
-            'gas': 1000000,
-            'gasPrice': self.w3.eth.gas_price,
-            'nonce': nonce,
-        })
-        signed_txn = self.w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        return f"0x{tx_hash.hex()}"
+        token_contract = self._contract(contract_address, "./abi/MockStake.json")
 
+        function = token_contract.functions.withdrawAll()
+        transaction = await function.build_transaction(await self._tx_params(function, sender_address))
 
-    async def _read_abi(self, abi_path):
-        with open(abi_path, 'r') as file:
-            return orjson.loads(file.read())
+        return await self._send_transaction(transaction, private_key, wait)
 
 
-    async def _load_existing_data(self):
-        if not os.path.exists(self.file_path):
-            return []
+    async def _send_transaction(self, transaction, private_key, wait=True):
+        """
+        Sign and broadcast a transaction. With wait=False the hash is returned
+        as soon as the node accepts it and the receipt is awaited in the background.
+        """
+        tx_hash = await self._broadcast(transaction, private_key)
+        return await self._settle([tx_hash], private_key, wait)
 
-        with open(self.file_path, 'rb') as file:
-            return orjson.loads(file.read())
+    async def _broadcast_sequence(self, transactions, private_key, functions=None):
+        """Simulate dependent transactions together, then broadcast them on consecutive nonces."""
+        with stage("tx_simulate"):
+            gas_used = await self.simulator.check_sequence(self.w3, transactions, functions)
+        tx_hashes = []
+        for transaction, gas in zip(transactions, gas_used):
+            if gas is not None:
+                transaction = {**transaction, 'gas': max(transaction.get('gas', 0), int(gas * self.fees.margin))}
+            tx_hashes.append(await self._broadcast(transaction, private_key, simulate=False))
+        return tx_hashes
 
-    async def _save_data(self, data):
-        with open(self.file_path, 'wb') as file:
-            file.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    async def _broadcast_allowance_sequence(self, transactions, private_key, functions, token, owner, spender, approved, spent):
+        """
+        _broadcast_sequence for transactions that approve `approved` (None if
+        nothing is approved) and then pull `spent` from the allowance. The
+        spend is deducted from the cache right away, since that can only cause
+        an extra approve. The approved amount is recorded only once every
+        transaction is mined successfully. Any failure drops the cache entry,
+        so the next operation reads the allowance from chain.
+        """
+        try:
+            tx_hashes = await self._broadcast_sequence(transactions, private_key, functions)
+        except Exception:
+            self.approvals.invalidate(token, owner, spender)
+            raise
+        self.approvals.consume(token, owner, spender, spent)
+
+        async def settle_allowance():
+            try:
+                receipts = await asyncio.gather(*(self.wait_for_receipt(tx_hash, owner) for tx_hash in tx_hashes))
+            except Exception:
+                receipts = None
+            if receipts is None or any(receipt["status"] != 1 for receipt in receipts):
+                self.approvals.invalidate(token, owner, spender)
+            elif approved is not None:
+                self.approvals.record(token, owner, spender, approved)
+                self.approvals.consume(token, owner, spender, spent)
+
+        task = asyncio.create_task(settle_allowance())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return tx_hashes
+
+    async def _broadcast(self, transaction, private_key, retries=2, simulate=True):
+        sender_address = self.contracts.address(private_key)
+        if simulate:
+            with stage("tx_simulate"):
+                await self.simulator.check(self.w3, transaction)
+
+        for attempt in range(retries + 1):
+            with stage("tx_nonce"):
+                nonce = await self.nonces.allocate(sender_address)
+            signed_txn = self.contracts.account(private_key).sign_transaction({**transaction, 'nonce': nonce})
+            try:
+                with stage("tx_send"):
+                    tx_hash = await self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+                self.receipts.track(tx_hash, {**transaction, 'nonce': nonce}, private_key)
+                return tx_hash
+            except Exception as e:
+                if is_already_known(e):
+                    return signed_txn.hash
+                if is_nonce_error(e) and attempt < retries:
+                    await self.nonces.resync(sender_address)
+                    continue
+                await self.nonces.release(sender_address, nonce)
+                raise
+
+    async def _settle(self, tx_hashes, private_key, wait, return_all=False):
+        """Wait for (or background-confirm) tx_hashes; returns the last mined hash, or all of them with return_all."""
+        sender_address = self.contracts.address(private_key)
+
+        if wait:
+            receipts = await asyncio.gather(*(self.wait_for_receipt(tx_hash, sender_address) for tx_hash in tx_hashes))
+            # A stuck transaction may have been replaced by a fee bump: report the hash that was mined.
+            tx_hashes = [receipt["transactionHash"] for receipt in receipts]
+        else:
+            for tx_hash in tx_hashes:
+                task = asyncio.create_task(self._confirm_in_background(tx_hash, sender_address))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+
+        if return_all:
+            return [f"0x{tx_hash.hex()}" for tx_hash in tx_hashes]
+        return f"0x{tx_hashes[-1].hex()}"
+
+    async def wait_for_receipt(self, tx_hash, sender_address=None):
+        try:
+            with stage("tx_confirm"):
+                return await self.receipts.wait(tx_hash, TX_RECEIPT_TIMEOUT)
+        except TimeExhausted:
+            # Dropped or replaced: the local nonce sequence no longer matches the node.
+            if sender_address is not None:
+                await self.nonces.resync(sender_address)
+            raise
+
+    async def _confirm_in_background(self, tx_hash, sender_address=None):
+        try:
+            receipt = await self.wait_for_receipt(tx_hash, sender_address)
+            if receipt["status"] != 1:
+                print(f"Transaction 0x{tx_hash.hex()} reverted")
+        except Exception as e:
+            print(f"Transaction 0x{tx_hash.hex()} not confirmed: {e}")
+
+
+    async def _tx_params(self, function, sender_address):
+        with stage("tx_gas_estimate"):
+            gas = await self.fees.estimate_gas(function, sender_address)
+        with stage("tx_fees"):
+            fees = await self.fees.fee_params(self.w3)
+        return {
+            'chainId': CHAIN_ID,
+            'from': sender_address,
+            'gas': gas,
+            **fees,
+        }
+
+    def _contract(self, address, abi_path):
+        return self.contracts.contract(self.w3, address, abi_path)
+
+    async def _read_abi(self, abi_path):
+        return self.contracts.abi(abi_path)
\ No newline at end of file
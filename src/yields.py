@@ -0,0 +1,83 @@
+import os
+import time
+import threading
+import orjson
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+URL_STAKING = os.getenv("URL_STAKING", "https://opti-backend.vercel.app/staking")
+YIELD_SNAPSHOT_TTL = float(os.getenv("YIELD_SNAPSHOT_TTL", "300"))
+
+
+class YieldSnapshot:
+    """
+    One fetch of the staking backend with the lookups the rebalancer needs
+    precomputed. Protocol tuples keep the (addressStaking, apy, addressToken)
+    shape get_apy always returned.
+    """
+
+    def __init__(self, response, etag=None):
+        self.response = response
+        self.etag = etag
+        self.fetched_at = time.time()
+
+        self.protocols = [(item['addressStaking'], float(item['apy']), item['addressToken']) for item in response]
+        self.stablecoin_protocols = [
+            (item['addressStaking'], float(item['apy']), item['addressToken'])
+            for item in response if item['stablecoin'] is True
+        ]
+        self.best = max(self.protocols, key=lambda x: x[1], default=None)
+        self.best_stablecoin = max(self.stablecoin_protocols, key=lambda x: x[1], default=None)
+        self.token_by_staking = {item['addressStaking']: item['addressToken'] for item in response}
+        self.staking_addresses = list(self.token_by_staking)
+
+    def best_for(self, filter):
+        match filter:
+            case 'highest':
+                return self.best_stablecoin
+            case 'highest-best':
+                return self.best
+
+
+class YieldSnapshotCache:
+    """Keeps the latest snapshot for `ttl` seconds and revalidates it with If-None-Match."""
+
+    def __init__(self, url=URL_STAKING, ttl=YIELD_SNAPSHOT_TTL):
+        self.url = url
+        self.ttl = ttl
+        self._snapshot = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def get(self, refresh=False):
+        if not refresh and self._snapshot is not None and time.monotonic() < self._expires_at:
+            return self._snapshot
+
+        with self._lock:
+            if refresh or self._snapshot is None or time.monotonic() >= self._expires_at:
+                self._snapshot = self._fetch()
+                self._expires_at = time.monotonic() + self.ttl
+        return self._snapshot
+
+    def invalidate(self):
+        self._expires_at = 0
+
+    def _fetch(self):
+        headers = {}
+        if self._snapshot is not None and self._snapshot.etag:
+            headers["If-None-Match"] = self._snapshot.etag
+
+        result = requests.get(self.url, headers=headers, timeout=30)
+        if result.status_code == 304:
+            return self._snapshot
+        result.raise_for_status()
+        return YieldSnapshot(orjson.loads(result.content), etag=result.headers.get("ETag"))
+
+
+_cache = YieldSnapshotCache()
+
+
+def get_yield_snapshot(refresh=False):
+    return _cache.get(refresh=refresh)
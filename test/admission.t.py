@@ -0,0 +1,129 @@
+import sys
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Admits a blocking stand-in for the agent call, so no LLM is needed.
+from main import overloaded
+from src.admission import AdmissionController, Overloaded
+
+
+class Work:
+    """Blocking callable that holds its worker thread until released and counts the calls that ran."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, value):
+        self.calls.append(value)
+        self.release.wait(5)
+        return f"answer {value}"
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+
+
+async def rejected(coroutine):
+    try:
+        await coroutine
+    except Overloaded as e:
+        return e
+    raise AssertionError("call was admitted")
+
+
+async def main():
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    # One running and one queued call fill the controller: the next call is a 503 with Retry-After,
+    # a client already at its limit gets a 429, and neither runs the work.
+    work = Work()
+    admission = AdmissionController(executor, max_concurrency=1, max_queue=1, per_client=2, retry_after=3)
+    running = asyncio.ensure_future(admission.run(work, 1, client_id="alice"))
+    queued = asyncio.ensure_future(admission.run(work, 2, client_id="alice"))
+    await settle()
+    assert admission.stats()["active_threads"] == 1 and admission.stats()["queued"] == 1
+
+    full = await rejected(admission.run(work, 3, client_id="bob"))
+    assert full.status_code == 503 and full.retry_after == 3
+    busy = await rejected(admission.run(work, 4, client_id="alice"))
+    assert busy.status_code == 429 and busy.retry_after == 3
+    error = overloaded(busy)
+    assert error.status_code == 429 and error.headers == {"Retry-After": "3"}
+
+    work.release.set()
+    assert await running == "answer 1" and await queued == "answer 2"
+    assert work.calls == [1, 2]
+    assert admission.stats()["rejected_429"] == 1 and admission.stats()["rejected_503"] == 1
+    assert admission._clients == {}
+
+    # The Retry-After estimate grows with the observed service time and the queue ahead.
+    admission.service_time = 10
+    full = await fill(admission)
+    assert full.status_code == 503 and full.retry_after == 20
+
+    # Calls with the same key share one execution; a different key runs on its own.
+    work = Work()
+    admission = AdmissionController(executor, max_concurrency=1, max_queue=4)
+    first = asyncio.ensure_future(admission.run(work, 1, key="q"))
+    second = asyncio.ensure_future(admission.run(work, 1, key="q"))
+    other = asyncio.ensure_future(admission.run(work, 2, key="other"))
+    await settle()
+    work.release.set()
+    assert await asyncio.gather(first, second, other) == ["answer 1", "answer 1", "answer 2"]
+    assert work.calls == [1, 2]
+    assert admission.stats()["admitted"] == 2 and admission.stats()["coalesced"] == 1
+    assert admission._inflight == {}
+
+    # A queued call is dropped once its only caller goes away, and frees its queue slot.
+    work = Work()
+    admission = AdmissionController(executor, max_concurrency=1, max_queue=4)
+    running = asyncio.ensure_future(admission.run(work, 1))
+    queued = asyncio.ensure_future(admission.run(work, 2))
+    await settle()
+    try:
+        await asyncio.wait_for(queued, 0.05)
+        raise AssertionError("queued call finished while the worker was busy")
+    except asyncio.TimeoutError:
+        pass
+    await settle()
+    assert admission.stats()["cancelled"] == 1 and admission.stats()["queued"] == 0
+
+    # A queued call shared by two callers keeps running while one of them remains.
+    shared_a = asyncio.ensure_future(admission.run(work, 3, key="shared"))
+    shared_b = asyncio.ensure_future(admission.run(work, 3, key="shared"))
+    await settle()
+    shared_a.cancel()
+    await settle()
+    assert admission.stats()["cancelled"] == 1 and admission.stats()["queued"] == 1
+
+    # A call already on a worker thread runs to completion even if its caller goes away.
+    running.cancel()
+    await settle()
+    work.release.set()
+    assert await shared_b == "answer 3"
+    assert work.calls == [1, 3]
+    assert admission.stats()["active_threads"] == 0 and admission.stats()["queued"] == 0
+
+    executor.shutdown()
+
+
+async def fill(admission):
+    # Take the running slot and the queue slot, then ask for one more.
+    work = Work()
+    blockers = [asyncio.ensure_future(admission.run(work, i)) for i in range(2)]
+    await settle()
+    try:
+        return await rejected(admission.run(work, 9))
+    finally:
+        work.release.set()
+        await asyncio.gather(*blockers)
+
+
+asyncio.run(main())
+
+print("All operations completed successfully!")
@@ -0,0 +1,81 @@
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.cache import ResponseCache
+from src.router import QueryRouter
+
+
+class BagOfWordsEmbeddings:
+    """Local stand-in for OpenAIEmbeddings: hashed bag of words, so paraphrases land close together."""
+
+    def __init__(self, size=64):
+        self.size = size
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        vector = [0.0] * self.size
+        for word in text.split():
+            vector[sum(map(ord, word)) % self.size] += 1.0
+        return vector
+
+
+embedder = BagOfWordsEmbeddings()
+cache = ResponseCache(embedder, ttl=60, max_entries=3, threshold=0.9)
+
+assert cache.get("What is the best APY for USDC?", version="v1") is None
+cache.put("What is the best APY for USDC?", '{"id_project": "1"}', version="v1")
+
+# Exact tier: case, whitespace and trailing punctuation do not matter.
+assert cache.get("  what is the best   apy for usdc ", version="v1") == '{"id_project": "1"}'
+
+# Semantic tier: same words in a different order.
+assert cache.get("for USDC what is the best APY", version="v1") == '{"id_project": "1"}'
+assert cache.get("How do I bridge to Manta?", version="v1") is None
+
+# A new knowledge version drops every entry.
+assert cache.get("What is the best APY for USDC?", version="v2") is None
+assert cache.stats()["entries"] == 0
+
+# A put still carrying the replaced version neither rolls the cache back nor flushes it.
+cache.put("What is the best APY for USDC?", '{"id_project": "2"}', version="v2")
+cache.put("What is the best APY for USDC?", '{"id_project": "1"}', version="v1")
+assert cache.stats()["version"] == "v2" and cache.stats()["entries"] == 1
+assert cache.get("What is the best APY for USDC?", version="v2") == '{"id_project": "2"}'
+assert cache.get("What is the best APY for USDC?", version="v1") is None
+assert cache.stats()["version"] == "v2"
+
+# LRU bound.
+for i in range(5):
+    cache.put(f"question {i}", str(i), version="v2")
+assert cache.stats()["entries"] == 3
+assert cache.get("question 0", version="v2") is None
+assert cache.get("question 4", version="v2") == "4"
+
+# TTL.
+short = ResponseCache(ttl=0.05)
+short.put("hello", "world")
+assert short.get("hello") == "world"
+time.sleep(0.1)
+assert short.get("hello") is None
+
+# Near-identical queries about different tokens, chains or protocols never share an answer.
+router = QueryRouter()
+router.update([
+    {"idProtocol": "usdc-manta", "chain": "Manta", "nameToken": "USDC", "apy": 8.0, "tvl": 1_000_000, "stablecoin": True},
+    {"idProtocol": "usdt-manta", "chain": "Manta", "nameToken": "USDT", "apy": 6.0, "tvl": 9_000_000, "stablecoin": True},
+    {"idProtocol": "usdc-base", "chain": "Base", "nameToken": "USDC", "apy": 20.0, "tvl": 2_000_000, "stablecoin": True},
+])
+entity_cache = ResponseCache(BagOfWordsEmbeddings(), ttl=60, threshold=0.7, entities=router.entities)
+entity_cache.put("best USDC pool on Manta", '{"id_project": "usdc-manta"}', version="v1")
+assert entity_cache.get("on Manta the best USDC pool", version="v1") == '{"id_project": "usdc-manta"}'
+assert entity_cache.get("which is the best usdc pool on manta", version="v1") == '{"id_project": "usdc-manta"}'
+assert entity_cache.get("best USDT pool on Manta", version="v1") is None
+assert entity_cache.get("best USDC pool on Base", version="v1") is None
+assert entity_cache.get("is usdt-manta the best USDC pool on Manta", version="v1") is None
+assert entity_cache.stats()["semantic_hits"] == 2
+
+print(cache.stats())
+print("All operations completed successfully!")
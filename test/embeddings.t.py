@@ -0,0 +1,48 @@
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.embeddings import CachedEmbeddings
+
+
+class FakeEmbeddings:
+    """Deterministic stand-in for OpenAIEmbeddings that counts how many texts it embeds."""
+
+    model = "fake-embedding"
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(text)), float(sum(map(ord, text)) % 97), 0.5, 0.25] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+path = os.path.join(tempfile.mkdtemp(), "embeddings.db")
+docs = [f"IdProject: {i}, Chain: Base, Symbol: USDC, TVL: 100, APY: 5, Stablecoin: True" for i in range(10)]
+
+fake = FakeEmbeddings()
+cache = CachedEmbeddings(fake, path=path)
+first = cache.embed_documents(docs)
+assert fake.calls == 10
+
+second = cache.embed_documents(docs + ["IdProject: new"])
+assert fake.calls == 11
+assert second[:10] == first
+
+# A new process only pays for texts it has never seen.
+restarted = FakeEmbeddings()
+assert CachedEmbeddings(restarted, path=path).embed_documents(docs) == first
+assert restarted.calls == 0
+
+# Eviction keeps the file under max_bytes, dropping the least recently used vectors.
+small = CachedEmbeddings(FakeEmbeddings(), path=os.path.join(tempfile.mkdtemp(), "small.db"), max_bytes=16 * 3)
+small.embed_documents(docs[:5])
+assert small.stats()["bytes"] <= 16 * 3
+
+print(cache.stats())
+print("All operations completed successfully!")
@@ -0,0 +1,133 @@
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Replays recorded logs against a stand-in chain, so no node is needed.
+from eth_abi import encode
+from web3 import Web3
+from src.indexer import LogIndexer, TOKEN_ADDRESSES, ROUTER_ADDRESS
+
+
+class FakeEth:
+    def __init__(self):
+        self.block_number = 15
+        self.logs = []
+        self.contract = Web3().eth.contract
+
+    def get_block(self, number):
+        return {"number": number, "hash": "0x" + f"{number:064x}"}
+
+    def get_logs(self, params):
+        return [log for log in self.logs if params["fromBlock"] <= log["blockNumber"] <= params["toBlock"]]
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+class FakeReader:
+    def __init__(self, matrix, balances):
+        self.matrix = matrix
+        self.balances = balances
+        self.reads = []
+
+    def read(self, users, protocols, block_identifier="latest"):
+        self.reads.append((users, protocols, block_identifier))
+        return {user: self.matrix.get(user, {}) for user in users}
+
+    def read_token_balances(self, holders, tokens, block_identifier="latest"):
+        self.reads.append((holders, tokens, block_identifier))
+        return {holder: self.balances.get(holder, {}) for holder in holders}
+
+
+w3 = FakeWeb3()
+
+user = "0x82273B356C8c882371a4CbD276f666D8efb6745F"
+protocol = "0xa976c4930e253CE56Ff129404a95F0578345C113"
+token = TOKEN_ADDRESSES[0]
+zero = "0x0000000000000000000000000000000000000000"
+
+
+def topic(value):
+    return "0x" + value[2:].lower().rjust(64, "0")
+
+
+def log(address, signature, indexed, data_types, data, block_number, log_index):
+    return {
+        "address": address,
+        "topics": [Web3.keccak(text=signature).to_0x_hex(), *(topic(value) for value in indexed)],
+        "data": "0x" + encode(data_types, data).hex(),
+        "blockNumber": block_number,
+        "blockHash": "0x" + f"{block_number:064x}",
+        "logIndex": log_index,
+        "transactionHash": "0x" + f"{block_number * 100 + log_index:064x}",
+        "transactionIndex": 0,
+    }
+
+
+logs = [
+    log(token, "Transfer(address,address,uint256)", [zero, user], ["uint256"], [5_000_000], 10, 0),
+    log(token, "Transfer(address,address,uint256)", [user, protocol], ["uint256"], [3_000_000], 11, 0),
+    log(protocol, "Staked(address,uint256,uint256)", [user], ["uint256", "uint256"], [3_000_000, 30], 11, 1),
+    log(ROUTER_ADDRESS, "Swap(address,address,address,uint256)", [token, TOKEN_ADDRESSES[1], user], ["uint256"], [1_000_000], 12, 0),
+    log(protocol, "PartialWithdraw(address,uint256)", [user], ["uint256"], [1_000_000], 13, 0),
+    # Same topic from an unknown contract is ignored.
+    log("0x0000000000000000000000000000000000000009", "Staked(address,uint256,uint256)", [user], ["uint256", "uint256"], [7, 1], 13, 1),
+]
+
+with tempfile.TemporaryDirectory() as directory:
+    indexer = LogIndexer(w3, [protocol], db_path=os.path.join(directory, "index.db"), start_block=10)
+
+    assert indexer.apply_logs(logs, block_number=13, block_hash="0x" + f"{13:064x}") == 5
+    assert indexer.apply_logs(logs) == 0
+    print(indexer.positions(user), indexer.balances(user))
+    assert indexer.positions(user) == {protocol: 2_000_000}
+    assert indexer.balances(user) == {token: 2_000_000}
+    assert [event["event"] for event in indexer.activity(user)] == ["PartialWithdraw", "Swap", "Staked", "Transfer", "Transfer"]
+    assert indexer.cursor()["block_number"] == 13
+    assert indexer.is_fresh()
+    # Fresh means close to the head, not recently written.
+    w3.eth.block_number = 30
+    assert not indexer.is_fresh()
+    w3.eth.block_number = 15
+
+    # A reorg that drops blocks 12 and 13 unwinds the withdraw and the swap.
+    assert indexer.rollback(11) == 2
+    assert indexer.positions(user) == {protocol: 3_000_000}
+    assert indexer.cursor()["block_number"] == 11
+
+    # A restart resumes from the stored cursor and position table.
+    indexer = LogIndexer(w3, [protocol], db_path=os.path.join(directory, "index.db"), start_block=10)
+    assert indexer.cursor()["block_number"] == 11
+    assert indexer.positions_many([user, zero]) == {user: {protocol: 3_000_000}, zero: {}}
+
+    # Without a start block the index starts at the head, seeded with the existing positions and token balances.
+    w3 = FakeWeb3()
+    w3.eth.block_number = 100
+    reader = FakeReader({user: {protocol: 4_000_000}}, {user: {token: 25_000_000}})
+    indexer = LogIndexer(w3, [protocol], db_path=os.path.join(directory, "head.db"), users=lambda: [user], reader=reader)
+    assert indexer.cursor() is None and not indexer.is_fresh()
+    assert indexer.poll() == 0
+    assert reader.reads == [([user], [protocol], 98), ([user], sorted(TOKEN_ADDRESSES), 98)]
+    assert indexer.cursor()["block_number"] == 98 and indexer.is_fresh()
+    assert indexer.positions(user) == {protocol: 4_000_000}
+    assert indexer.balances(user) == {token: 25_000_000}
+
+    # A stake and a transfer after the seed block are applied on top of the seeded amounts;
+    # a cursor far behind the head is not fresh.
+    w3.eth.logs = [
+        log(token, "Transfer(address,address,uint256)", [user, protocol], ["uint256"], [1_000_000], 105, 0),
+        log(protocol, "Staked(address,uint256,uint256)", [user], ["uint256", "uint256"], [1_000_000, 30], 105, 1),
+        log(token, "Transfer(address,address,uint256)", [user, zero[:-1] + "7"], ["uint256"], [10_000_000], 106, 0),
+    ]
+    w3.eth.block_number = 120
+    assert not indexer.is_fresh()
+    assert indexer.poll() == 3
+    assert indexer.cursor()["block_number"] == 118 and indexer.is_fresh()
+    assert indexer.positions(user) == {protocol: 5_000_000}
+    assert indexer.balances(user) == {token: 14_000_000}
+    assert len(reader.reads) == 2
+
+print("All operations completed successfully!")
@@ -0,0 +1,151 @@
+import sys
+import os
+import tempfile
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# The wallet is a stand-in and the webhook a local server, so no node is needed.
+import asyncio
+import orjson
+from hexbytes import HexBytes
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from src.jobs import JobStore, JobManager, PublicResolver, check_webhook_url
+
+APPROVE = "0x" + "aa" * 32
+SWAP = "0x" + "bb" * 32
+BUMPED = "0x" + "cc" * 32
+
+
+class FakeWallet:
+    def __init__(self):
+        self.statuses = {APPROVE: 1, SWAP: 1}
+        self.replaced = {}
+
+    async def swap(self, user_address, spender, token_in, token_out, amount, wait=True, return_all=False):
+        assert wait is False and return_all is True
+        return [APPROVE, SWAP]
+
+    async def unstake(self, user_address, protocol, wait=True):
+        return "Error during transaction"
+
+    async def wait_for_receipt(self, tx_hash, sender_address=None):
+        return {"status": self.statuses[tx_hash], "blockNumber": 7, "transactionHash": HexBytes(self.replaced.get(tx_hash, tx_hash))}
+
+
+deliveries = []
+
+
+class Hook(BaseHTTPRequestHandler):
+    def do_POST(self):
+        deliveries.append(orjson.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), Hook)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+hook_url = f"http://127.0.0.1:{server.server_address[1]}/hook"
+
+
+async def rejected(url, **kwargs):
+    try:
+        await check_webhook_url(url, **kwargs)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+async def wait_for(manager, job_id, status):
+    for _ in range(200):
+        if manager.store.get(job_id)["status"] == status:
+            return manager.store.get(job_id)
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}: {manager.store.get(job_id)}")
+
+
+async def main(directory):
+    # Webhook URLs: https only, no private/loopback/link-local targets, optional host allow-list.
+    assert "https" in await rejected("http://hooks.example.com/x", hosts=set(), insecure=False)
+    assert "private" in await rejected("https://127.0.0.1/x", hosts=set(), insecure=False)
+    assert "private" in await rejected("https://169.254.169.254/latest/meta-data", hosts=set(), insecure=False)
+    assert "private" in await rejected("https://10.0.0.8/x", hosts=set(), insecure=False)
+    assert "private" in await rejected("https://[::1]/x", hosts=set(), insecure=False)
+    assert "credentials" in await rejected("https://user:pw@8.8.8.8/x", hosts=set(), insecure=False)
+    assert "not allowed" in await rejected("https://8.8.8.8/x", hosts={"hooks.example.com"}, insecure=False)
+    assert await rejected("https://8.8.8.8/x", hosts=set(), insecure=False) is None
+    try:
+        await PublicResolver().resolve("localhost", 443)
+        raise AssertionError("localhost must not resolve for webhooks")
+    except OSError:
+        pass
+
+    wallet = FakeWallet()
+    store = JobStore(os.path.join(directory, "jobs.db"))
+    manager = JobManager(wallet, store=store, workers=2, webhook_hosts=set(), webhook_insecure=True)
+    manager.actions = {key: manager.actions[key] for key in ("swap", "unstake")}
+    await manager.start()
+    try:
+        try:
+            await JobManager(wallet, store=store, webhook_hosts=set(), webhook_insecure=False).submit("swap", {}, "http://127.0.0.1/x")
+            raise AssertionError("insecure webhook accepted")
+        except ValueError:
+            pass
+
+        # Every hash of the action is recorded and confirmed, approve included.
+        params = {"user_address": "0x1", "spender": "0x2", "token_in": "0x3", "token_out": "0x4", "amount": 1}
+        job = await manager.submit("swap", params, webhook_url=hook_url)
+        job = await wait_for(manager, job["id"], "confirmed")
+        assert job["tx_hashes"] == [APPROVE, SWAP] and job["result"] == {"block_number": 7}
+        assert manager.get(job["id"])["tx_hashes"] == [APPROVE, SWAP]
+        assert "params" not in manager.get(job["id"]) and "webhook_url" not in manager.get(job["id"])
+
+        for _ in range(200):
+            if len(deliveries) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert [delivery["status"] for delivery in deliveries] == ["submitted", "confirmed"]
+        assert deliveries[-1]["tx_hashes"] == [APPROVE, SWAP] and "params" not in deliveries[-1]
+
+        # A reverted approve fails the job even though the last transaction succeeded.
+        wallet.statuses[APPROVE] = 0
+        job = await wait_for(manager, (await manager.submit("swap", params))["id"], "failed")
+        assert APPROVE in job["error"]
+
+        # A swap replaced by a fee bump reports the hash that was mined.
+        wallet.statuses[APPROVE] = 1
+        wallet.replaced[SWAP] = BUMPED
+        job = await wait_for(manager, (await manager.submit("swap", params))["id"], "confirmed")
+        assert job["tx_hashes"] == [APPROVE, BUMPED] and manager.get(job["id"])["tx_hashes"] == [APPROVE, BUMPED]
+        wallet.replaced.clear()
+
+        # An action that returns an error message instead of hashes fails at once.
+        job = await wait_for(manager, (await manager.submit("unstake", {"user_address": "0x1", "protocol": "aave"}))["id"], "failed")
+        assert job["error"] == "Error during transaction" and job["tx_hashes"] == []
+    finally:
+        await manager.stop()
+
+    # The store survives a restart: submitted jobs are resumed, running ones failed.
+    queued = store.create("swap", params)
+    running = store.update(store.create("swap", params), status="running")
+    submitted = store.update(store.create("swap", params), status="submitted", tx_hashes=[APPROVE, SWAP])
+    assert {job["id"] for job in store.unfinished()} == {queued["id"], running["id"], submitted["id"]}
+
+    wallet.statuses[APPROVE] = 1
+    manager = JobManager(wallet, store=JobStore(os.path.join(directory, "jobs.db")), workers=1,
+                         webhook_hosts=set(), webhook_insecure=True)
+    await manager.start()
+    try:
+        assert (await wait_for(manager, submitted["id"], "confirmed"))["tx_hashes"] == [APPROVE, SWAP]
+        assert (await wait_for(manager, queued["id"], "confirmed"))["tx_hashes"] == [APPROVE, SWAP]
+        assert "restart" in manager.store.get(running["id"])["error"]
+    finally:
+        await manager.stop()
+
+
+with tempfile.TemporaryDirectory() as directory:
+    asyncio.run(main(directory))
+
+print("All operations completed successfully!")
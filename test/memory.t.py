@@ -0,0 +1,98 @@
+import sys
+import os
+import time
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Drives a real react agent with a scripted chat model, so no LLM is needed.
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.prebuilt import create_react_agent
+from src.memory import BoundedMemorySaver, create_checkpointer, bounded_prompt, compact_thread, count_tokens
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers every turn with a fixed reply and records the prompts it was sent."""
+
+    prompts: list = []
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"reply {len(self.prompts)}"))])
+
+
+def agent_with(checkpointer, max_tokens=2000):
+    llm = FakeChatModel(prompts=[])
+    return llm, create_react_agent(llm, tools=[], checkpointer=checkpointer, state_modifier=bounded_prompt("system", max_tokens))
+
+
+def config(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def turn(agent, thread_id, text, max_messages=4):
+    agent.invoke({"messages": [HumanMessage(content=text)]}, config=config(thread_id))
+    return compact_thread(agent, config(thread_id), max_messages=max_messages)
+
+
+# Each thread keeps at most max_messages, cut on a user turn, and threads do not share history.
+saver = BoundedMemorySaver(max_threads=10, idle_ttl=60)
+llm, agent = agent_with(saver)
+removed = [turn(agent, "a", f"question {i}") for i in range(5)]
+assert removed == [0, 0, 2, 2, 2]
+messages = agent.get_state(config("a")).values["messages"]
+assert [message.content for message in messages] == ["question 3", "reply 4", "question 4", "reply 5"]
+assert isinstance(messages[0], HumanMessage)
+turn(agent, "b", "other question")
+assert [message.content for message in agent.get_state(config("b")).values["messages"]] == ["other question", "reply 6"]
+assert len(agent.get_state(config("a")).values["messages"]) == 4
+
+# Only the last checkpoint of each thread is kept.
+assert all(len(checkpoints) == 1 for thread in saver.storage.values() for checkpoints in thread.values())
+
+# The prompt starts with the system message and only carries the recent turns that fit the token budget.
+llm, agent = agent_with(BoundedMemorySaver(), max_tokens=40)
+for i in range(6):
+    agent.invoke({"messages": [HumanMessage(content=f"question {i} " + "x" * 40)]}, config=config("long"))
+prompt = llm.prompts[-1]
+assert isinstance(prompt[0], SystemMessage) and isinstance(prompt[1], HumanMessage)
+assert count_tokens(prompt[1:]) <= 40 and prompt[-1].content.startswith("question 5")
+
+# Threads beyond max_threads are evicted, least recently used first, and the active one is never evicted.
+saver = BoundedMemorySaver(max_threads=2, idle_ttl=60)
+llm, agent = agent_with(saver)
+for thread_id in ["t1", "t2", "t1", "t3"]:
+    turn(agent, thread_id, "hello")
+assert set(saver.storage) == {"t1", "t3"} and len(saver.threads) == 2
+assert agent.get_state(config("t2")).values == {}
+
+# Threads idle for longer than idle_ttl are evicted on the next write.
+saver = BoundedMemorySaver(max_threads=10, idle_ttl=0.05)
+llm, agent = agent_with(saver)
+turn(agent, "idle", "hello")
+time.sleep(0.1)
+turn(agent, "active", "hello")
+assert set(saver.storage) == {"active"}
+
+# The SQLite saver bounds threads the same way and picks up the threads already on disk.
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, "memory.db")
+    saver = create_checkpointer("sqlite", path, max_threads=2, idle_ttl=60)
+    llm, agent = agent_with(saver)
+    for thread_id in ["s1", "s2", "s3"]:
+        turn(agent, thread_id, "hello")
+    assert agent.get_state(config("s1")).values == {}
+    assert len(agent.get_state(config("s3")).values["messages"]) == 2
+
+    reopened = create_checkpointer("sqlite", path, max_threads=2, idle_ttl=60)
+    assert len(reopened.threads) == 2
+
+print("All operations completed successfully!")
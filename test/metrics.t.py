@@ -0,0 +1,56 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+from src.metrics import MetricsRegistry
+
+registry = MetricsRegistry()
+latency = registry.histogram("test_seconds", "Test latency", ("stage",), buckets=(0.01, 0.1, 1))
+calls = registry.counter("test_calls_total", "Test calls", ("method", "outcome"))
+
+latency.observe(0.005, "nonce")
+latency.observe(0.1, "nonce")
+latency.observe(5, "nonce")
+with latency.time("confirm"):
+    time.sleep(0.02)
+calls.inc("eth_call", "ok")
+calls.inc("eth_call", "ok", amount=2)
+calls.inc("eth_call", "error")
+
+stats = {"queued": 3, "hit_rate": 0.25, "mode": "max", "latency": None, "enabled": True}
+registry.register_stats("test_pool", lambda: stats, pool="query")
+registry.register_stats("test_pool", lambda: {"queued": 1}, pool="risk")
+registry.register_stats("test_broken", lambda: 1 / 0)
+
+text = registry.render()
+print(text)
+lines = text.splitlines()
+
+# Buckets are cumulative and le is inclusive.
+assert 'test_seconds_bucket{stage="nonce",le="0.01"} 1' in lines
+assert 'test_seconds_bucket{stage="nonce",le="0.1"} 2' in lines
+assert 'test_seconds_bucket{stage="nonce",le="1"} 2' in lines
+assert 'test_seconds_bucket{stage="nonce",le="+Inf"} 3' in lines
+assert 'test_seconds_count{stage="nonce"} 3' in lines
+assert 'test_seconds_bucket{stage="confirm",le="0.1"} 1' in lines
+
+assert 'test_calls_total{method="eth_call",outcome="ok"} 3' in lines
+assert 'test_calls_total{method="eth_call",outcome="error"} 1' in lines
+
+# Only numeric stats become gauges, one TYPE line per name; a failing source is skipped.
+assert lines.count("# TYPE test_pool_queued gauge") == 1
+assert 'test_pool_queued{pool="query"} 3' in lines and 'test_pool_queued{pool="risk"} 1' in lines
+assert 'test_pool_hit_rate{pool="query"} 0.25' in lines
+assert 'test_pool_enabled{pool="query"} 1' in lines
+assert not any(line.startswith(("test_pool_mode", "test_pool_latency", "test_broken")) for line in lines)
+
+# Registering the same name twice returns the same metric.
+assert registry.histogram("test_seconds", "Test latency", ("stage",)) is latency
+
+started = time.perf_counter()
+for _ in range(100000):
+    latency.observe(0.05, "nonce")
+print(f"observe: {(time.perf_counter() - started) * 10:.2f} us")
+
+print("All operations completed successfully!")
@@ -0,0 +1,50 @@
+import sys
+import os
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from src.yields import YieldSnapshot
+from src.planner import RebalancePlanner
+
+usdc = "0x94F0Fd09f425Be15C7Bc0575Aa71780A044039e3"
+weth = "0x3455b6B22cBD998512286428De8844CBFBcc06C2"
+snapshot = YieldSnapshot([
+    {"addressStaking": "0xa976c4930e253CE56Ff129404a95F0578345C113", "apy": "4.0", "addressToken": usdc, "stablecoin": True},
+    {"addressStaking": "0xd39ef51d10FAeE75FE6fe66537F3D8128Ec72dA5", "apy": "4.2", "addressToken": usdc, "stablecoin": True},
+    {"addressStaking": "0xF50c64a2C422C6809e5BdbcF4Bb5af38D06a033a", "apy": "9.0", "addressToken": weth, "stablecoin": False},
+])
+planner = RebalancePlanner(snapshot, min_improvement=0.5)
+
+users = ["low", "high", "unknown"]
+staked = {
+    "low": [{"protocol": "0xa976c4930e253CE56Ff129404a95F0578345C113", "amount": 10.5}],
+    "high": [
+        {"protocol": "0xa976c4930e253CE56Ff129404a95F0578345C113", "amount": 3.0},
+        {"protocol": "0xd39ef51d10FAeE75FE6fe66537F3D8128Ec72dA5", "amount": 0.5},
+    ],
+    "unknown": [{"protocol": "0xa976c4930e253CE56Ff129404a95F0578345C113", "amount": 8.0}],
+}
+plan = planner.plan(users, ["low", "high", None], planner.position_matrix(users, staked))
+print(plan.by_user())
+
+# 0.2 points is below the threshold, dust is left alone and unknown risk profiles are skipped.
+assert plan.moves_for(0) == []
+assert plan.moves_for(2) == []
+moves = plan.moves_for(1)
+assert len(moves) == 1
+assert moves[0]["to_protocol"] == "0xF50c64a2C422C6809e5BdbcF4Bb5af38D06a033a"
+assert moves[0]["amount"] == 3 and moves[0]["swap"]
+
+count = 100_000
+rng = np.random.default_rng(0)
+positions = rng.integers(0, 100, size=(count, 3)).astype(np.float64)
+risks = rng.choice(["low", "medium", "high"], size=count).tolist()
+addresses = [f"user-{i}" for i in range(count)]
+started = time.perf_counter()
+plan = planner.plan(addresses, risks, positions)
+elapsed = time.perf_counter() - started
+print(f"{len(plan)} moves for {count} users in {elapsed * 1000:.1f} ms")
+assert elapsed < 1
+
+print("All operations completed successfully!")
@@ -0,0 +1,124 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Runs the watcher against a stand-in chain, so no node is needed.
+import asyncio
+from eth_account import Account
+from eth_account.typed_transactions import TypedTransaction
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.exceptions import TransactionNotFound, TimeExhausted
+from src.receipts import ReceiptWatcher
+
+
+class FakeEth:
+    def __init__(self):
+        self.head = 10
+        self.mined = {}
+        self.sent = []
+
+    @property
+    def block_number(self):
+        async def head():
+            return self.head
+        return head()
+
+    async def get_transaction_receipt(self, tx_hash):
+        if tx_hash not in self.mined:
+            raise TransactionNotFound(tx_hash)
+        return {"transactionHash": HexBytes(tx_hash), "blockNumber": self.mined[tx_hash], "gasUsed": 50_000, "status": 1}
+
+    async def send_raw_transaction(self, raw):
+        self.sent.append(raw)
+        return Web3.keccak(raw)
+
+
+class FakeProvider:
+    async def make_batch_request(self, requests):
+        raise NotImplementedError
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth()
+        self.provider = FakeProvider()
+
+
+class FakeFees:
+    def __init__(self):
+        self.observed = []
+
+    def observe(self, transaction, gas_used):
+        self.observed.append((transaction["nonce"], gas_used))
+
+
+account = Account.create()
+transaction = {
+    "chainId": 3441006, "nonce": 4, "to": "0x0b561A287588675AccE2f190FFa2AdCb30145e01", "value": 0, "data": "0x",
+    "gas": 21000, "maxFeePerGas": 1000, "maxPriorityFeePerGas": 100,
+}
+A = "0x" + "aa" * 32
+B = "0x" + "bb" * 32
+C = "0x" + "cc" * 32
+
+
+async def advance(w3, blocks=1):
+    for _ in range(blocks):
+        w3.eth.head += 1
+        await asyncio.sleep(0.03)
+
+
+async def main():
+    w3 = FakeWeb3()
+    fees = FakeFees()
+    watcher = ReceiptWatcher(w3, confirmations=2, interval=0.01, stuck_blocks=3, fee_bump=1.5, max_bumps=2, fees=fees)
+
+    # A receipt resolves the wait only once it is `confirmations` blocks deep.
+    watcher.track(A, transaction, account.key)
+    waiter = asyncio.create_task(watcher.wait(A, 5))
+    await asyncio.sleep(0.03)
+    w3.eth.mined[A] = 11
+    await advance(w3)
+    assert not waiter.done()
+    await advance(w3)
+    receipt = await asyncio.wait_for(waiter, 1)
+    assert receipt["blockNumber"] == 11 and fees.observed == [(4, 50_000)]
+    assert watcher.stats()["pending"] == 0 and watcher.confirmed == 1
+
+    # A transaction still pending after stuck_blocks is re-sent on its nonce with higher fees,
+    # and the wait resolves with the receipt of the replacement.
+    watcher.track(B, transaction, account.key)
+    waiter = asyncio.create_task(watcher.wait(B, 5))
+    await asyncio.sleep(0.03)
+    await advance(w3, 3)
+    assert len(w3.eth.sent) == 1 and watcher.replaced == 1
+    bumped = TypedTransaction.from_bytes(HexBytes(w3.eth.sent[0])).as_dict()
+    assert bumped["nonce"] == 4 and bumped["maxFeePerGas"] == 1501 and bumped["maxPriorityFeePerGas"] == 151
+    replacement = Web3.keccak(w3.eth.sent[0]).to_0x_hex()
+    w3.eth.mined[replacement] = w3.eth.head
+    await advance(w3, 2)
+    receipt = await asyncio.wait_for(waiter, 1)
+    assert receipt["transactionHash"].to_0x_hex() == replacement
+    assert watcher.stats()["pending"] == 0
+
+    # Nobody waits on C: it is never bumped and is forgotten after stuck_blocks.
+    watcher.track(C, transaction, account.key)
+    await asyncio.sleep(0.03)
+    await advance(w3, 4)
+    assert len(w3.eth.sent) == 1 and watcher.expired == 1
+    assert watcher.stats()["pending"] == 0
+
+    # A wait that times out lets go of its entry.
+    try:
+        await watcher.wait(C, 0.05)
+        raise AssertionError("wait returned without a receipt")
+    except TimeExhausted:
+        pass
+    assert watcher.stats()["pending"] == 0
+    await watcher.stop()
+
+
+asyncio.run(main())
+
+print("All operations completed successfully!")
@@ -0,0 +1,58 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Ranks a handful of made-up pools, so neither the knowledge API nor the LLM is needed.
+import orjson
+from src.router import QueryRouter
+
+pools = [
+    {"idProtocol": "usdc-manta", "chain": "Manta", "nameToken": "USDC", "apy": 8.0, "tvl": 1_000_000, "stablecoin": True},
+    {"idProtocol": "usdt-manta", "chain": "Manta", "nameToken": "USDT", "apy": 6.0, "tvl": 9_000_000, "stablecoin": True},
+    {"idProtocol": "weth-manta", "chain": "Manta", "nameToken": "WETH", "apy": 4.0, "tvl": 5_000_000, "stablecoin": False},
+    {"idProtocol": "usdc-base", "chain": "Base", "nameToken": "USDC", "apy": 20.0, "tvl": 2_000_000, "stablecoin": True},
+    {"idProtocol": "uni-base", "chain": "Base", "nameToken": "UNI", "apy": 12.0, "tvl": 500_000, "stablecoin": False},
+    {"idProtocol": "broken", "chain": "Base", "nameToken": "DAI", "apy": None, "tvl": None, "stablecoin": True},
+]
+
+router = QueryRouter()
+assert router.route("What is the best APY?") is None
+router.update(pools)
+
+
+def answer(query):
+    result = router.route(query)
+    return orjson.loads(result)["id_project"] if result is not None else None
+
+
+# Ranking questions are answered from the index.
+assert answer("What is the best APY?") == "usdc-base"
+assert answer("Which pool has the highest APY on Manta?") == "usdc-manta"
+assert answer("Best APY stablecoin on Manta") == "usdc-manta"
+assert answer("Highest TVL pool for token WETH") == "weth-manta"
+assert answer("Which pool has the lowest TVL on the Base chain?") == "uni-base"
+assert answer("best pool by TVL") == "usdt-manta"
+assert answer("top stablecoin yield or UNI on Base") == "usdc-base"
+assert answer("Which pool has the highest APY in the knowledge base?") == "usdc-base"
+
+# Everything else falls through to the LLM.
+for query in [
+    "What is the best APY excluding stablecoins?",
+    "best APY not on Base chain",
+    "Highest APY for non-stablecoin pools",
+    "best yield without USDC",
+    "What is the minimum amount I need to earn yield?",
+    "Explain why the highest APY pools are risky",
+    "How is the highest APY calculated?",
+    "Which pool is the most secure, ignoring APY?",
+    "Which pool is the most secure?",
+    "What is the highest APY and the TVL of that pool?",
+    "Best APY on Manta or on Base?",
+    "What are stablecoins?",
+]:
+    assert answer(query) is None, query
+
+print(router.stats())
+assert router.stats()["hits"] == 8
+
+print("All operations completed successfully!")
@@ -0,0 +1,134 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Runs against local stub JSON-RPC servers, so no node is needed.
+import time
+import asyncio
+import threading
+import orjson
+import aiohttp
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from web3 import Web3, AsyncWeb3
+from src.rpc import RpcPool, PooledProvider, AsyncPooledProvider, TokenBucket
+
+
+def stub(block_number, delay=0.0, status=200, error=None):
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = orjson.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            calls.append(body)
+            time.sleep(delay)
+            answer = lambda request: (
+                {"jsonrpc": "2.0", "id": request["id"], "error": error} if error
+                else {"jsonrpc": "2.0", "id": request["id"], "result": hex(block_number)}
+            )
+            payload = orjson.dumps([answer(item) for item in body] if isinstance(body, list) else answer(body))
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", calls
+
+
+healthy, healthy_calls = stub(100)
+slow, slow_calls = stub(200, delay=1.0)
+throttled, throttled_calls = stub(300, error={"code": -32005, "message": "rate limit exceeded"})
+fast, fast_calls = stub(400)
+down = "http://127.0.0.1:1"
+
+# A dead endpoint fails over to the next one and is benched after failure_threshold errors.
+pool = RpcPool([down, healthy], hedge_delay=0, failure_threshold=2, cooldown=60)
+w3 = Web3(PooledProvider(pool))
+for _ in range(3):
+    assert w3.eth.block_number == 100
+print(pool.stats())
+assert pool.stats()[0]["errors"] == 2 and not pool.stats()[0]["healthy"]
+assert pool.stats()[1]["requests"] == 3
+
+# Throttling answers count as failures too.
+pool = RpcPool([throttled, healthy], hedge_delay=0)
+assert Web3(PooledProvider(pool)).eth.block_number == 100
+assert len(throttled_calls) == 1 and pool.stats()[0]["errors"] == 1
+
+# A slow read is hedged to the second endpoint and the first answer wins.
+pool = RpcPool([slow, healthy], hedge_delay=0.1)
+pool.endpoints[1].latency = 5.0
+started = time.monotonic()
+assert Web3(PooledProvider(pool)).eth.block_number == 100
+assert time.monotonic() - started < 0.9
+assert pool.stats()[1]["hedged"] == 1
+
+# Writes are never hedged.
+count = len(slow_calls)
+assert Web3(PooledProvider(RpcPool([slow, healthy], hedge_delay=0.1))).provider.make_request("eth_sendRawTransaction", ["0x"])["result"] == hex(200)
+assert len(slow_calls) == count + 1
+
+# JSON-RPC batches go through the pool.
+w3 = Web3(PooledProvider(RpcPool([down, healthy], hedge_delay=0)))
+with w3.batch_requests() as batch:
+    batch.add(w3.eth.get_block_number())
+    batch.add(w3.eth.get_block_number())
+    assert batch.execute() == [100, 100]
+assert isinstance(healthy_calls[-1], list) and len(healthy_calls[-1]) == 2
+
+# Sends and pending nonce reads stay on the first endpoint even when another one scores better.
+pool = RpcPool([healthy, fast], hedge_delay=0.1)
+pool.endpoints[0].latency = 5.0
+w3 = Web3(PooledProvider(pool))
+account = "0x82273B356C8c882371a4CbD276f666D8efb6745F"
+assert w3.eth.block_number == 400
+assert w3.eth.get_transaction_count(account) == 400
+count = len(healthy_calls)
+assert w3.eth.get_transaction_count(account, "pending") == 100
+assert w3.provider.make_request("eth_sendRawTransaction", ["0x"])["result"] == hex(100)
+assert len(healthy_calls) == count + 2 and pool.stats()[1]["hedged"] == 0
+
+# The token bucket spaces requests once the burst is spent; every caller reserves its own slot.
+bucket = TokenBucket(rate=10, burst=2)
+assert bucket.take() == 0 and bucket.take() == 0
+assert 0 < bucket.take() <= 0.1
+assert 0.1 < bucket.take() <= 0.2
+assert not bucket.try_take() and 0.2 < bucket.wait_time() <= 0.3
+assert TokenBucket(rate=0, burst=1).take() == 0
+
+# Endpoints without a free token are not charged while the pool looks for one.
+pool = RpcPool([healthy, fast], rate_limit=10, burst=1, hedge_delay=0)
+assert pool.pick() == (pool.endpoints[0], 0) and pool.pick() == (pool.endpoints[1], 0)
+endpoint, delay = pool.pick()
+assert 0 < delay <= 0.1
+assert [endpoint.bucket.tokens < 0 for endpoint in pool.endpoints].count(True) == 1
+
+
+async def main(session):
+    pool = RpcPool([down, healthy], hedge_delay=0)
+    provider = AsyncPooledProvider(pool)
+    await provider.cache_async_session(session)
+    assert await AsyncWeb3(provider).eth.block_number == 100
+    assert pool.stats()[0]["errors"] == 1
+
+    pool = RpcPool([slow, healthy], hedge_delay=0.1)
+    pool.endpoints[1].latency = 5.0
+    provider = AsyncPooledProvider(pool)
+    await provider.cache_async_session(session)
+    started = time.monotonic()
+    assert await AsyncWeb3(provider).eth.block_number == 100
+    assert time.monotonic() - started < 0.9
+    assert pool.stats()[1]["hedged"] == 1
+
+async def run():
+    async with aiohttp.ClientSession() as session:
+        await main(session)
+
+asyncio.run(run())
+
+print("All operations completed successfully!")
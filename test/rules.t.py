@@ -0,0 +1,180 @@
+import sys
+import os
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Runs rebalance against a stand-in JSON-RPC provider, so no node is needed.
+from eth_abi import encode
+from eth_account import Account
+from eth_account.typed_transactions import TypedTransaction
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.providers import BaseProvider
+from src.rules import AgentWalletSync, ROUTER_ADDRESS, SWAP_SPENDER
+from src.store import MemoryWalletStore
+from src.fees import FeeOracle
+from src.approvals import ApprovalManager, MAX_UINT256
+from src.simulation import TransactionSimulator, InsufficientAllowance
+
+
+def selector(signature):
+    return Web3.keccak(text=signature)[:4].to_0x_hex()
+
+
+class FakeProvider(BaseProvider):
+    """Answers the calls rebalance makes; a simulated step can be made to revert, a mined one to fail."""
+
+    def __init__(self):
+        super().__init__()
+        self.methods = []
+        self.raw = []
+        self.sent = []
+        self.revert_step = None
+        self.failed_step = None
+        self.lock = threading.Lock()
+
+    def make_request(self, method, params):
+        self.methods.append(method)
+        match method:
+            case "eth_chainId":
+                result = hex(3441006)
+            case "eth_call" if params[0]["data"].startswith(selector("eip712Domain()")):
+                result = "0x" + encode(
+                    ["bytes1", "string", "string", "uint256", "address", "bytes32", "uint256[]"],
+                    [b"\x0f", "Mock", "1", 3441006, params[0]["to"], b"\x00" * 32, []],
+                ).hex()
+            case "eth_call":
+                # allowance(owner, spender) and nonces(owner): nothing approved or permitted yet.
+                result = "0x" + encode(["uint256"], [0]).hex()
+            case "eth_estimateGas":
+                result = hex(60_000)
+            case "eth_simulateV1":
+                calls = params[0]["blockStateCalls"][0]["calls"]
+                result = [{"calls": [self._simulated(index) for index in range(len(calls))]}]
+            case "eth_getBlockByNumber":
+                result = {"number": "0x64", "baseFeePerGas": "0x64"}
+            case "eth_maxPriorityFeePerGas":
+                result = "0xa"
+            case "eth_getTransactionCount":
+                assert params[1] == "pending"
+                result = "0x7"
+            case "eth_sendRawTransaction":
+                with self.lock:
+                    self.raw.append(params[0])
+                self.sent.append(TypedTransaction.from_bytes(HexBytes(params[0])).as_dict())
+                result = Web3.keccak(hexstr=params[0]).to_0x_hex()
+            case "eth_getTransactionReceipt":
+                index = self.hashes().index(params[0])
+                result = {
+                    "transactionHash": params[0], "blockNumber": "0x65", "gasUsed": "0xc350",
+                    "status": "0x0" if index == self.failed_step else "0x1",
+                }
+            case _:
+                raise AssertionError(f"unexpected {method}")
+        return {"jsonrpc": "2.0", "id": 1, "result": result}
+
+    def _simulated(self, index):
+        if index == self.revert_step:
+            data = selector("ERC20InsufficientAllowance(address,uint256,uint256)") + encode(
+                ["address", "uint256", "uint256"], [SWAP_SPENDER, 0, 1_000_000]
+            ).hex()
+            return {"status": "0x0", "gasUsed": "0x0", "returnData": data}
+        return {"status": "0x1", "gasUsed": hex(40_000 + index), "returnData": "0x"}
+
+    def hashes(self):
+        return [Web3.keccak(hexstr=raw).to_0x_hex() for raw in self.raw]
+
+    def is_connected(self, show_traceback=False):
+        return True
+
+
+def fresh(provider):
+    wallet = AgentWalletSync(w3=Web3(provider))
+    wallet.store = MemoryWalletStore()
+    wallet.store.insert(user, private_key)
+    wallet.fees = FeeOracle(margin=1.5)
+    wallet.approvals = ApprovalManager(mode="exact")
+    wallet.simulator = TransactionSimulator(enabled=True)
+    return wallet
+
+
+account = Account.create()
+private_key = account.key.to_0x_hex()
+user = "user-1"
+move = {"amount": 1, "from_protocol": "uniswap", "to_protocol": "compoundv3", "from_token": "usdc", "to_token": "uni", "swap": True}
+usdc = "0x94F0Fd09f425Be15C7Bc0575Aa71780A044039e3"
+uni = "0x6c8D1fd3AA9F436CBA20E4b6A5aeDb1bf814A732"
+uniswap = "0xa976c4930e253CE56Ff129404a95F0578345C113"
+compound = "0xd39ef51d10FAeE75FE6fe66537F3D8128Ec72dA5"
+
+# The batch is unstake -> approve -> swap -> approve -> stake on consecutive pending nonces,
+# all broadcast before the first receipt is awaited.
+provider = FakeProvider()
+wallet = fresh(provider)
+tx_hashes = wallet.rebalance(user, move)
+print(tx_hashes)
+assert [Web3.to_checksum_address(tx["to"]) for tx in provider.sent] == [uniswap, usdc, ROUTER_ADDRESS, uni, compound]
+assert [Web3.to_hex(tx["data"])[:10] for tx in provider.sent] == [
+    selector("withdrawAll()"),
+    selector("approve(address,uint256)"),
+    selector("swap(address,address,uint256)"),
+    selector("approve(address,uint256)"),
+    selector("stake(uint256,uint256)"),
+]
+assert [tx["nonce"] for tx in provider.sent] == [7, 8, 9, 10, 11]
+assert [tx["gas"] for tx in provider.sent] == [int((40_000 + index) * 1.5) for index in range(5)]
+assert provider.methods.count("eth_getTransactionCount") == 1
+sends = [index for index, method in enumerate(provider.methods) if method == "eth_sendRawTransaction"]
+receipts = [index for index, method in enumerate(provider.methods) if method == "eth_getTransactionReceipt"]
+assert len(sends) == 5 and max(sends) < min(receipts)
+assert tx_hashes == provider.hashes()
+# Exact approvals, recorded once mined and then spent by the swap and the stake.
+sender = account.address
+assert wallet.approvals.allowance_sync(wallet.w3, usdc, sender, SWAP_SPENDER) == 0
+assert wallet.approvals.stats()["hits"] == 1
+
+# A step that fails simulation aborts the batch before anything is signed or sent.
+provider = FakeProvider()
+provider.revert_step = 2
+wallet = fresh(provider)
+try:
+    wallet.rebalance(user, move)
+    raise AssertionError("rebalance sent a batch that failed simulation")
+except InsufficientAllowance as e:
+    assert e.function == "swap"
+assert provider.sent == [] and "eth_getTransactionCount" not in provider.methods
+assert wallet.approvals.stats()["entries"] == 0
+
+# A step that reverts on chain stops the move and drops the cached allowances.
+provider = FakeProvider()
+provider.failed_step = 2
+wallet = fresh(provider)
+try:
+    wallet.rebalance(user, move)
+    raise AssertionError("rebalance ignored a reverted step")
+except RuntimeError as e:
+    assert "swap reverted" in str(e)
+assert len(provider.sent) == 5 and provider.methods.count("eth_getTransactionReceipt") == 3
+assert wallet.approvals.stats()["entries"] == 0
+
+# Permits from concurrent runner threads share the admin key: each gets its own nonce.
+admin = Account.create()
+provider = FakeProvider()
+wallet = fresh(provider)
+wallet.admin_private_key = admin.key.to_0x_hex()
+wallet.approvals = ApprovalManager(mode="permit")
+tokens = [usdc, uni, "0x3455b6B22cBD998512286428De8844CBFBcc06C2", "0x7598099fFC36dCC3e96F3aB33f18E86F85ae7E44"]
+threads = [
+    threading.Thread(target=wallet._ensure_allowance, args=(private_key, sender, compound, token, 1_000_000))
+    for token in tokens
+]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+assert sorted(tx["nonce"] for tx in provider.sent) == [7, 8, 9, 10]
+assert provider.methods.count("eth_getTransactionCount") == 1
+assert all(Account.recover_transaction(raw) == admin.address for raw in provider.raw)
+assert all(wallet.approvals.allowance_sync(wallet.w3, token, sender, compound) == MAX_UINT256 for token in tokens)
+
+print("All operations completed successfully!")
@@ -0,0 +1,76 @@
+import sys
+import os
+import tempfile
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Planning and execution are replaced, so no node or backend is needed.
+from src.runner import RebalanceRunner, Checkpoint, pending_cycle
+
+users = [f"0x{index:040x}" for index in range(1, 9)]
+
+
+class Killed(BaseException):
+    """Stands in for the process dying: not an Exception, so the runner does not record it."""
+
+
+class FakeRunner(RebalanceRunner):
+    def __init__(self, checkpoint_path, outcomes):
+        super().__init__(workers=1, checkpoint_path=checkpoint_path, cycle="2026-01-01")
+        self.outcomes = outcomes
+        self.calls = []
+        self.lock = threading.Lock()
+        self.execute = self._execute
+
+    def plan(self, addresses):
+        return [[{"to_protocol": "uniswap"}] for _ in addresses]
+
+    def _execute(self, address, moves, agent):
+        with self.lock:
+            self.calls.append(address)
+        outcome = self.outcomes.get(address)
+        if outcome == "kill":
+            raise Killed()
+        if outcome == "fail":
+            return ["stake reverted"]
+        if outcome == "raise":
+            raise RuntimeError("RPC timeout")
+        return []
+
+
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, "checkpoint.jsonl")
+
+    # First run: users[1] fails, users[2] raises, and the process dies at users[5].
+    runner = FakeRunner(path, {users[1]: "fail", users[2]: "raise", users[5]: "kill"})
+    try:
+        runner.run(users)
+        raise AssertionError("the run should have been killed")
+    except Killed:
+        pass
+    assert runner.calls[:6] == users[:6]
+    assert pending_cycle(path) == "2026-01-01"
+
+    checkpoint = Checkpoint(path, "2026-01-01").open()
+    checkpoint.close()
+    assert checkpoint.done == {users[0], users[3], users[4]}
+    assert checkpoint.failures == {users[1]: 1, users[2]: 1}
+
+    # Resume: finished users are skipped, failed and unreached ones are (re)tried; users[1] still fails.
+    runner = FakeRunner(path, {users[1]: "fail"})
+    summary = runner.run(users)
+    print(summary)
+    assert sorted(runner.calls) == sorted([users[1], users[2], *users[5:]])
+    assert summary["skipped"] == 3 and summary["failed"] == 1
+    assert pending_cycle(path) == "2026-01-01"
+
+    # A user that keeps failing is given up after max_attempts and the cycle closes.
+    runner = FakeRunner(path, {users[1]: "fail"})
+    runner.run(users)
+    assert runner.calls == [users[1]]
+    assert pending_cycle(path) is None
+
+    runner = FakeRunner(path, {})
+    assert runner.run(users)["processed"] == len(users)
+
+print("All operations completed successfully!")
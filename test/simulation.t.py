@@ -0,0 +1,44 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Decodes recorded revert data, so no node is needed.
+from eth_abi import encode
+from web3 import Web3
+from web3.exceptions import ContractCustomError
+from src.simulation import (
+    RevertDecoder, TransactionRejected, InsufficientBalance, InsufficientAllowance, ContractPaused, revert_data
+)
+
+
+def selector(signature):
+    return Web3.keccak(text=signature)[:4].to_0x_hex()
+
+
+owner = "0x82273B356C8c882371a4CbD276f666D8efb6745F"
+decoder = RevertDecoder()
+
+balance = selector("ERC20InsufficientBalance(address,uint256,uint256)") + encode(["address", "uint256", "uint256"], [owner, 1, 5]).hex()
+error = decoder.decode(balance, "swap")
+print(error)
+assert isinstance(error, InsufficientBalance) and error.status_code == 400
+assert error.details == {"sender": owner.lower(), "balance": 1, "needed": 5}
+
+allowance = selector("ERC20InsufficientAllowance(address,uint256,uint256)") + encode(["address", "uint256", "uint256"], [owner, 0, 5]).hex()
+assert isinstance(decoder.decode(allowance, "stake"), InsufficientAllowance)
+
+paused = decoder.decode(selector("EnforcedPause()"), "swap")
+assert isinstance(paused, ContractPaused) and paused.status_code == 409
+
+reason = decoder.decode("0x08c379a0" + encode(["string"], ["Amount must be greater than 0"]).hex(), "stake")
+assert type(reason) is TransactionRejected and "Amount must be greater than 0" in str(reason)
+
+unknown = decoder.decode("0xdeadbeef", "stake")
+assert type(unknown) is TransactionRejected and unknown.error == "revert"
+
+# Node errors carry the data in different places.
+assert revert_data(ContractCustomError(balance, data=balance)) == balance
+assert revert_data(ValueError({"code": 3, "message": "execution reverted", "data": allowance})) == allowance
+assert revert_data(ValueError("connection reset")) is None
+
+print("All operations completed successfully!")
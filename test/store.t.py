@@ -0,0 +1,35 @@
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Two stores on one database file stand in for the API and the scheduler processes.
+from src.store import SqliteWalletStore
+
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, "wallet.db")
+    api = SqliteWalletStore(db_path=path, json_path=None)
+    scheduler = SqliteWalletStore(db_path=path, json_path=None)
+
+    assert api.insert("user-1", "0x01") and not api.insert("user-1", "0x02")
+    assert api.set_risk_profile("user-1", "low")
+    assert scheduler.get_risk("user-1") == "low"
+
+    # An update committed by the other instance is seen on the next read, not the cached entry.
+    assert api.set_risk_profile("user-1", "high")
+    assert api.get_risk("user-1") == "high"
+    assert scheduler.get_risk("user-1") == "high"
+
+    assert scheduler.insert("user-2", "0x02")
+    assert api.fetch_data("user-2") == "0x02"
+    assert api.addresses() == ["user-1", "user-2"]
+    assert api.get("user-3") is None and not api.set_risk_profile("user-3", "low")
+
+    # A reopened store starts from what is on disk.
+    api.close()
+    reopened = SqliteWalletStore(db_path=path, json_path=None)
+    assert reopened.get("user-1") == {"user_address": "user-1", "data": "0x01", "risk_profile": "high"}
+    reopened.close()
+    scheduler.close()
+
+print("All operations completed successfully!")